@@ -0,0 +1,298 @@
+import asyncio
+import itertools
+import math
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sharedstate import MemoryState
+
+# Priorities, lower is served first
+INTERACTIVE = 0
+BATCH = 1
+
+# How often a queued request checks whether its client has gone away
+QUEUE_POLL_INTERVAL = 0.5
+# Weight of the newest build duration in the Retry-After estimate
+DURATION_ALPHA = 0.2
+# Build slots are leases in the shared state, so the limits hold across
+# workers. Running builds renew theirs; a crashed worker's expire after this.
+SLOT_TTL = 30.0
+
+
+class AdmissionRejected(Exception):
+    """Raised when a build is not admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client: str, priority: int, seq: int):
+        self.client = client
+        self.priority = priority
+        self.seq = seq
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """Caps how many gallery builds run at once, across all workers.
+
+    A build needs a free slot globally (``max_builds``) and for its client
+    (``max_builds_per_client``). Slots are leases in the shared ``state``,
+    so every worker counts against the same limits. Batch requests may only
+    use the slots not reserved for interactive ones (``interactive_reserve``),
+    and a worker always admits its queued interactive requests first.
+    Requests that cannot start immediately wait in a bounded queue
+    (``max_queue``, per worker) for at most ``max_wait`` seconds. Beyond that
+    they are rejected with a Retry-After estimate instead of piling up.
+    Optionally, ``client_rate`` limits how many builds per minute each
+    client may start, also counted in the shared state.
+    """
+
+    def __init__(
+        self,
+        max_builds: int = 8,
+        max_builds_per_client: int = 2,
+        max_queue: int = 32,
+        max_wait: float = 30.0,
+        interactive_reserve: int = 2,
+        client_rate: float | None = None,
+        state=None,
+    ):
+        self.max_builds = max_builds
+        self.max_builds_per_client = max_builds_per_client
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.interactive_reserve = min(interactive_reserve, max_builds - 1)
+        self.client_rate = client_rate
+        self.state = state if state is not None else MemoryState()
+        # Builds admitted by this worker, for stats
+        self._active: Counter = Counter()
+        self._active_by_priority: Counter = Counter()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._dispatching = asyncio.Lock()
+        # Slot releases running in the background
+        self._freeing: set = set()
+        self._build_seconds: float | None = None
+        self.admitted = 0
+        self.rejected: Counter = Counter()
+        self._wait_seconds = 0.0
+
+    @property
+    def active(self) -> int:
+        return sum(self._active_by_priority.values())
+
+    async def _state(self, method: Callable, *args):
+        if self.state.shared:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def _slots(self, client: str, priority: int) -> Tuple[List[str], List[str]]:
+        """The lease names of the client's slots and of the build slots a
+        ``priority`` request may take, in the order to try them."""
+        client_slots = [
+            f"admission:client:{client}:{i}" for i in range(self.max_builds_per_client)
+        ]
+        if priority == INTERACTIVE:
+            # Reserved slots (the highest) first, keeping the others for batch
+            build_slots = range(self.max_builds - 1, -1, -1)
+        else:
+            build_slots = range(self.max_builds - self.interactive_reserve)
+        return client_slots, [f"admission:slot:{i}" for i in build_slots]
+
+    def _lease_any(self, names: List[str], holder: str) -> Optional[str]:
+        for name in names:
+            if self.state.acquire(name, holder, SLOT_TTL) is None:
+                return name
+        return None
+
+    def _take_slots(
+        self, client: str, priority: int, holder: str
+    ) -> Tuple[List[str], Optional[str]]:
+        """Lease a client slot and a build slot: (their names, None), or
+        ([], what is full: "client" or "builds")."""
+        client_slots, build_slots = self._slots(client, priority)
+        client_slot = self._lease_any(client_slots, holder)
+        if client_slot is None:
+            return [], "client"
+        build_slot = self._lease_any(build_slots, holder)
+        if build_slot is None:
+            self.state.release(client_slot, holder)
+            return [], "builds"
+        return [client_slot, build_slot], None
+
+    def _release_slots(self, slots: List[str], holder: str) -> None:
+        for slot in slots:
+            self.state.release(slot, holder)
+
+    async def _renew(self, slots: List[str], holder: str) -> None:
+        while True:
+            await asyncio.sleep(SLOT_TTL / 3)
+            for slot in slots:
+                await self._state(self.state.renew, slot, holder, SLOT_TTL)
+
+    def _retry_after(self) -> int:
+        per_build = self._build_seconds or 10.0
+        backlog = len(self._waiters) / max(self.max_builds, 1) + 1
+        return max(1, math.ceil(per_build * backlog))
+
+    def _reject(self, reason: str, retry_after: int | None = None) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(reason, retry_after or self._retry_after())
+
+    async def _try_grant(
+        self, client: str, priority: int
+    ) -> Tuple[Optional[Callable[[], None]], Optional[str]]:
+        """Take the slots for a build: (its release function, None), or
+        (None, what is full)."""
+        holder = uuid.uuid4().hex
+        slots, full = await self._state(self._take_slots, client, priority, holder)
+        if full:
+            return None, full
+        self._active[client] += 1
+        self._active_by_priority[priority] += 1
+        self.admitted += 1
+        started = time.monotonic()
+        renewing = asyncio.get_running_loop().create_task(self._renew(slots, holder))
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            renewing.cancel()
+            self._active[client] -= 1
+            if not self._active[client]:
+                del self._active[client]
+            self._active_by_priority[priority] -= 1
+            duration = time.monotonic() - started
+            self._build_seconds = (
+                duration
+                if self._build_seconds is None
+                else DURATION_ALPHA * duration + (1 - DURATION_ALPHA) * self._build_seconds
+            )
+            freeing = asyncio.get_running_loop().create_task(self._free(slots, holder))
+            self._freeing.add(freeing)
+            freeing.add_done_callback(self._freeing.discard)
+
+        return release, None
+
+    async def _free(self, slots: List[str], holder: str) -> None:
+        await self._state(self._release_slots, slots, holder)
+        await self._dispatch()
+
+    async def _dispatch(self) -> None:
+        """Admit queued requests in priority order, skipping those whose client
+        is at its cap (so one busy client doesn't block everyone behind it).
+
+        Runs whenever a local build finishes and, since slots also free up
+        in other workers, periodically while requests are queued.
+        """
+        if self._dispatching.locked():
+            return
+        async with self._dispatching:
+            for waiter in sorted(self._waiters, key=lambda w: (w.priority, w.seq)):
+                if waiter.granted.done():
+                    continue
+                release, full = await self._try_grant(waiter.client, waiter.priority)
+                if release is None:
+                    if full == "builds" and waiter.priority == INTERACTIVE:
+                        # Nothing later in the queue can fit either
+                        return
+                    continue
+                if waiter.granted.done():
+                    # Gave up while the slots were being taken
+                    release()
+                    continue
+                self._waiters.remove(waiter)
+                waiter.granted.set_result(release)
+
+    async def acquire(
+        self,
+        client: str,
+        priority: int = INTERACTIVE,
+        is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+    ) -> Callable[[], None]:
+        """Wait for a build slot and return the function that releases it.
+
+        Raises ``AdmissionRejected`` if the client is over its rate, the
+        queue is full, the wait exceeds ``max_wait`` or the client leaves.
+        """
+        if self.client_rate:
+            wait = await self._state(
+                self.state.take,
+                f"admission:{client}",
+                self.client_rate / 60,
+                max(self.client_rate / 60 * self.max_wait, 1),
+            )
+            if wait:
+                raise self._reject("rate", math.ceil(wait))
+
+        # A request doesn't jump ahead of those queued in this worker with
+        # the same or a higher priority
+        if not any(w.priority <= priority for w in self._waiters):
+            release, _ = await self._try_grant(client, priority)
+            if release is not None:
+                return release
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        waiter = _Waiter(client, priority, next(self._seq))
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            while True:
+                remaining = self.max_wait - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise self._reject("timeout")
+                done, _ = await asyncio.wait(
+                    {waiter.granted}, timeout=min(QUEUE_POLL_INTERVAL, remaining)
+                )
+                if done:
+                    self._wait_seconds += time.monotonic() - started
+                    return waiter.granted.result()
+                if is_disconnected is not None and await is_disconnected():
+                    raise self._reject("disconnected")
+                await self._dispatch()
+        except BaseException:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if waiter.granted.done() and not waiter.granted.cancelled():
+                # Admitted just as we gave up: hand the slot on
+                waiter.granted.result()()
+            else:
+                waiter.granted.cancel()
+            raise
+
+    def stats(self) -> Dict:
+        queued = Counter(w.priority for w in self._waiters)
+        return {
+            "active": self.active,
+            "active_by_priority": {
+                "interactive": self._active_by_priority[INTERACTIVE],
+                "batch": self._active_by_priority[BATCH],
+            },
+            "queue_depth": len(self._waiters),
+            "queued_by_priority": {
+                "interactive": queued[INTERACTIVE],
+                "batch": queued[BATCH],
+            },
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "mean_queue_wait": self._wait_seconds / self.admitted if self.admitted else 0.0,
+            "build_seconds": self._build_seconds,
+            "limits": {
+                "max_builds": self.max_builds,
+                "max_builds_per_client": self.max_builds_per_client,
+                "max_queue": self.max_queue,
+                "max_wait": self.max_wait,
+                "interactive_reserve": self.interactive_reserve,
+                "client_rate": self.client_rate,
+            },
+        }
@@ -0,0 +1,239 @@
+import gzip
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import codec
+import designhistory
+from blobstore import blobs, parse_blob_ref
+from objectstore import ObjectStore, objects
+from sharedstate import shared_state
+
+# Where each kind of record keeps its steps in the database
+STEPS = {"sessions": "generations", "ablations": "history"}
+# Local blob files dropped along with an archived step: the originals are in
+# the object store and the variants can be rebuilt. The small variants stay
+# for the overview and the history figure.
+ARCHIVED_BLOB_FILES = ("original.", "full.")
+# Archived steps never change, so each worker keeps the ones it read recently
+ARCHIVE_CACHE_SIZE = 256
+
+# Only one worker compacts at a time
+COMPACTOR_LEASE = "compactor"
+COMPACTOR_LEASE_TTL = 60.0
+
+
+class ColdArchive:
+    """Archived session/ablation steps, one gzip-compressed JSON object per
+    step (``archive/<kind>/<id>/<index>.json.gz``) in the durable object
+    store.
+
+    Archived steps keep their whole design space, so each one can be loaded
+    on its own, only when a reader needs it.
+    """
+
+    def __init__(self, store: ObjectStore = objects):
+        self.store = store
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def durable(self) -> bool:
+        return self.store.durable
+
+    @staticmethod
+    def key(kind: str, record_id: str, index: int) -> str:
+        return f"archive/{kind}/{record_id}/{index}.json.gz"
+
+    def put(self, kind: str, record_id: str, index: int, step: Dict) -> None:
+        data = gzip.compress(json.dumps(step).encode())
+        self.store.put(self.key(kind, record_id, index), data)
+
+    def get(self, kind: str, record_id: str, index: int) -> Dict:
+        key = self.key(kind, record_id, index)
+        with self._lock:
+            step = self._cache.get(key)
+            if step is not None:
+                self._cache.move_to_end(key)
+                return step
+        data = self.store.get(key)
+        if data is None:
+            raise FileNotFoundError(f"Missing archived step {key}")
+        step = json.loads(gzip.decompress(data))
+        with self._lock:
+            self._cache[key] = step
+            while len(self._cache) > ARCHIVE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return step
+
+    def rehydrate(
+        self,
+        kind: str,
+        record_id: str,
+        steps: List[Dict],
+        indices: Optional[Iterable[int]] = None,
+    ) -> List[Dict]:
+        """``steps`` with the stubs among ``indices`` (default: all) replaced
+        by their archived steps; other stubs are left as they are."""
+        wanted = range(len(steps)) if indices is None else set(indices)
+        return [
+            self.get(kind, record_id, index)
+            if step.get("archived") and index in wanted
+            else step
+            for index, step in enumerate(steps)
+        ]
+
+
+cold_archive = ColdArchive()
+
+
+def stub(step: Dict) -> Dict:
+    """What stays in the database for an archived step: enough to list and
+    revalidate it (see ``record_etag``) without its design space or examples."""
+    kept = ("timestamp", "updated_at", "variant_index", "prompt_index")
+    return {
+        "archived": True,
+        "examples": codec.step_example_count(step),
+        **{key: step[key] for key in kept if step.get(key) is not None},
+    }
+
+
+class Compactor:
+    """Moves all but the last ``keep`` steps of each session and ablation into
+    the cold archive, leaving stubs behind. The archive must be durable:
+    a stub is all the database keeps of a step.
+
+    Runs in a background thread every ``interval`` seconds, compacting at
+    most ``records_per_second`` records (a token bucket in the shared state,
+    so the rate holds across workers) to bound the load on the database.
+    """
+
+    def __init__(
+        self,
+        database,
+        archive: ColdArchive = cold_archive,
+        keep: int = 10,
+        records_per_second: float = 1.0,
+        interval: float = 600.0,
+        state=shared_state,
+    ):
+        self.database = database
+        self.archive = archive
+        self.keep = max(keep, 1)
+        self.records_per_second = records_per_second
+        self.interval = interval
+        self.state = state
+        self._holder = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def compact_record(self, kind: str, record: Dict) -> int:
+        """Archive the record's cold steps; returns how many were archived.
+
+        Each step is archived before its stub replaces it, so an interrupted
+        run loses nothing and the next run simply archives it again.
+        """
+        steps_key = STEPS[kind]
+        steps = record.get(steps_key) or []
+        path = f"{kind}/{record['id']}/{steps_key}"
+        first_hot = len(steps) - self.keep
+        # The oldest hot step becomes a keyframe first, so the hot steps can
+        # still be reconstructed without the archive
+        if first_hot > 0 and steps[first_hot].get(designhistory.DELTA):
+            space = designhistory.design_space_at(steps, first_hot)
+            if space is None:
+                space = designhistory.design_space_at(
+                    self.archive.rehydrate(kind, record["id"], steps), first_hot
+                )
+            self.database.set(
+                f"{path}/{first_hot}/{designhistory.KEYFRAME}", json.dumps(space)
+            )
+            self.database.delete(f"{path}/{first_hot}/{designhistory.DELTA}")
+
+        archived = 0
+        spaces = designhistory.design_spaces(steps[: max(first_hot, 0)])
+        for index, step in enumerate(steps[:first_hot]):
+            if step.get("archived"):
+                continue
+            if step.get(designhistory.DELTA):
+                # Stored whole, so it can be loaded without the steps before it
+                space = spaces[index]
+                if space is None:
+                    raise ValueError(
+                        f"Can't reconstruct step {index} of {kind}/{record['id']}"
+                    )
+                step = {**step, designhistory.KEYFRAME: json.dumps(space)}
+            self.archive.put(kind, record["id"], index, step)
+            for example in codec.step_examples(step):
+                sha = parse_blob_ref(example.get("content") or "")
+                if sha is None:
+                    continue
+                for name in blobs.files(sha):
+                    if name.startswith(ARCHIVED_BLOB_FILES):
+                        blobs.evict(sha, name)
+            self.database.set(f"{path}/{index}", stub(step))
+            archived += 1
+        return archived
+
+    def run_once(self) -> Dict[str, int]:
+        """One pass over every record; skipped while another worker compacts."""
+        counts = {"records": 0, "steps": 0}
+        if not self.archive.durable:
+            raise RuntimeError(
+                "Not compacting: the archive is not durable (see --object-store)"
+            )
+        if self.state.acquire(COMPACTOR_LEASE, self._holder, COMPACTOR_LEASE_TTL):
+            return counts
+        try:
+            for kind, records in (
+                ("sessions", self.database.list_sessions()),
+                ("ablations", self.database.list_ablations()),
+            ):
+                for record in records:
+                    if self._stop.is_set():
+                        return counts
+                    steps = record.get(STEPS[kind]) or []
+                    if len(steps) <= self.keep or not record.get("id"):
+                        continue
+                    cold = steps[: len(steps) - self.keep]
+                    if all(step.get("archived") for step in cold):
+                        continue
+                    while wait := self.state.take(
+                        "compactor:rate", self.records_per_second, 1
+                    ):
+                        self._stop.wait(wait)
+                    if not self.state.renew(
+                        COMPACTOR_LEASE, self._holder, COMPACTOR_LEASE_TTL
+                    ):
+                        return counts
+                    counts["steps"] += self.compact_record(kind, record)
+                    counts["records"] += 1
+        finally:
+            self.state.release(COMPACTOR_LEASE, self._holder)
+        return counts
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                started = time.monotonic()
+                counts = self.run_once()
+                if counts["steps"]:
+                    print(
+                        f"Compacted {counts['steps']} steps of {counts['records']} "
+                        f"records in {time.monotonic() - started:.1f}s"
+                    )
+            except Exception as e:
+                # Compaction is housekeeping; never let it kill the thread
+                print(f"Compaction failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, Tuple
+
+from starlette.staticfiles import StaticFiles
+
+SRC_DIR = Path(__file__).parent
+STATIC_DIR = SRC_DIR / "static"
+ICONS_DIR = STATIC_DIR / "icons"
+# Tailwind entry point and the stylesheet compiled from it (see ``build_css``)
+CSS_INPUT = STATIC_DIR / "tailwind.css"
+CSS_OUTPUT = STATIC_DIR / "app.css"
+TAILWIND_CONFIG = SRC_DIR / "tailwind.config.cjs"
+
+HASH_LENGTH = 12
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+_FINGERPRINTED = re.compile(
+    rf"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{{{HASH_LENGTH}}})(?P<ext>\.[^./]+)$"
+)
+_SVG_BODY = re.compile(r"<svg[^>]*>(?P<body>.*)</svg>", re.S)
+
+
+# ----------------------------------------------------------------------
+# Fingerprinted static files
+# ----------------------------------------------------------------------
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """Static files that are also served under content-hashed names.
+
+    ``url("scripts.js")`` returns ``<prefix>/scripts.<hash>.js``. Such URLs
+    change whenever the file does, so they are served with an immutable
+    year-long Cache-Control; plain URLs (and stale hashes) are revalidated
+    on every use instead.
+    """
+
+    def __init__(self, directory: str | Path, prefix: str):
+        super().__init__(directory=str(directory))
+        self.prefix = prefix.rstrip("/")
+        # path -> (mtime, hash); rehashed when a file changes on disk
+        self._hashes: Dict[str, Tuple[int, str]] = {}
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(os.path.join(self.directory, path))
+
+    def fingerprint(self, path: str) -> str:
+        full_path = os.path.join(self.directory, path)
+        mtime = os.stat(full_path).st_mtime_ns
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(full_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:HASH_LENGTH]
+            cached = self._hashes[path] = (mtime, digest)
+        return cached[1]
+
+    def url(self, path: str) -> str:
+        stem, ext = os.path.splitext(path)
+        return f"{self.prefix}/{stem}.{self.fingerprint(path)}{ext}"
+
+    async def get_response(self, path: str, scope):
+        match = _FINGERPRINTED.match(path)
+        if match is None:
+            response = await super().get_response(path, scope)
+            response.headers["Cache-Control"] = REVALIDATE
+            return response
+
+        original = match["stem"] + match["ext"]
+        response = await super().get_response(original, scope)
+        current = response.status_code in (200, 304) and (
+            self.fingerprint(original) == match["hash"]
+        )
+        response.headers["Cache-Control"] = IMMUTABLE if current else REVALIDATE
+        return response
+
+
+# ----------------------------------------------------------------------
+# Icons
+# ----------------------------------------------------------------------
+
+
+def icon_sprite(icons_dir: Path = ICONS_DIR) -> str:
+    """Inline SVG sprite with one ``<symbol id="icon-<name>">`` per icon file.
+
+    Rendered once into each page, so icons are drawn with
+    ``<svg><use href="#icon-<name>"/></svg>`` without any request.
+    """
+    symbols = []
+    for path in sorted(icons_dir.glob("*.svg")):
+        match = _SVG_BODY.search(path.read_text())
+        if match is None:
+            raise ValueError(f"Not an SVG file: {path}")
+        body = " ".join(line.strip() for line in match["body"].splitlines() if line.strip())
+        symbols.append(f'<symbol id="icon-{path.stem}" viewBox="0 0 24 24">{body}</symbol>')
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" style="display: none" aria-hidden="true">'
+        + "".join(symbols)
+        + "</svg>"
+    )
+
+
+# ----------------------------------------------------------------------
+# Build
+# ----------------------------------------------------------------------
+
+
+def build_css(minify: bool = True) -> Path:
+    """Compile Tailwind against the templates and scripts into ``static/app.css``.
+
+    Needs Node.js; the Tailwind CLI is fetched by npx on first use.
+    """
+    command = [
+        "npx",
+        "--yes",
+        "tailwindcss@3",
+        "--config",
+        str(TAILWIND_CONFIG),
+        "--input",
+        str(CSS_INPUT),
+        "--output",
+        str(CSS_OUTPUT),
+    ]
+    if minify:
+        command.append("--minify")
+    subprocess.run(command, cwd=SRC_DIR, check=True)
+    return CSS_OUTPUT
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build the frontend stylesheet (run before deploying)"
+    )
+    parser.add_argument(
+        "--no-minify", action="store_true", help="Keep the stylesheet readable"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = build_css(minify=not args.no_minify)
+    static = FingerprintedStaticFiles(STATIC_DIR, "/static")
+    print(f"{static.url(output.name)} ({output.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
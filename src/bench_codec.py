@@ -0,0 +1,95 @@
+import argparse
+import json
+import random
+import time
+
+import codec
+from designspace import Example
+
+WORDS = (
+    "minimal brutalist pastel neon serif grotesque grid dense airy card hero "
+    "gradient monochrome playful corporate rounded sharp dark light bold muted"
+).split()
+
+
+def sample_examples(n: int, seed: int = 0) -> list[dict]:
+    """Examples shaped like stored ones (prompt, content, a tag per axis)."""
+    rng = random.Random(seed)
+
+    def words(count: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(count))
+
+    return [
+        {
+            "prompt": words(40),
+            "content": f"<div class='{words(3)}'>{words(120)}</div>",
+            "tags": [{"dimension": words(1), "value": words(2)} for _ in range(5)],
+            "seed": rng.randrange(2**31),
+            "preview": False,
+        }
+        for _ in range(n)
+    ]
+
+
+def legacy_step(models: list[Example]) -> dict:
+    return {"generations": [model.model_dump_json() for model in models]}
+
+
+def legacy_body(step: dict) -> bytes:
+    """Stored step to response body, validating every example again as
+    readers did before."""
+    models = [Example.model_validate_json(example) for example in step["generations"]]
+    return json.dumps([model.model_dump() for model in models]).encode()
+
+
+def packed_body(step: dict) -> bytes:
+    """Stored step to response body, trusting the stored examples."""
+    return json.dumps(codec.step_examples(step)).encode()
+
+
+def timed(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the legacy and packed step encodings: size and throughput"
+    )
+    parser.add_argument("--examples", type=int, default=9, help="Examples per step")
+    parser.add_argument("--iterations", type=int, default=2000, help="Runs per timing")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    examples = sample_examples(args.examples)
+    models = [Example.model_validate(example) for example in examples]
+    legacy = legacy_step(models)
+    packed = codec.encode_examples(models)
+
+    rows = (
+        ("legacy", legacy, lambda: legacy_step(models), lambda: legacy_body(legacy)),
+        (
+            "packed",
+            packed,
+            lambda: codec.encode_examples(models),
+            lambda: packed_body(packed),
+        ),
+    )
+    print(f"{args.examples} examples per step, {args.iterations} iterations")
+    for name, step, encode, decode in rows:
+        size = len(json.dumps(step))
+        encode_time = timed(encode, args.iterations)
+        decode_time = timed(decode, args.iterations)
+        print(
+            f"{name:>7}: {size:>7} bytes  "
+            f"encode {args.iterations / encode_time:>8.0f} steps/s  "
+            f"decode {args.iterations / decode_time:>8.0f} steps/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Polled until it answers; cheap and touches no model provider or database
+PROBE_PATH = "/api/domains"
+POLL_INTERVAL = 0.02
+
+
+def time_to_first_request(port: int, timeout: float, server_args: list[str]) -> float:
+    """Seconds from spawning ``server.py`` until it answers its first request."""
+    url = f"http://127.0.0.1:{port}{PROBE_PATH}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--port", str(port), *server_args],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                pass
+            time.sleep(POLL_INTERVAL)
+        raise TimeoutError(f"No response from {url} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def time_import(module: str) -> float:
+    """Seconds to import ``module`` in a fresh interpreter."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure server cold start: import time and time to first request"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the test server")
+    parser.add_argument(
+        "--timeout", type=float, default=100, help="Give up after this many seconds"
+    )
+    parser.add_argument(
+        "server_args", nargs="*", help="Extra arguments passed to server.py (after --)"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    imports = [time_import("server") for _ in range(args.runs)]
+    starts = [
+        time_to_first_request(args.port, args.timeout, args.server_args)
+        for _ in range(args.runs)
+    ]
+    for name, samples in (("import server", imports), ("first request", starts)):
+        print(
+            f"{name:>14}: median {statistics.median(samples):.3f}s  "
+            f"min {min(samples):.3f}s  max {max(samples):.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import List, Optional
+
+from objectstore import ObjectStore, objects
+
+DEFAULT_BLOB_DIR = os.getenv("BLOB_DIR", "../.data/blobs")
+# Extensions an original may have, most common first
+ORIGINAL_EXTS = ("png", "jpg", "webp")
+
+# Example content that lives in the blob store instead of inline
+BLOB_PREFIX = "blob:"
+_SHA = re.compile(r"^[0-9a-f]{64}$")
+_NAME = re.compile(r"^[a-z0-9_]+\.[a-z0-9]+$")
+
+
+def blob_ref(sha: str) -> str:
+    return BLOB_PREFIX + sha
+
+
+def parse_blob_ref(content: str) -> Optional[str]:
+    """The blob's sha256 if ``content`` is a ``blob:<sha256>`` reference."""
+    if not content.startswith(BLOB_PREFIX):
+        return None
+    sha = content[len(BLOB_PREFIX) :]
+    return sha if _SHA.match(sha) else None
+
+
+class BlobStore:
+    """Content-addressed files on disk, one directory per blob.
+
+    A blob is identified by the sha256 of its original bytes and holds the
+    original (``original.<ext>``) next to any derived files, e.g. resized or
+    transcoded variants (``grid.webp``). Files are written atomically and
+    never change once written, so they can be cached forever.
+
+    Originals are also written to the ``durable`` object store before their
+    ref is handed out, and fetched back from it when missing on disk (after
+    a redeploy, or on another machine). The directory is only a cache;
+    derived files are rebuilt from the original when needed.
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_BLOB_DIR,
+        durable: Optional[ObjectStore] = objects,
+    ):
+        self.root = root
+        self.durable = durable
+
+    def directory(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def path(self, sha: str, name: str) -> str:
+        if not _SHA.match(sha) or not _NAME.match(name):
+            raise ValueError(f"Invalid blob path: {sha}/{name}")
+        return os.path.join(self.directory(sha), name)
+
+    @staticmethod
+    def durable_key(sha: str, name: str) -> str:
+        return f"blobs/{sha}/{name}"
+
+    def _fetch(self, sha: str, name: str) -> Optional[str]:
+        """Copy an original from the durable store to disk; its path, or None."""
+        if self.durable is None or not name.startswith("original."):
+            return None
+        data = self.durable.get(self.durable_key(sha, name))
+        if data is None:
+            return None
+        self.write(sha, name, data)
+        return self.path(sha, name)
+
+    def locate(self, sha: str, name: str) -> Optional[str]:
+        """Path of the file on disk (fetched from the durable store if it is
+        a missing original), or None."""
+        path = self.path(sha, name)
+        if os.path.exists(path):
+            return path
+        return self._fetch(sha, name)
+
+    def has(self, sha: str, name: str) -> bool:
+        return self.locate(sha, name) is not None
+
+    def files(self, sha: str) -> List[str]:
+        try:
+            names = {n for n in os.listdir(self.directory(sha)) if _NAME.match(n)}
+        except FileNotFoundError:
+            names = set()
+        return sorted(names)
+
+    def original(self, sha: str) -> Optional[str]:
+        """File name of the blob's original (fetching it if needed), or None."""
+        for name in self.files(sha):
+            if name.startswith("original."):
+                return name
+        for ext in ORIGINAL_EXTS:
+            if self._fetch(sha, f"original.{ext}") is not None:
+                return f"original.{ext}"
+        return None
+
+    def read(self, sha: str, name: str) -> bytes:
+        path = self.locate(sha, name)
+        if path is None:
+            raise FileNotFoundError(f"Missing blob {sha}/{name}")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def write(self, sha: str, name: str, data: bytes) -> None:
+        path = self.path(sha, name)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per write: threads may store the same blob at the same time
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def evict(self, sha: str, name: str) -> bool:
+        """Drop a file from disk if it can be had again: an original that is
+        in the durable store, or a variant. Returns whether it was removed."""
+        if name.startswith("original.") and self.durable is None:
+            return False
+        try:
+            os.remove(self.path(sha, name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, data: bytes, ext: str) -> str:
+        """Store ``data`` as a blob's original, durably, and return its sha256."""
+        sha = hashlib.sha256(data).hexdigest()
+        name = f"original.{ext}"
+        # On disk means it was stored durably already
+        if self.durable is not None and not os.path.exists(self.path(sha, name)):
+            self.durable.put(self.durable_key(sha, name), data)
+        self.write(sha, name, data)
+        return sha
+
+
+blobs = BlobStore()
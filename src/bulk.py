@@ -0,0 +1,226 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+from conceptindex import normalize_concept
+from designgalleries import generate
+from designspace import DesignSpace
+from domains.domain import Domain
+from models.llms import text_model
+from models.usage import call_budget, usage
+
+
+def read_concepts(lines: Iterable[str]) -> List[str]:
+    """One concept per line; blank lines, ``#`` comments and duplicates
+    (after normalization) are dropped, keeping the first spelling."""
+    concepts = []
+    seen: Set[str] = set()
+    for line in lines:
+        concept = line.strip()
+        if not concept or concept.startswith("#"):
+            continue
+        key = normalize_concept(concept)
+        if key in seen:
+            continue
+        seen.add(key)
+        concepts.append(concept)
+    return concepts
+
+
+def finished_keys(out_path: str) -> Set[Tuple[str, str]]:
+    """(domain, normalized concept) pairs already present in the output file."""
+    keys: Set[Tuple[str, str]] = set()
+    if not os.path.exists(out_path):
+        return keys
+    with open(out_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crashed run; that gallery is redone
+                continue
+            keys.add((record["domain"], normalize_concept(record["concept"])))
+    return keys
+
+
+def build_gallery(concept: str, domain: Domain, n: int, model: str) -> Dict:
+    design_space = DesignSpace.create(concept, domain.display_name, model=model)
+    design_space.explore_new_axis()
+    design_space.fill()
+    generations = generate(concept, design_space, domain=domain, n=n, model=model)
+    return {
+        "concept": concept,
+        "domain": domain.name,
+        "created_at": time.time(),
+        "design_space": design_space.model_dump(),
+        "generations": [g.model_dump() for g in generations],
+    }
+
+
+def run(
+    concepts: List[str],
+    domains: List[Domain],
+    n: int,
+    out_path: str,
+    model: str = text_model,
+    galleries: int = 8,
+    max_calls: int | None = 32,
+) -> Dict:
+    """Generate one gallery per concept x domain, appending each to ``out_path``
+    (JSONL) as soon as it completes.
+
+    ``galleries`` bounds how many galleries are in progress at once and
+    ``max_calls`` how many model calls are in flight across all of them.
+    Pairs already in ``out_path`` are skipped, so an interrupted run resumes
+    where it stopped.
+    """
+    done_keys = finished_keys(out_path)
+    jobs = [
+        (concept, domain)
+        for domain in domains
+        for concept in concepts
+        if (domain.name, normalize_concept(concept)) not in done_keys
+    ]
+    skipped = len(concepts) * len(domains) - len(jobs)
+    print(f"{len(jobs)} galleries to generate, {skipped} already done", file=sys.stderr)
+
+    call_budget.limit(max_calls)
+    usage.reset()
+    completed = failed = 0
+    start = time.monotonic()
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "a") as out, concurrent.futures.ThreadPoolExecutor(
+        max_workers=galleries
+    ) as executor:
+        # Keep new records off a line torn by a crashed run
+        if out.tell() > 0:
+            with open(out_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    out.write("\n")
+        futures = {
+            executor.submit(build_gallery, concept, domain, n, model): (concept, domain)
+            for concept, domain in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            concept, domain = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{domain.name}: {concept} failed: {e}", file=sys.stderr)
+                continue
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            completed += 1
+            print(
+                f"[{completed + failed}/{len(jobs)}] {domain.name}: {concept}",
+                file=sys.stderr,
+            )
+
+    elapsed = time.monotonic() - start
+    return {
+        "generated": completed,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "galleries_per_minute": completed / elapsed * 60 if elapsed else 0.0,
+        **usage.snapshot(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Generate design galleries for every concept in a file"
+    )
+    parser.add_argument(
+        "concepts", type=str, help="File with one concept per line, or - for stdin"
+    )
+    parser.add_argument(
+        "--domains",
+        nargs="+",
+        default=["image"],
+        choices=["image", "text", "ui"],
+    )
+    parser.add_argument("--n", type=int, default=6, help="Examples per gallery")
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="../.data/bulk/galleries.jsonl",
+        help="JSONL file galleries are appended to (and resumed from)",
+    )
+    parser.add_argument(
+        "--galleries", type=int, default=8, help="Galleries generated concurrently"
+    )
+    parser.add_argument(
+        "--max-calls",
+        type=int,
+        default=32,
+        help="Model calls in flight across all galleries (0 for no limit)",
+    )
+    parser.add_argument(
+        "--data-dir", type=str, default="../.data", help="Data directory"
+    )
+    parser.add_argument("--model", type=str, default=text_model, help="Model to use")
+    return parser.parse_args()
+
+
+def main():
+    from domains.imagegen.imagegen import ImageGen
+    from domains.text.textgen import TextGen
+    from domains.ui.ui import UIGen
+
+    args = parse_args()
+    if args.concepts == "-":
+        concepts = read_concepts(sys.stdin)
+    else:
+        with open(args.concepts, "r") as f:
+            concepts = read_concepts(f)
+
+    domain_classes = {"image": ImageGen, "text": TextGen, "ui": UIGen}
+    domains = [
+        domain_classes[name](data_dir=args.data_dir, model=args.model)
+        for name in args.domains
+    ]
+
+    report = run(
+        concepts,
+        domains,
+        n=args.n,
+        out_path=args.out,
+        model=args.model,
+        galleries=args.galleries,
+        max_calls=args.max_calls or None,
+    )
+    print(
+        f"Generated {report['generated']} galleries ({report['failed']} failed, "
+        f"{report['skipped']} skipped) in {report['seconds']:.0f}s: "
+        f"{report['galleries_per_minute']:.2f} galleries/min",
+        file=sys.stderr,
+    )
+    print(
+        f"{report['calls']} LLM calls, {report['prompt_tokens']} prompt + "
+        f"{report['completion_tokens']} completion tokens, {report['images']} images, "
+        f"estimated cost ${report['cost']:.2f}",
+        file=sys.stderr,
+    )
+    if report["saved_generations"]:
+        print(
+            f"{report['saved_generations']} generations saved by skipping "
+            "duplicate options",
+            file=sys.stderr,
+        )
+    if report["unpriced_models"]:
+        print(
+            f"Not priced (excluded from cost): {', '.join(report['unpriced_models'])}",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
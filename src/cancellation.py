@@ -0,0 +1,57 @@
+import threading
+from typing import Callable, List
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a build once its cancel token has been triggered."""
+
+
+class CancelToken:
+    """Thread-safe cancellation signal shared by every stage of one gallery build.
+
+    Blocking calls (HTTP requests, queue polls) register an abort callback with
+    ``on_cancel`` so they are interrupted immediately instead of running to
+    completion; cheap stages simply call ``raise_if_cancelled`` between steps.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # aborting is best effort; the build checks the token anyway
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise GenerationCancelled()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Register ``callback`` to run on cancellation and return an unregister function.
+
+        If the token is already cancelled the callback runs immediately.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
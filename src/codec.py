@@ -0,0 +1,132 @@
+import argparse
+import base64
+import json
+import zlib
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from designspace import Example
+
+# msgpack is only needed for the packed step format; without it steps are
+# written (and must already be stored) in the legacy JSON format.
+try:
+    import msgpack  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover – handled at runtime
+    msgpack = None  # type: ignore
+
+# A step's examples are stored either as a list of JSON strings under
+# "generations" (legacy) or packed into one string under "packed":
+# "<version>:<base64>". Version 1 is zlib-compressed msgpack of
+# {"generations": [example dicts]}.
+PACKED = "packed"
+PACKED_VERSION = 1
+ZLIB_LEVEL = 6
+
+
+def _pack(payload: Dict) -> str:
+    data = zlib.compress(msgpack.packb(payload, use_bin_type=True), ZLIB_LEVEL)
+    return f"{PACKED_VERSION}:{base64.b64encode(data).decode('ascii')}"
+
+
+def _unpack(packed: str) -> Dict:
+    version, _, data = packed.partition(":")
+    if version != "1":
+        raise ValueError(f"Unknown packed step version: {version}")
+    if msgpack is None:
+        raise RuntimeError("Reading packed steps requires msgpack: pip install msgpack")
+    return msgpack.unpackb(zlib.decompress(base64.b64decode(data)), raw=False)
+
+
+def encode_examples(examples: List[Any]) -> Dict:
+    """Step fields storing ``examples`` (models or dicts), packed when possible."""
+    dicts = [e if isinstance(e, dict) else e.model_dump() for e in examples]
+    if msgpack is None:
+        return {"generations": [json.dumps(e) for e in dicts]}
+    return {PACKED: _pack({"generations": dicts})}
+
+
+def step_examples(step: Dict) -> List[Dict]:
+    """A stored step's examples as plain dicts, whichever format it is in."""
+    if step.get(PACKED):
+        return _unpack(step[PACKED])["generations"]
+    return [json.loads(example) for example in step.get("generations") or [] if example]
+
+
+def step_example_count(step: Dict) -> int:
+    if "examples" in step:  # archived stub
+        return step["examples"]
+    return len(step_examples(step))
+
+
+def load_examples(step: Dict) -> List["Example"]:
+    """A stored step's examples as models, for callers that need them.
+
+    Responses built from stored steps don't: the examples were validated when
+    they were written, so they are sent as the decoded dicts (see
+    ``Server.get_generation``).
+    """
+    from designspace import Example
+
+    return [Example.model_validate(example) for example in step_examples(step)]
+
+
+# ----------------------------------------------------------------------
+# Migration
+# ----------------------------------------------------------------------
+
+STEPS = {"sessions": "generations", "ablations": "history"}
+
+
+def migrate_record(database, kind: str, record: Dict, dry_run: bool = False) -> int:
+    """Rewrite a record's legacy steps in the packed format; returns how many."""
+    path = f"{kind}/{record['id']}/{STEPS[kind]}"
+    migrated = 0
+    for index, step in enumerate(record.get(STEPS[kind]) or []):
+        if step.get(PACKED) or step.get("archived") or "generations" not in step:
+            continue
+        if not dry_run:
+            # Write the packed copy before dropping the legacy one
+            database.set(f"{path}/{index}/{PACKED}", _pack({"generations": step_examples(step)}))
+            database.delete(f"{path}/{index}/generations")
+        migrated += 1
+    return migrated
+
+
+def migrate(database, dry_run: bool = False) -> Dict[str, int]:
+    if msgpack is None:
+        raise RuntimeError("Migrating requires msgpack: pip install msgpack")
+    counts = {"records": 0, "steps": 0}
+    for kind, records in (
+        ("sessions", database.list_sessions()),
+        ("ablations", database.list_ablations()),
+    ):
+        for record in records:
+            if not record.get("id"):
+                continue
+            steps = migrate_record(database, kind, record, dry_run)
+            counts["steps"] += steps
+            counts["records"] += bool(steps)
+    return counts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Rewrite stored session/ablation steps in the packed format"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only count the steps to migrate"
+    )
+    return parser.parse_args()
+
+
+def main():
+    from db import database
+
+    args = parse_args()
+    counts = migrate(database, dry_run=args.dry_run)
+    print(f"{'Would migrate' if args.dry_run else 'Migrated'} {counts['steps']} steps "
+          f"in {counts['records']} records")
+
+
+if __name__ == "__main__":
+    main()
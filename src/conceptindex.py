@@ -0,0 +1,201 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ngrams import NgramVectorizer, words
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves from several processes may race
+    fcntl = None
+
+# Concepts scoring at least this cosine similarity reuse a cached axis set
+DEFAULT_THRESHOLD = float(os.getenv("CONCEPT_REUSE_THRESHOLD", "0.85"))
+DEFAULT_INDEX_PATH = os.getenv("CONCEPT_INDEX_PATH", "../.data/concept_index.json")
+
+# New entries are written out in the background, batched over this many seconds
+SAVE_DELAY = 1.0
+# How often lookups check whether another process has saved new entries
+RELOAD_INTERVAL = 5.0
+
+_ARTICLES = {"a", "an", "the"}
+
+
+def normalize_concept(concept: str) -> str:
+    """Lowercase, strip punctuation and leading articles: "A race-car!" -> "race car"."""
+    concept_words = words(concept)
+    while concept_words and concept_words[0] in _ARTICLES:
+        concept_words = concept_words[1:]
+    return " ".join(concept_words)
+
+
+class ConceptIndex:
+    """Local, offline index of design-space axes keyed by (domain, normalized concept).
+
+    Lookups for a concept that is identical after normalization, or similar
+    enough under character n-gram TF-IDF cosine similarity, return the axes
+    previously generated for it so ``DesignSpace.create`` can skip the LLM.
+    The index is persisted as JSON so it survives restarts. New entries are
+    merged into the file by a background thread, so several workers can
+    share it; each picks up the others' entries when the file changes.
+    """
+
+    def __init__(
+        self,
+        path: str | None = DEFAULT_INDEX_PATH,
+        threshold: float = DEFAULT_THRESHOLD,
+        refresh: bool = False,
+    ):
+        self.path = path
+        self.threshold = threshold
+        # Whether reused axes should be regenerated in the background
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, List[str]]] = {}
+        self._vectorizers: Dict[str, Tuple[List[str], NgramVectorizer]] = {}
+        self._loaded = False
+        # Modification time of the file as last read, and when it was checked
+        self._mtime: float | None = None
+        self._checked = 0.0
+        # Entries added since the last save
+        self._pending: Dict[str, Dict[str, List[str]]] = {}
+        self._dirty = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _read(self) -> Dict[str, Dict[str, List[str]]]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _stat(self) -> float | None:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _merge(self, entries: Dict[str, Dict[str, List[str]]]) -> None:
+        """Adopt ``entries`` read from disk, keeping ours not saved yet
+        (caller holds the lock)."""
+        for domain, pending in self._pending.items():
+            entries.setdefault(domain, {}).update(pending)
+        self._entries = entries
+        self._vectorizers.clear()
+
+    def _load(self) -> None:
+        """Read the persisted index on first use, and again when another
+        process has saved to it (caller holds the lock)."""
+        if not self.path:
+            self._loaded = True
+            return
+        now = time.monotonic()
+        if self._loaded and now - self._checked < RELOAD_INTERVAL:
+            return
+        self._loaded, self._checked = True, now
+        mtime = self._stat()
+        if mtime is not None and mtime != self._mtime:
+            self._mtime = mtime
+            self._merge(self._read())
+
+    def _save(self) -> None:
+        """Merge the pending entries into the file: read it, add ours and
+        atomically replace it, all under a lock shared with other processes."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self._read()
+            for domain, added in pending.items():
+                entries.setdefault(domain, {}).update(added)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            mtime = self._stat()
+        with self._lock:
+            self._mtime = mtime
+            self._merge(entries)
+
+    def _run(self) -> None:
+        while True:
+            self._dirty.wait()
+            time.sleep(SAVE_DELAY)
+            self._dirty.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write out the entries not saved yet; runs at interpreter exit."""
+        try:
+            self._save()
+        except Exception as e:
+            # The entries stay in memory; losing them only costs a future LLM call
+            print(f"Failed to save concept index to {self.path}: {e}")
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def lookup(self, domain: str, concept: str) -> Optional[Tuple[List[str], float]]:
+        """Return ``(axis_names, score)`` for the closest indexed concept, or None."""
+        key = normalize_concept(concept)
+        with self._lock:
+            self._load()
+            entries = self._entries.get(domain)
+            if not entries:
+                return None
+            if key in entries:
+                return list(entries[key]), 1.0
+
+            cached = self._vectorizers.get(domain)
+            if cached is None:
+                concepts = list(entries)
+                cached = (concepts, NgramVectorizer(concepts))
+                self._vectorizers[domain] = cached
+            concepts, vectorizer = cached
+
+        scores = vectorizer.similarities(key)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < self.threshold:
+            return None
+        return list(entries[concepts[best]]), score
+
+    def add(self, domain: str, concept: str, axes: List[str]) -> None:
+        """Index ``axes`` for the concept; saving happens in the background."""
+        if not axes:
+            return
+        key = normalize_concept(concept)
+        with self._lock:
+            self._load()
+            # Copy-on-write: lookups may still be reading the old mapping
+            entries = dict(self._entries.get(domain, {}))
+            entries[key] = list(axes)
+            self._entries[domain] = entries
+            self._vectorizers.pop(domain, None)
+            if not self.path:
+                return
+            self._pending.setdefault(domain, {})[key] = list(axes)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, daemon=True, name="concept-index"
+                )
+                self._thread.start()
+        self._dirty.set()
+
+
+concept_index = ConceptIndex()
+atexit.register(concept_index.flush)
@@ -1,57 +1,157 @@
+import json
 import os
+import threading
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, db
 
 from dotenv import load_dotenv
 
+import codec
+import designhistory
+from sharedstate import shared_state
+
 load_dotenv(override=True)
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate(
-    {
-        "type": "service_account",
-        "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-        "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
-        "private_key": os.getenv("FIREBASE_PRIVATE_KEY"),
-        "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-        "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_CERT_URL"),
-    }
-)
-
-firebase_admin.initialize_app(cred, {"databaseURL": os.getenv("FIREBASE_DATABASE_URL")})
+_connect_lock = threading.Lock()
+
+# Each worker keeps the sessions and ablations it read recently, for at most
+# RECORD_CACHE_TTL seconds. Writes through Database record their time in the
+# shared state (a few bytes per record), so no worker serves a copy read
+# before another worker's write.
+RECORD_CACHE_TTL = 60
+RECORD_CACHE_SIZE = 32
+# Records fetched per query when iterating over all of them (see iter_records)
+RECORD_PAGE_SIZE = 100
+
+
+def initialize_firebase():
+    """Initialize the Firebase Admin SDK (once) and return its app.
+
+    Deferred to the first use so that importing this module (and starting
+    the server) doesn't pay for firebase_admin and its connection.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _connect_lock:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(
+                {
+                    "type": "service_account",
+                    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
+                    "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
+                    "private_key": os.getenv("FIREBASE_PRIVATE_KEY"),
+                    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+                    "client_id": os.getenv("FIREBASE_CLIENT_ID"),
+                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                    "token_uri": "https://oauth2.googleapis.com/token",
+                    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+                    "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_CERT_URL"),
+                }
+            )
+            options = {"databaseURL": os.getenv("FIREBASE_DATABASE_URL")}
+            if os.getenv("FIREBASE_STORAGE_BUCKET"):
+                options["storageBucket"] = os.getenv("FIREBASE_STORAGE_BUCKET")
+            firebase_admin.initialize_app(cred, options)
+        return firebase_admin.get_app()
+
+
+def _connect():
+    """The root reference of the Realtime Database."""
+    from firebase_admin import db
+
+    initialize_firebase()
+    return db.reference("/")
 
 
 class Database:
     def __init__(self):
-        self.ref = db.reference("/")
+        self._ref = None
+        # "sessions/<id>" -> (when it was read, the record as JSON)
+        self._records: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._records_lock = threading.Lock()
+
+    @property
+    def ref(self):
+        if self._ref is None:
+            self._ref = _connect()
+        return self._ref
 
     def get(self, key: str) -> Any:
+        # Connection/credential errors surface; only failed reads map to None
+        ref = self.ref
         try:
-            return self.ref.child(key).get()
+            return ref.child(key).get()
         except Exception:
             return None
 
     def set(self, key: str, value: Any) -> None:
         self.ref.child(key).set(value)
+        written_at = self._touch(key)
+        if key.count("/") == 1 and isinstance(value, dict):
+            # Whole record written: keep it instead of reading it back
+            self._remember(key, written_at, json.dumps(value))
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """Write several keys (paths from the root) at once."""
+        self.ref.update(values)
+        for key in values:
+            self._touch(key)
 
     def delete(self, key: str) -> None:
         self.ref.child(key).delete()
+        self._touch(key)
+
+    @staticmethod
+    def _record_key(key: str) -> str:
+        # "sessions/<id>/generations/0/..." -> the whole "sessions/<id>" record
+        return "/".join(key.split("/")[:2])
+
+    def _touch(self, key: str) -> float:
+        """Note that ``key``'s record changed, for every worker; returns when."""
+        record = self._record_key(key)
+        written_at = time.time()
+        shared_state.set(
+            f"db-written:{record}", str(written_at).encode(), RECORD_CACHE_TTL
+        )
+        with self._records_lock:
+            self._records.pop(record, None)
+        return written_at
+
+    def _remember(self, record: str, read_at: float, data: str) -> None:
+        with self._records_lock:
+            self._records[record] = (read_at, data)
+            self._records.move_to_end(record)
+            while len(self._records) > RECORD_CACHE_SIZE:
+                self._records.popitem(last=False)
+
+    def _get_record(self, key: str) -> Any:
+        with self._records_lock:
+            cached = self._records.get(key)
+        if cached is not None and time.time() - cached[0] < RECORD_CACHE_TTL:
+            written_at = shared_state.get(f"db-written:{key}")
+            if written_at is None or float(written_at) <= cached[0]:
+                # A fresh copy: callers may modify what they get
+                return json.loads(cached[1])
+        read_at = time.time()
+        record = self.get(key)
+        if record is not None:
+            self._remember(key, read_at, json.dumps(record))
+        return record
 
     def create_session(self, concept: str, domain: str) -> str:
         """Create a new generation session and return its ID"""
         session_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
         session = {
             "id": session_id,
             "concept": concept,
             "domain": domain,
-            "created_at": datetime.now().isoformat(),
+            "created_at": now,
+            "updated_at": now,
             "generations": [],
             "current_design_space": None,
         }
@@ -60,7 +160,7 @@ class Database:
 
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Get a session by ID"""
-        session = self.get(f"sessions/{session_id}")
+        session = self._get_record(f"sessions/{session_id}")
         if not session:
             return None
         # Ensure all required fields exist
@@ -76,23 +176,78 @@ class Database:
         if session:
             if "generations" not in session:
                 session["generations"] = []
+            now = datetime.now().isoformat()
             session["generations"].append(
                 {
-                    "timestamp": datetime.now().isoformat(),
-                    "design_space": design_space.model_dump_json(),
-                    "generations": [
-                        generation.model_dump_json() for generation in generations
-                    ],
+                    "timestamp": now,
+                    # Usually a small delta against the previous step
+                    **designhistory.encode(
+                        session["generations"], design_space.model_dump()
+                    ),
+                    **codec.encode_examples(generations),
                 }
             )
             session["current_design_space"] = design_space.model_dump_json()
+            session["updated_at"] = now
             self.set(f"sessions/{session_id}", session)
 
+    def update_session_example(
+        self, session_id: str, step_index: int, example_index: int, example: Any
+    ) -> None:
+        """Replace a single stored example in place (e.g. a refined preview)"""
+        self._replace_example(
+            f"sessions/{session_id}/generations/{step_index}", example_index, example
+        )
+
     def list_sessions(self) -> List[Dict]:
         """List all sessions"""
         sessions = self.get("sessions") or {}
         return list(sessions.values())
 
+    def iter_records(
+        self, kind: str, since: str = "", page_size: int = RECORD_PAGE_SIZE
+    ) -> Iterator[Dict]:
+        """Every record of ``kind`` ("sessions" or "ablations") whose
+        ``updated_at`` is after ``since`` (all of them without ``since``),
+        fetched ``page_size`` at a time rather than in one dump.
+
+        Incremental queries order by ``updated_at``, which needs an index on
+        it in the database rules; records written before it existed have
+        none and are only found without ``since``.
+        """
+        if not since:
+            keys = self.ref.child(kind).get(shallow=True) or {}
+            for key in sorted(keys):
+                record = self.get(f"{kind}/{key}")
+                if record:
+                    yield record
+            return
+
+        start, seen = since, set()
+        while True:
+            page = (
+                self.ref.child(kind)
+                .order_by_child("updated_at")
+                .start_at(start)
+                .limit_to_first(page_size)
+                .get()
+                or {}
+            )
+            for key, record in page.items():
+                if key not in seen and (record.get("updated_at") or "") > since:
+                    yield record
+            if len(page) < page_size:
+                return
+            last = max(record.get("updated_at") or "" for record in page.values())
+            if last == start:
+                # A whole page sharing one updated_at: widen the page instead
+                seen.update(page)
+                page_size *= 2
+                continue
+            # The next page starts at the last value again; skip what was seen
+            start = last
+            seen = {k for k, r in page.items() if r.get("updated_at") == last}
+
     def list_ablations(self) -> List[Dict]:
         """Return all ablation records as a list sorted by created_at desc."""
         ablations = self.get("ablations") or {}
@@ -110,11 +265,13 @@ class Database:
     def create_ablation(self, user_name: str, domain: str, prompts: List[str]) -> str:
         """Create a new ablation experiment and return its ID"""
         ablation_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
         ablation_record = {
             "id": ablation_id,
             "user_name": user_name,
             "domain": domain,
-            "created_at": datetime.now().isoformat(),
+            "created_at": now,
+            "updated_at": now,
             # Which variant the user is currently on (0-indexed)
             "variant_index": 0,
             # Which prompt inside the current variant (0-indexed)
@@ -129,7 +286,7 @@ class Database:
 
     def get_ablation(self, ablation_id: str) -> Optional[Dict]:
         """Fetch an ablation record by ID"""
-        ablation = self.get(f"ablations/{ablation_id}")
+        ablation = self._get_record(f"ablations/{ablation_id}")
         return ablation
 
     def update_ablation_generation(
@@ -146,20 +303,50 @@ class Database:
             return
 
         # Append to history
-        ablation.setdefault("history", []).append(
+        history = ablation.setdefault("history", [])
+        now = datetime.now().isoformat()
+        history.append(
             {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now,
                 "variant_index": variant_index,
                 "prompt_index": prompt_index,
-                "design_space": design_space.model_dump_json(),
-                "generations": [g.model_dump_json() for g in generations],
+                **designhistory.encode(history, design_space.model_dump()),
+                **codec.encode_examples(generations),
             }
         )
 
         # Persist current design space for quick reloads
         ablation["current_design_space"] = design_space.model_dump_json()
+        ablation["updated_at"] = now
         self.set(f"ablations/{ablation_id}", ablation)
 
+    def update_ablation_example(
+        self, ablation_id: str, step_index: int, example_index: int, example: Any
+    ) -> None:
+        """Replace a single example inside the ablation history in place"""
+        self._replace_example(
+            f"ablations/{ablation_id}/history/{step_index}", example_index, example
+        )
+
+    def _replace_example(self, step: str, example_index: int, example: Any) -> None:
+        packed = self.get(f"{step}/{codec.PACKED}")
+        if packed:
+            # Packed steps are rewritten whole
+            examples = codec.step_examples({codec.PACKED: packed})
+            examples[example_index] = example.model_dump()
+            self.set(
+                f"{step}/{codec.PACKED}",
+                codec.encode_examples(examples)[codec.PACKED],
+            )
+        else:
+            self.set(f"{step}/generations/{example_index}", example.model_dump_json())
+        # Marks the step as changed, so cached copies of it (ETags) go stale,
+        # and the record, so incremental exports pick it up
+        now = datetime.now().isoformat()
+        self.update(
+            {f"{step}/updated_at": now, f"{self._record_key(step)}/updated_at": now}
+        )
+
     def advance_ablation(
         self, ablation_id: str, total_variants: int, total_prompts: int
     ) -> None:
@@ -1,16 +1,24 @@
 import concurrent.futures
 from datetime import datetime
-import json
 import os
 from designspace import DesignSpace, Tag, Example
 from domains.imagegen.imagegen import ImageGen
 from models.llms import text_model, llm_call
 from domains.domain import Domain
-from typing import Dict, Tuple, List
+from typing import Callable, Dict, Tuple, List
 from models.prompts import extract_tags_prompt
+from models.usage import usage
+from optiondedup import EXTRA_OPTIONS, select_fills, select_options
+from tagging import TagBatcher
+from resultlog import result_log
 from rich.console import Console
 import re
 from rich.progress import track
+from cancellation import CancelToken, GenerationCancelled
+
+# Rounds of per-slot fills topping up an all-axes exploration that came back
+# with too few distinct designs
+TOP_UP_ROUNDS = 2
 
 
 def generate(
@@ -23,112 +31,217 @@ def generate(
     *,
     sort_results: bool = True,
     explore_all_axes: bool = False,
+    cancel: CancelToken | None = None,
+    on_event: Callable[[dict], None] | None = None,
 ) -> List[Example]:
+    """Generate ``n`` examples exploring the design space.
+
+    ``on_event`` receives progress events as plain dicts so callers can
+    stream partial galleries: ``explorations`` once the options are known,
+    ``delta`` for each streamed piece of content in a cell slot (domains with
+    ``streams_content``), ``reset`` when a slot's streamed content is void
+    (the model call failed over and starts again), and ``cell`` when a
+    slot's example is complete.
+
+    A few more than ``n`` options are requested and only the ``n`` most
+    distinct are generated (see ``optiondedup.select_options``), so
+    duplicate options never cost a generation.
+    """
     # ------------------------------------------------------------------
     # Decide how we obtain exploration variants depending on ablation mode
     # ------------------------------------------------------------------
 
+    # Every slot gets its own design space (and the tags it is known to
+    # carry) before anything is dispatched; workers never touch shared state.
     if explore_all_axes:
-        # In this mode we want to explore all design axes simultaneously.
-        # The existing DesignSpace.explore method only works with a single
-        # axis marked as "exploring", so here we approximate multi-axis
-        # exploration by generating n independent fills of the entire
-        # design space.
-        explorations = [f"exploration_{i}" for i in range(n)]  # dummy placeholders
+        # Explore all design axes simultaneously: one call proposes complete
+        # fills of the design space and every slot gets one of them.
+        fills = [
+            {axis.name: fill.get(axis.name, axis.value) for axis in design_space.axes}
+            for fill in design_space.explore_all(
+                n + EXTRA_OPTIONS, model=model, cancel=cancel
+            )
+        ]
+        fills, saved = select_fills(fills, n)
+        for _ in range(TOP_UP_ROUNDS):
+            missing = n - len(fills)
+            if missing <= 0:
+                break
+            # Too few distinct designs in the reply: fill the empty slots the
+            # per-slot way rather than returning a smaller gallery
+            if console:
+                console.print(
+                    f"Got {len(fills)} of {n} designs, filling the rest separately",
+                    style="dim",
+                )
+            with concurrent.futures.ThreadPoolExecutor(max_workers=missing) as executor:
+                extra = list(
+                    executor.map(
+                        lambda _: design_space.fill_all(model=model, cancel=cancel),
+                        range(missing),
+                    )
+                )
+            # Top-ups must differ from the designs already chosen, too
+            fills, _ = select_fills(fills + extra, n)
+        explorations = ["; ".join(fill.values()) for fill in fills]
+        spaces = [
+            design_space.with_values(fill, status="unconstrained") for fill in fills
+        ]
+        slot_tags = [
+            [Tag(dimension=axis.name, value=axis.value.lower()) for axis in space.axes]
+            for space in spaces
+        ]
     else:
-        explorations = design_space.explore(n)
+        explorations, saved = select_options(
+            design_space.explore(n + EXTRA_OPTIONS, cancel=cancel), n
+        )
+        exploring_axis = next(
+            (axis for axis in design_space.axes if axis.status == "exploring"), None
+        )
+        spaces = [
+            design_space.with_values({exploring_axis.name: exploration})
+            if exploring_axis
+            else design_space.model_copy(deep=True)
+            for exploration in explorations
+        ]
+        slot_tags = [
+            [Tag(dimension=exploring_axis.name, value=exploration.lower())]
+            if exploring_axis
+            else []
+            for exploration in explorations
+        ]
+    usage.record_saved_generations(saved)
 
     if console:
         console.print("Explorations:", style="dim")
         console.print(explorations, style="dim")
+        if saved:
+            console.print(f"Skipped {saved} duplicate options", style="dim")
 
-    # If we are in the all-axes exploration mode we will perform a full space
-    # fill for every generation rather than varying a single axis.
-    def _prepare_design_space_for_all_axes():
-        # Mark every axis as unconstrained so that `.fill()` assigns values.
-        for axis in design_space.axes:
-            axis.status = "unconstrained"
-            axis.value = ""
-        design_space.fill()
+    if on_event:
+        on_event({"type": "explorations", "explorations": explorations, "saved": saved})
+
+    # Every example is tagged along all exploring/unconstrained axes by a
+    # single batched call that overlaps with content generation. With all
+    # axes explored every value is known, so there is nothing to extract.
+    tag_axes = (
+        []
+        if explore_all_axes
+        else [
+            axis.name
+            for axis in design_space.axes
+            if axis.status in ("exploring", "unconstrained")
+        ]
+    )
+    tagger = TagBatcher(len(explorations), tag_axes, model=model, cancel=cancel)
 
     def generate_one(
         concept: str,
         design_space: DesignSpace,
-        exploration: str,
+        tags: List[Tag],
         model: str = text_model,
+        slot: int = 0,
     ) -> Example:
-        if explore_all_axes:
-            _prepare_design_space_for_all_axes()
-        else:
-            for axis in design_space.axes:
-                if axis.status == "exploring":
-                    axis.value = exploration
-
-        example = domain.generate_one(concept, design_space, model)
-        exploring_axis = next(
-            (axis for axis in design_space.axes if axis.status == "exploring"), None
+        try:
+            # Work dropped from the queue after cancellation never starts
+            if cancel:
+                cancel.raise_if_cancelled()
+            example = domain.generate_one(
+                concept,
+                design_space,
+                model,
+                cancel=cancel,
+                on_prompt=lambda prompt: tagger.submit(slot, prompt),
+                on_delta=(
+                    (lambda delta: on_event({"type": "delta", "slot": slot, "delta": delta}))
+                    if on_event and domain.streams_content
+                    else None
+                ),
+                on_reset=(
+                    (lambda: on_event({"type": "reset", "slot": slot}))
+                    if on_event and domain.streams_content
+                    else None
+                ),
+            )
+        finally:
+            tagger.done(slot)
+        result = Example(
+            prompt=example.prompt,
+            content=example.content,
+            tags=list(tags),
+            seed=example.seed,
+            preview=example.preview,
         )
-        tags = (
-            [Tag(dimension=exploring_axis.name, value=exploration.lower())]
-            if exploring_axis
-            else []
-        )
-        return Example(prompt=example.prompt, content=example.content, tags=tags)
+        if on_event:
+            on_event({"type": "cell", "slot": slot, "example": result.model_dump()})
+        return result
 
     with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {
-            executor.submit(
-                generate_one, concept, design_space, exploration, model
-            ): exploration
-            for exploration in explorations
+        slots = {
+            executor.submit(generate_one, concept, space, tags, model, slot): slot
+            for slot, (space, tags) in enumerate(zip(spaces, slot_tags))
         }
+
+        def drop_queued():
+            for future, slot in slots.items():
+                if future.cancel():
+                    tagger.done(slot)
+
+        unregister = cancel.on_cancel(drop_queued) if cancel else lambda: None
         results = []
-        for future in track(
-            concurrent.futures.as_completed(futures),
-            description="[dim]Generating examples...[/dim]",
-            total=n,
-        ):
-            results.append((futures[future], future.result()))
-
-        # Sort results by original exploration order if requested
-        if sort_results and explorations:
-            results.sort(key=lambda x: explorations.index(x[0]))
-        # Strip exploration keys, keep only Example objects
-        results = [r[1] for r in results]
+        try:
+            for future in track(
+                concurrent.futures.as_completed(slots),
+                description="[dim]Generating examples...[/dim]",
+                total=len(explorations),
+            ):
+                if future.cancelled():
+                    continue
+                results.append((slots[future], future.result()))
+        except GenerationCancelled:
+            drop_queued()
+            raise
+        finally:
+            unregister()
 
-    save_path = os.path.join(
-        domain.data_dir,
-        f"{concept.replace(' ', '_')[:32]}_{domain.display_name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json",
-    )
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-
-    if os.path.exists(save_path):
-        with open(save_path, "r") as f:
-            existing_results = json.load(f)
-        existing_results["history"].append(
-            {
-                "design_space": design_space.model_dump(),
-                "results": [result.model_dump() for result in results],
-            }
-        )
-    else:
-        existing_results = {
-            "history": [
-                {
-                    "design_space": design_space.model_dump(),
-                    "results": [result.model_dump() for result in results],
-                }
-            ]
-        }
+        # A cancelled build must not persist partial, stale results
+        if cancel and cancel.cancelled:
+            raise GenerationCancelled()
 
-    if console:
-        console.print(f"Saving results to {save_path}", style="dim")
+        # Merge in the batched tags; the exploring axis keeps its exact
+        # exploration value so filtering and sorting stay consistent.
+        extracted_tags = tagger.results()
+        for future, slot in slots.items():
+            if future.cancelled() or future.exception() is not None:
+                continue
+            example = future.result()
+            known = {tag.dimension for tag in example.tags}
+            example.tags.extend(
+                tag for tag in extracted_tags.get(slot, []) if tag.dimension not in known
+            )
+
+        # Sort results by original exploration order (their slot) if requested
+        if sort_results:
+            results.sort(key=lambda x: x[0])
+        # Strip slots, keep only Example objects
+        results = [r[1] for r in results]
 
-    with open(save_path, "w") as f:
-        json.dump(existing_results, f)
+    # Persisting happens on the result log's writer thread; the request path
+    # only hands over the record.
+    log_dir = os.path.join(domain.data_dir, "results")
+    result_log.append(
+        log_dir,
+        {
+            "concept": concept,
+            "domain": domain.name,
+            "timestamp": datetime.now().isoformat(),
+            "design_space": design_space.model_dump(),
+            "results": [result.model_dump() for result in results],
+        },
+    )
 
     if console:
-        console.print(f"Results saved to {save_path}", style="dim")
+        console.print(f"Queued results for {log_dir}", style="dim")
 
     return results
 
@@ -0,0 +1,157 @@
+import json
+from typing import Dict, List, Optional
+
+# A step stores its design space either whole (a keyframe, under
+# "design_space") or as a delta against the previous step (under
+# "design_space_delta"), both as JSON strings. Every KEYFRAME_INTERVAL-th step
+# is a keyframe so reconstructing any step applies a bounded number of deltas.
+KEYFRAME_INTERVAL = 8
+KEYFRAME = "design_space"
+DELTA = "design_space_delta"
+
+
+def diff(base: Dict, target: Dict) -> Dict:
+    """Delta turning design space ``base`` into ``target`` (both as dicts).
+
+    ``axes`` maps each new or changed axis to its changed fields, ``removed``
+    lists dropped axes, and ``order`` is only present when the axis order
+    isn't simply the base order with removals dropped and new axes appended.
+    """
+    delta: Dict = {}
+    for field in ("concept", "domain"):
+        if base.get(field) != target.get(field):
+            delta[field] = target.get(field)
+
+    base_axes = {axis["name"]: axis for axis in base["axes"]}
+    changed = {}
+    for axis in target["axes"]:
+        old = base_axes.get(axis["name"])
+        fields = {
+            key: value
+            for key, value in axis.items()
+            if key != "name" and (old is None or old.get(key) != value)
+        }
+        if fields or old is None:
+            changed[axis["name"]] = fields
+    if changed:
+        delta["axes"] = changed
+
+    names = [axis["name"] for axis in target["axes"]]
+    removed = [name for name in base_axes if name not in names]
+    if removed:
+        delta["removed"] = removed
+    expected = [name for name in base_axes if name not in removed] + [
+        name for name in names if name not in base_axes
+    ]
+    if expected != names:
+        delta["order"] = names
+    return delta
+
+
+def apply(base: Dict, delta: Dict) -> Dict:
+    """The design space ``delta`` (see ``diff``) turns ``base`` into."""
+    axes = {axis["name"]: dict(axis) for axis in base["axes"]}
+    order = [axis["name"] for axis in base["axes"]]
+    for name in delta.get("removed", []):
+        del axes[name]
+        order.remove(name)
+    for name, fields in delta.get("axes", {}).items():
+        if name not in axes:
+            axes[name] = {"name": name}
+            order.append(name)
+        axes[name].update(fields)
+    return {
+        "concept": delta.get("concept", base.get("concept")),
+        "domain": delta.get("domain", base.get("domain")),
+        "axes": [axes[name] for name in delta.get("order", order)],
+    }
+
+
+def _unique_axes(design_space: Dict) -> bool:
+    names = [axis["name"] for axis in design_space["axes"]]
+    return len(set(names)) == len(names)
+
+
+# ----------------------------------------------------------------------
+# Reconstruction
+# ----------------------------------------------------------------------
+
+
+def design_spaces(steps: List[Dict]) -> List[Optional[Dict]]:
+    """Every step's design space, in one forward pass.
+
+    None for steps that can't be reconstructed here: archived stubs (see
+    archive.py) and deltas whose base is one of them.
+    """
+    spaces: List[Optional[Dict]] = []
+    current: Optional[Dict] = None
+    for step in steps:
+        if step.get(KEYFRAME):
+            current = json.loads(step[KEYFRAME])
+        elif step.get(DELTA) and current is not None:
+            current = apply(current, json.loads(step[DELTA]))
+        else:
+            current = None
+        spaces.append(current)
+    return spaces
+
+
+def design_space_at(steps: List[Dict], index: int) -> Optional[Dict]:
+    """Step ``index``'s design space, replayed from the nearest keyframe."""
+    start = index
+    while start >= 0 and not steps[start].get(KEYFRAME):
+        if not steps[start].get(DELTA):
+            return None
+        start -= 1
+    if start < 0:
+        return None
+    return design_spaces(steps[start : index + 1])[-1]
+
+
+def changes(steps: List[Dict], index: int) -> Optional[Dict]:
+    """What changed in the design space at step ``index`` (a delta, see ``diff``)."""
+    step = steps[index]
+    if step.get(DELTA):
+        return json.loads(step[DELTA])
+    if index == 0 or not step.get(KEYFRAME):
+        return None
+    previous = design_space_at(steps, index - 1)
+    return diff(previous, json.loads(step[KEYFRAME])) if previous else None
+
+
+def expand_steps(steps: List[Dict]) -> List[Dict]:
+    """``steps`` with every delta-encoded step given its full ``design_space``,
+    for readers of the whole history (figure, ablation viewer, export)."""
+    spaces = design_spaces(steps)
+    return [
+        {**step, KEYFRAME: json.dumps(space)}
+        if step.get(DELTA) and space is not None
+        else step
+        for step, space in zip(steps, spaces)
+    ]
+
+
+# ----------------------------------------------------------------------
+# Encoding
+# ----------------------------------------------------------------------
+
+
+def encode(steps: List[Dict], design_space: Dict) -> Dict:
+    """Design space fields for a new step appended after ``steps``."""
+    since_keyframe = 0
+    for step in reversed(steps):
+        if not step.get(DELTA):
+            break
+        since_keyframe += 1
+    previous = (
+        design_space_at(steps, len(steps) - 1)
+        if steps and since_keyframe < KEYFRAME_INTERVAL - 1
+        else None
+    )
+    if (
+        previous is None
+        or previous.get("concept") != design_space.get("concept")
+        or not (_unique_axes(previous) and _unique_axes(design_space))
+    ):
+        return {KEYFRAME: json.dumps(design_space)}
+    return {DELTA: json.dumps(diff(previous, design_space))}
@@ -1,10 +1,14 @@
 import re
-from typing import List
+import threading
+from typing import Dict, List
 from pydantic import BaseModel
 from models.llms import text_model, llm_call
+from cancellation import CancelToken
+from conceptindex import ConceptIndex, concept_index
 from models.prompts import (
     fill_design_space_prompt,
     create_design_space_prompt,
+    explore_all_axes_prompt,
     explore_axis_prompt,
 )
 
@@ -26,12 +30,57 @@ class DesignSpace(BaseModel):
         )
 
     @staticmethod
-    def create(concept: str, domain: str, model: str = text_model, context: str | None = None):
+    def create(
+        concept: str,
+        domain: str,
+        model: str = text_model,
+        context: str | None = None,
+        cancel: CancelToken | None = None,
+        index: ConceptIndex | None = concept_index,
+    ):
+        # Near-duplicate concepts reuse previously generated axes. Extra
+        # context makes the request specific, so it always goes to the LLM.
+        if index is not None and context is None:
+            hit = index.lookup(domain, concept)
+            if hit is not None:
+                axis_names, _score = hit
+                if index.refresh:
+                    threading.Thread(
+                        target=DesignSpace._index_axes,
+                        args=(concept, domain, model, index),
+                        daemon=True,
+                    ).start()
+                return DesignSpace(
+                    concept=concept,
+                    domain=domain,
+                    axes=[
+                        Axis(name=name, status="unconstrained", value="")
+                        for name in axis_names
+                    ],
+                )
+
+        axes = [
+            Axis(name=name, status="unconstrained", value="")
+            for name in DesignSpace._generate_axes(concept, domain, model, context, cancel)
+        ]
+        if index is not None and context is None:
+            index.add(domain, concept, [axis.name for axis in axes])
+
+        return DesignSpace(concept=concept, domain=domain, axes=axes)
+
+    @staticmethod
+    def _generate_axes(
+        concept: str,
+        domain: str,
+        model: str = text_model,
+        context: str | None = None,
+        cancel: CancelToken | None = None,
+    ) -> List[str]:
         prompt = create_design_space_prompt.format(concept=concept, domain=domain)
         if context:
             prompt += "\n\nHere is additional context to inform the design space:\n" + context
 
-        response = llm_call(prompt, model=model)
+        response = llm_call(prompt, model=model, cancel=cancel, stage="create")
 
         axes = []
         axes_parts = response.split("<axis>")
@@ -39,11 +88,19 @@ class DesignSpace(BaseModel):
             for axis in axes_parts[1:]:
                 if "</axis>" in axis:
                     axis_name = axis.split("</axis>")[0].strip()
-                    axes.append(Axis(name=axis_name, status="unconstrained", value=""))
+                    axes.append(axis_name)
                 else:
                     continue
 
-        return DesignSpace(concept=concept, domain=domain, axes=axes)
+        return axes
+
+    @staticmethod
+    def _index_axes(concept: str, domain: str, model: str, index: ConceptIndex) -> None:
+        """Background refresh of a reused axis set."""
+        try:
+            index.add(domain, concept, DesignSpace._generate_axes(concept, domain, model))
+        except Exception as e:
+            print(f"Failed to refresh axes for {concept!r}: {e}")
 
     def get_axis(self, name: str) -> Axis:
         for axis in self.axes:
@@ -59,7 +116,9 @@ class DesignSpace(BaseModel):
                     axis.status = "exploring"
                     return
 
-    def explore(self, n: int, model: str = text_model) -> List[str]:
+    def explore(
+        self, n: int, model: str = text_model, cancel: CancelToken | None = None
+    ) -> List[str]:
         exploring_axis = [axis for axis in self.axes if axis.status == "exploring"][0]
         for axis in self.axes:
             if axis != exploring_axis and axis.status == "exploring":
@@ -72,6 +131,8 @@ class DesignSpace(BaseModel):
                 concept=self.concept, domain=self.domain, axis=exploring_axis.name, n=n
             ),
             model=model,
+            cancel=cancel,
+            stage="explore",
         )
 
         print(response)
@@ -86,7 +147,70 @@ class DesignSpace(BaseModel):
 
         return options
 
-    def fill(self, model: str = text_model):
+    def explore_all(
+        self, n: int, model: str = text_model, cancel: CancelToken | None = None
+    ) -> List[Dict[str, str]]:
+        """
+        Propose ``n`` complete fills of every axis with a single call, each
+        as {axis name: value}. Axes a fill leaves out keep their current value.
+        The model may return fewer (or unparseable) designs, so callers get
+        at most ``n``; see ``fill_all`` for topping them up.
+        """
+        response = llm_call(
+            explore_all_axes_prompt.format(
+                concept=self.concept,
+                domain=self.domain,
+                axes="\n".join(axis.name for axis in self.axes),
+                n=n,
+            ),
+            model=model,
+            cancel=cancel,
+            stage="explore",
+        )
+
+        fills = []
+        for design in re.findall(r"<design>(.*?)</design>", response, re.DOTALL):
+            values = {
+                name.strip(): value.strip()
+                for name, value in re.findall(
+                    r'<axis name="([^"]+)">(.*?)</axis>', design, re.DOTALL
+                )
+            }
+            if not any(values.get(axis.name) for axis in self.axes):
+                continue  # nothing usable in this block
+            fills.append(
+                {axis.name: values.get(axis.name) or axis.value for axis in self.axes}
+            )
+        return fills
+
+    def fill_all(
+        self, model: str = text_model, cancel: CancelToken | None = None
+    ) -> Dict[str, str]:
+        """One fresh fill of every axis, as {axis name: value}, with its own
+        call; this design space is left untouched."""
+        space = self.with_values({axis.name: "" for axis in self.axes}, "unconstrained")
+        space.fill(model=model, cancel=cancel)
+        return {axis.name: axis.value for axis in space.axes}
+
+    def with_values(
+        self, values: Dict[str, str], status: str | None = None
+    ) -> "DesignSpace":
+        """A copy with the given axis values (and every status set to
+        ``status``, if given); this design space is left untouched."""
+        return self.model_copy(
+            update={
+                "axes": [
+                    Axis(
+                        name=axis.name,
+                        status=status or axis.status,
+                        value=values.get(axis.name, axis.value),
+                    )
+                    for axis in self.axes
+                ]
+            }
+        )
+
+    def fill(self, model: str = text_model, cancel: CancelToken | None = None):
         """
         Fill in all unconstrained axes with a value.
         """
@@ -108,6 +232,8 @@ class DesignSpace(BaseModel):
                 concept=self.concept, domain=self.domain, axes=unconstrained_axes_str
             ),
             model=model,
+            cancel=cancel,
+            stage="fill",
         )
 
         for axis_line in response.strip().split("\n"):
@@ -129,9 +255,14 @@ class Tag(BaseModel):
 class Generation(BaseModel):
     prompt: str
     content: str
+    seed: int | None = None
+    # True for a fast low-quality first tier that can be refined later
+    preview: bool = False
 
 
 class Example(BaseModel):
     prompt: str
     content: str
     tags: List[Tag]
+    seed: int | None = None
+    preview: bool = False
@@ -1,12 +1,21 @@
 import os
+import re
 from abc import ABC, abstractmethod
+from typing import Callable
 from designspace import Generation
 from rich.console import Console
 from models.llms import text_model
 from designspace import DesignSpace
+from cancellation import CancelToken
 
 
 class Domain(ABC):
+    # Whether generate_one reports incremental content through on_delta
+    streams_content = False
+    # Whether refine can turn a preview into its full-quality version; only
+    # such domains honour ``preview``
+    supports_refine = False
+
     def __init__(
         self,
         name: str,
@@ -15,6 +24,9 @@ class Domain(ABC):
         model: str = text_model,
         scripts_path: str = "",
         console: Console = Console(),
+        single_pass: bool = False,
+        include_prompt: bool = True,
+        preview: bool = False,
     ):
         self.name = name
         self.display_name = display_name
@@ -22,9 +34,108 @@ class Domain(ABC):
         self.model = model
         self.scripts_path = scripts_path
         self.console = console
+        # Fuse prompt expansion and generation into one call, where supported
+        self.single_pass = single_pass
+        # In single-pass mode, also ask for the expansion so Generation.prompt is filled
+        self.include_prompt = include_prompt
+        # Generate cheap previews first and refine them on demand, where supported
+        self.preview = preview and self.supports_refine
 
     @abstractmethod
     def generate_one(
-        self, concept: str, design_space: DesignSpace, model: str = text_model
+        self,
+        concept: str,
+        design_space: DesignSpace,
+        model: str = text_model,
+        cancel: CancelToken | None = None,
+        on_prompt: Callable[[str], None] | None = None,
+        on_delta: Callable[[str], None] | None = None,
+        on_reset: Callable[[], None] | None = None,
     ) -> Generation:
+        """Generate one example. Implementations should pass ``cancel`` on to
+        every network call so an abandoned build stops as soon as possible, and
+        report the expanded prompt through ``on_prompt`` as soon as it exists
+        so tagging can run while the content is still being generated.
+        Domains with ``streams_content`` report pieces of the final content
+        through ``on_delta`` as they arrive, and call ``on_reset`` when the
+        content streamed so far is void (the model call failed over and starts
+        again); others ignore both."""
         pass
+
+    def refine(
+        self, generation: Generation, cancel: CancelToken | None = None
+    ) -> Generation:
+        """Produce the full-quality version of a preview generation. Domains
+        without ``supports_refine`` never make previews, so their generations
+        are already full quality and come back unchanged."""
+        return generation
+
+
+def extract_section(response: str, tag: str) -> str | None:
+    """Return the stripped contents of the first ``<tag>...</tag>`` in ``response``."""
+    match = re.search(rf"<{tag}>(.*?)(?:</{tag}>|$)", response, re.DOTALL)
+    return match.group(1).strip() if match else None
+
+
+class SectionStream:
+    """Forwards only the streamed text inside ``<tag>...</tag>`` to ``on_delta``.
+
+    Used when a streamed response wraps the content in XML sections (e.g. a
+    single-pass ``<prompt>`` followed by ``<text>``) so the client only ever
+    sees the content itself. Tags split across deltas are handled by holding
+    back any suffix that could still turn into one.
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        on_delta: Callable[[str], None],
+        on_reset: Callable[[], None] | None = None,
+    ):
+        self.open_tag = f"<{tag}>"
+        self.close_tag = f"</{tag}>"
+        self.on_delta = on_delta
+        self.on_reset = on_reset
+        self.inside = False
+        self.finished = False
+        self.emitted = False
+        self.buffer = ""
+
+    def feed(self, delta: str) -> None:
+        if self.finished:
+            return
+        self.buffer += delta
+        if not self.inside:
+            start = self.buffer.find(self.open_tag)
+            if start < 0:
+                self.buffer = self.buffer[-(len(self.open_tag) - 1) :]
+                return
+            self.inside = True
+            self.buffer = self.buffer[start + len(self.open_tag) :]
+        end = self.buffer.find(self.close_tag)
+        if end >= 0:
+            self.finished = True
+            self._emit(self.buffer[:end])
+            self.buffer = ""
+            return
+        # Hold back anything that might be the beginning of the closing tag
+        safe = len(self.buffer)
+        for i in range(1, len(self.close_tag)):
+            if self.buffer.endswith(self.close_tag[:i]):
+                safe = len(self.buffer) - i
+        self._emit(self.buffer[:safe])
+        self.buffer = self.buffer[safe:]
+
+    def reset(self) -> None:
+        """Start over with a new response (after a failover)."""
+        self.inside = self.finished = self.emitted = False
+        self.buffer = ""
+        if self.on_reset:
+            self.on_reset()
+
+    def _emit(self, text: str) -> None:
+        if not self.emitted:
+            text = text.lstrip("\n")
+        if text:
+            self.emitted = True
+            self.on_delta(text)
@@ -1,6 +1,21 @@
+// Images are stored as "blob:<sha256>" references to variants transcoded at
+// several widths (see ingest.py); the server picks AVIF/WebP per request.
+// Examples from before that are inline base64 PNGs.
+const IMAGE_WIDTHS = { thumb: 128, grid: 256, full: 512 };
+
 function render(container, content) {
   const imgElement = document.createElement("img");
-  imgElement.src = `data:image/png;base64,${content}`;
+  if (content.startsWith("blob:")) {
+    const base = `/api/blob/${content.slice("blob:".length)}`;
+    imgElement.srcset = Object.entries(IMAGE_WIDTHS)
+      .map(([size, width]) => `${base}/${size} ${width}w`)
+      .join(", ");
+    imgElement.sizes = `${container.clientWidth || IMAGE_WIDTHS.grid}px`;
+    imgElement.src = `${base}/grid`;
+    imgElement.decoding = "async";
+  } else {
+    imgElement.src = `data:image/png;base64,${content}`;
+  }
   imgElement.className = "w-full h-full object-contain";
 
   container.appendChild(imgElement);
@@ -1,13 +1,22 @@
-import base64
-import fal_client
+import random
+import time
+from typing import Callable, Tuple
 import requests
 from designspace import DesignSpace, Generation
 from domains.domain import Domain
+from models.cassette import cassette
 from models.llms import llm_call, text_model
+from models.usage import call_budget, usage
 from rich.console import Console
+from cancellation import CancelToken, GenerationCancelled
+from domains.imagegen.ingest import ingest_image
 
 img_model = "fal-ai/flux/schnell"
 
+# Fast first tier of preview mode; refinement renders at full size (512)
+preview_image_size = 256
+preview_inference_steps = 2
+
 image_gen_expand_system_prompt = """
 You are a helpful assistant that expands prompts for image generation.
 You will be given a concept and a list of examples.
@@ -26,47 +35,108 @@ Here is a precise description of what needs to be constrained in your expanded p
 {design_space}
 """
 
-def expand_prompt(concept: str, design_space: DesignSpace, model: str = text_model, examples: str = "") -> str:
-    return llm_call(image_gen_expand_user_prompt.format(concept=concept, design_space=design_space, examples=examples), system_prompt=image_gen_expand_system_prompt, temperature=1, model=model)
-
-def generate_image(concept: str, design_space: DesignSpace, image_model: str = img_model, text_model: str = text_model) -> Generation:
-    prompt = expand_prompt(concept, design_space, text_model)
-
-    def on_queue_update(update):
-        if isinstance(update, fal_client.InProgress):
-            for log in update.logs:
-                print(log["message"])
-
-    result = fal_client.subscribe(
-        image_model,
-        arguments={
-            "prompt": prompt,
-            "image_size": {
-                "width": 512,
-                "height": 512
-            }
-        },
-        with_logs=True,
-        on_queue_update=on_queue_update,
-    )
+def expand_prompt(concept: str, design_space: DesignSpace, model: str = text_model, examples: str = "", cancel: CancelToken | None = None) -> str:
+    return llm_call(image_gen_expand_user_prompt.format(concept=concept, design_space=design_space, examples=examples), system_prompt=image_gen_expand_system_prompt, temperature=1, model=model, cancel=cancel, stage="expand_prompt")
+
+def render_image(prompt: str, image_model: str = img_model, size: int = 512, num_inference_steps: int | None = None, seed: int | None = None, cancel: CancelToken | None = None) -> Tuple[str, int | None]:
+    """Render ``prompt`` with the image model and return ``(blob ref, seed)``.
+
+    The image is stored with its transcoded variants (see ingest.py) and
+    referenced from the example instead of being inlined.
+    """
+    arguments = {
+        "prompt": prompt,
+        "image_size": {
+            "width": size,
+            "height": size
+        }
+    }
+    if num_inference_steps is not None:
+        arguments["num_inference_steps"] = num_inference_steps
+    if seed is not None:
+        arguments["seed"] = seed
+
+    # Cassettes match renders without the seed: preview seeds are random, and
+    # a replayed render returns the seed it was recorded with
+    recorded = {"model": image_model, "prompt": prompt, "size": size, "num_inference_steps": num_inference_steps}
+    if cassette.replaying:
+        with call_budget.slot():
+            data, seed = cassette.replay_image(recorded, cancel)
+        usage.record_image(image_model)
+        return ingest_image(data), seed
+    started = time.monotonic()
+
+    # Imported on first render so starting the server doesn't pay for it
+    import fal_client
+
+    # Same as fal_client.subscribe, but keeps the handle so a cancelled build
+    # can drop the request from fal's queue (or abort it mid-inference).
+    with call_budget.slot():
+        handle = fal_client.submit(image_model, arguments=arguments)
+        unregister = cancel.on_cancel(handle.cancel) if cancel else lambda: None
+        try:
+            for update in handle.iter_events(with_logs=True):
+                if cancel:
+                    cancel.raise_if_cancelled()
+                if isinstance(update, fal_client.InProgress):
+                    for log in update.logs:
+                        print(log["message"])
+            result = handle.get()
+        except GenerationCancelled:
+            raise
+        except Exception:
+            if cancel:
+                cancel.raise_if_cancelled()
+            raise
+        finally:
+            unregister()
+    usage.record_image(image_model)
     image_url = result['images'][0]['url']
     print(image_url)
 
+    if cancel:
+        cancel.raise_if_cancelled()
     response = requests.get(image_url)
-    image_data = response.content
-    image_base64 = base64.b64encode(image_data).decode('utf-8').replace('"', '\\"')
+    if cassette.recording:
+        cassette.record_image(recorded, response.content, result.get("seed", seed), time.monotonic() - started)
+    image_ref = ingest_image(response.content)
 
-    return Generation(prompt=prompt, content=image_base64)
+    return image_ref, result.get("seed", seed)
+
+def generate_image(concept: str, design_space: DesignSpace, image_model: str = img_model, text_model: str = text_model, cancel: CancelToken | None = None, on_prompt: Callable[[str], None] | None = None, preview: bool = False) -> Generation:
+    prompt = expand_prompt(concept, design_space, text_model, cancel=cancel)
+    if on_prompt:
+        on_prompt(prompt)
+
+    if not preview:
+        image_ref, seed = render_image(prompt, image_model, cancel=cancel)
+        return Generation(prompt=prompt, content=image_ref, seed=seed)
+
+    # Fix the seed up front so refining reproduces the same composition
+    seed = random.randint(0, 2**31 - 1)
+    image_ref, seed = render_image(prompt, image_model, size=preview_image_size, num_inference_steps=preview_inference_steps, seed=seed, cancel=cancel)
+    return Generation(prompt=prompt, content=image_ref, seed=seed, preview=True)
+
+def refine_image(prompt: str, seed: int | None, image_model: str = img_model, cancel: CancelToken | None = None) -> Generation:
+    """Re-render a preview at full resolution from its prompt and seed."""
+    image_ref, seed = render_image(prompt, image_model, seed=seed, cancel=cancel)
+    return Generation(prompt=prompt, content=image_ref, seed=seed)
 
 class ImageGen(Domain):
-    def __init__(self, data_dir: str, model: str = text_model, console: Console = Console()):
+    supports_refine = True
+
+    def __init__(self, data_dir: str, model: str = text_model, console: Console = Console(), preview: bool = False):
         super().__init__(
             name="image", 
             display_name="Image", 
             data_dir=data_dir, 
             model=model, 
             console=console, 
-            scripts_path="domains/imagegen/image_scripts.js")
+            scripts_path="domains/imagegen/image_scripts.js",
+            preview=preview)
+
+    def generate_one(self, concept: str, design_space: DesignSpace, model: str = text_model, cancel: CancelToken | None = None, on_prompt: Callable[[str], None] | None = None, on_delta: Callable[[str], None] | None = None, on_reset: Callable[[], None] | None = None) -> Generation:
+        return generate_image(concept, design_space, text_model=model, cancel=cancel, on_prompt=on_prompt, preview=self.preview)
 
-    def generate_one(self, concept: str, design_space: DesignSpace, model: str = text_model) -> Generation:
-        return generate_image(concept, design_space, text_model=model)
+    def refine(self, generation: Generation, cancel: CancelToken | None = None) -> Generation:
+        return refine_image(generation.prompt, generation.seed, cancel=cancel)
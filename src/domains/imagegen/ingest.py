@@ -0,0 +1,168 @@
+import base64
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from blobstore import BlobStore, blob_ref, blobs, parse_blob_ref
+
+# Longest side of each variant: the overview and figure use thumbnails, the
+# gallery grid shows cells of roughly 256px, and full is the model's output
+SIZES = {"thumb": 128, "grid": 256, "full": 512}
+# Best first; formats this Pillow build can't encode are skipped
+FORMATS = ("avif", "webp")
+SAVE_OPTIONS = {
+    "avif": {"quality": 55, "speed": 8},
+    "webp": {"quality": 80, "method": 4},
+}
+MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+}
+TRANSCODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_formats: Optional[List[str]] = None
+
+
+def available_formats() -> List[str]:
+    global _formats
+    if _formats is None:
+        from PIL import features  # type: ignore
+
+        _formats = [fmt for fmt in FORMATS if features.check(fmt)]
+    return _formats
+
+
+def _sniff_ext(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data.startswith(b"\xff\xd8"):
+        return "jpg"
+    if data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+def transcode(data: bytes, formats: List[str]) -> Dict[str, bytes]:
+    """Encode an image at every size in every format, e.g. ``{"grid.webp": ...}``.
+
+    Runs in the transcoding worker pool. Images are only ever scaled down.
+    """
+    from PIL import Image  # type: ignore
+
+    image = Image.open(BytesIO(data))
+    image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    variants = {}
+    for size_name, size in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for fmt in formats:
+            out = BytesIO()
+            resized.save(out, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+            variants[f"{size_name}.{fmt}"] = out.getvalue()
+    return variants
+
+
+def _transcode_pool() -> concurrent.futures.ProcessPoolExecutor:
+    # Encoding (AVIF especially) is CPU-bound, so it runs in processes
+    # rather than in the generation threads. The pool is started lazily from
+    # a threaded server, where forking could copy locks held by other
+    # threads into the children, so its processes are never plain forks.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=TRANSCODE_WORKERS,
+                mp_context=multiprocessing.get_context(
+                    "forkserver" if "forkserver" in methods else "spawn"
+                ),
+            )
+        return _pool
+
+
+def _variants(sha: str, data: bytes, store: BlobStore) -> None:
+    """Transcode the original into every missing variant."""
+    formats = available_formats()
+    names = [f"{size}.{fmt}" for size in SIZES for fmt in formats]
+    if not all(store.has(sha, name) for name in names):
+        variants = _transcode_pool().submit(transcode, data, formats).result()
+        for name, variant in variants.items():
+            store.write(sha, name, variant)
+
+
+def ingest_image(data: bytes, store: BlobStore = blobs) -> str:
+    """Store a generated image with its variants and return its ``blob:`` ref."""
+    sha = store.put(data, _sniff_ext(data))
+    _variants(sha, data, store)
+    return blob_ref(sha)
+
+
+# ----------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------
+
+
+def _best_variant(sha: str, size: str, accept: str, store: BlobStore):
+    for fmt in FORMATS:
+        path = store.locate(sha, f"{size}.{fmt}") if MEDIA_TYPES[fmt] in accept else None
+        if path is not None:
+            return path, MEDIA_TYPES[fmt]
+    return None
+
+
+def variant_file(
+    sha: str, size: str, accept: str = "", store: BlobStore = blobs
+) -> Optional[Tuple[str, str]]:
+    """``(path, media type)`` of the best variant of ``size`` for an Accept header.
+
+    Variants missing on disk (e.g. after a redeploy) are rebuilt from the
+    original. Falls back to the original when no variant in an accepted
+    format exists (e.g. images stored before transcoding, or
+    ``size="original"``).
+    """
+    if size not in SIZES and size != "original":
+        return None
+    if size in SIZES:
+        found = _best_variant(sha, size, accept, store)
+        if found is not None:
+            return found
+    original = store.original(sha)
+    if original is None:
+        return None
+    if size in SIZES and any(MEDIA_TYPES[fmt] in accept for fmt in available_formats()):
+        _variants(sha, store.read(sha, original), store)
+        found = _best_variant(sha, size, accept, store)
+        if found is not None:
+            return found
+    media_type = MEDIA_TYPES.get(original.split(".")[1], "application/octet-stream")
+    return store.locate(sha, original), media_type
+
+
+def image_url(content: str, size: str = "grid") -> str:
+    """URL for an example's image: its ``size`` variant, or a data URI for
+    examples stored inline as base64."""
+    sha = parse_blob_ref(content)
+    if sha is None:
+        return f"data:image/png;base64,{content}"
+    return f"/api/blob/{sha}/{size}"
+
+
+def image_bytes(content: str, size: str = "grid", store: BlobStore = blobs) -> bytes:
+    """Encoded image for an example's content (a ``blob:`` ref or inline base64)."""
+    sha = parse_blob_ref(content)
+    if sha is None:
+        return base64.b64decode(content)
+    found = variant_file(sha, size, ",".join(MEDIA_TYPES.values()), store)
+    if found is None:
+        raise FileNotFoundError(f"Missing image blob {sha}")
+    with open(found[0], "rb") as f:
+        return f.read()
@@ -1,10 +1,16 @@
 function render(container, content) {
   container.className = "relative";
 
-  // Create image element
-  const textElement = document.createElement("div");
-  textElement.innerHTML = content.replace("\n", " <br> <br>");
-  textElement.className = "p-4 text-sm w-full overflow-y-auto aspect-square font-serif pb-24";
+  // Streamed deltas are appended to the text element created by the first call
+  let textElement = container.querySelector(".text-content");
+  if (!textElement) {
+    textElement = document.createElement("div");
+    textElement.dataset.raw = "";
+    textElement.className =
+      "text-content p-4 text-sm w-full overflow-y-auto aspect-square font-serif pb-24";
+    container.appendChild(textElement);
+  }
 
-  container.appendChild(textElement);
+  textElement.dataset.raw += content;
+  textElement.innerHTML = textElement.dataset.raw.replace("\n", " <br> <br>");
 }
@@ -1,8 +1,10 @@
 import base64
+from typing import Callable
 from designspace import DesignSpace, Generation
-from domains.domain import Domain
+from domains.domain import Domain, SectionStream, extract_section
 from models.llms import llm_call, text_model
 from rich.console import Console
+from cancellation import CancelToken
 
 text_gen_expand_system_prompt = """
 You are a helpful assistant that expands prompts for text generation.
@@ -22,23 +24,91 @@ Here is a precise description of what needs to be constrained in your expanded p
 {design_space}
 """
 
-def expand_prompt(concept: str, design_space: DesignSpace, model: str = text_model, examples: str = "") -> str:
-    return llm_call(text_gen_expand_user_prompt.format(concept=concept, design_space=design_space, examples=examples), system_prompt=text_gen_expand_system_prompt, temperature=1, model=model)
+text_gen_single_pass_system_prompt = """
+You are a helpful assistant that writes text for a given concept.
+You will be given a concept and a precise description of what needs to be constrained in the text.
+Write the text directly, following every constraint carefully.
+"""
+
+text_gen_single_pass_user_prompt = """
+Write text for the following concept:
+
+<concept>
+{concept}
+</concept>
+
+Here is a precise description of what needs to be constrained in the text:
+{design_space}
+{format_instructions}
+"""
+
+text_gen_single_pass_format = """
+First, write a detailed prompt describing the text you are about to write in a <prompt></prompt> XML tag. Then write the text itself in a <text></text> XML tag, like this:
 
-def generate_text(concept: str, design_space: DesignSpace, text_model: str = text_model) -> Generation:
-    prompt = expand_prompt(concept, design_space, text_model)
-    result = llm_call(prompt, temperature=1, model=text_model)
+<prompt>
+PROMPT HERE
+</prompt>
+<text>
+TEXT HERE
+</text>
+"""
+
+text_gen_single_pass_format_no_prompt = """
+Write the text in a <text></text> XML tag, like this:
+
+<text>
+TEXT HERE
+</text>
+"""
+
+def expand_prompt(concept: str, design_space: DesignSpace, model: str = text_model, examples: str = "", cancel: CancelToken | None = None) -> str:
+    return llm_call(text_gen_expand_user_prompt.format(concept=concept, design_space=design_space, examples=examples), system_prompt=text_gen_expand_system_prompt, temperature=1, model=model, cancel=cancel, stage="expand_prompt")
+
+def generate_text(concept: str, design_space: DesignSpace, text_model: str = text_model, cancel: CancelToken | None = None, on_prompt: Callable[[str], None] | None = None, on_delta: Callable[[str], None] | None = None, on_reset: Callable[[], None] | None = None) -> Generation:
+    prompt = expand_prompt(concept, design_space, text_model, cancel=cancel)
+    if on_prompt:
+        on_prompt(prompt)
+    result = llm_call(prompt, temperature=1, model=text_model, cancel=cancel, on_delta=on_delta, on_reset=on_reset, stage="text")
+    return Generation(prompt=prompt, content=result)
+
+def generate_text_single_pass(concept: str, design_space: DesignSpace, text_model: str = text_model, include_prompt: bool = True, cancel: CancelToken | None = None, on_prompt: Callable[[str], None] | None = None, on_delta: Callable[[str], None] | None = None, on_reset: Callable[[], None] | None = None) -> Generation:
+    """Expand and write the text in one call instead of two."""
+    section = SectionStream("text", on_delta, on_reset) if on_delta else None
+    response = llm_call(
+        text_gen_single_pass_user_prompt.format(
+            concept=concept,
+            design_space=design_space,
+            format_instructions=text_gen_single_pass_format if include_prompt else text_gen_single_pass_format_no_prompt,
+        ),
+        system_prompt=text_gen_single_pass_system_prompt,
+        temperature=1,
+        model=text_model,
+        cancel=cancel,
+        on_delta=section.feed if section else None,
+        on_reset=section.reset if section else None,
+        stage="text",
+    )
+    prompt = (extract_section(response, "prompt") if include_prompt else None) or f"{concept}\n{design_space}"
+    if on_prompt:
+        on_prompt(prompt)
+    result = extract_section(response, "text") or response
     return Generation(prompt=prompt, content=result)
 
 class TextGen(Domain):
-    def __init__(self, data_dir: str, model: str = text_model, console: Console = Console()):
+    streams_content = True
+
+    def __init__(self, data_dir: str, model: str = text_model, console: Console = Console(), single_pass: bool = False, include_prompt: bool = True):
         super().__init__(
             name="text", 
             display_name="Text", 
             data_dir=data_dir, 
             model=model, 
             console=console, 
-            scripts_path="domains/text/text_scripts.js")
+            scripts_path="domains/text/text_scripts.js",
+            single_pass=single_pass,
+            include_prompt=include_prompt)
 
-    def generate_one(self, concept: str, design_space: DesignSpace, model: str = text_model) -> Generation:
-        return generate_text(concept, design_space, text_model=model)
+    def generate_one(self, concept: str, design_space: DesignSpace, model: str = text_model, cancel: CancelToken | None = None, on_prompt: Callable[[str], None] | None = None, on_delta: Callable[[str], None] | None = None, on_reset: Callable[[], None] | None = None) -> Generation:
+        if self.single_pass:
+            return generate_text_single_pass(concept, design_space, text_model=model, include_prompt=self.include_prompt, cancel=cancel, on_prompt=on_prompt, on_delta=on_delta, on_reset=on_reset)
+        return generate_text(concept, design_space, text_model=model, cancel=cancel, on_prompt=on_prompt, on_delta=on_delta, on_reset=on_reset)
@@ -1,8 +1,10 @@
 import base64
+from typing import Callable
 from designspace import DesignSpace, Generation
-from domains.domain import Domain
+from domains.domain import Domain, extract_section
 from models.llms import llm_call, text_model
 from rich.console import Console
+from cancellation import CancelToken
 
 ui_gen_expand_system_prompt = """
 You are a helpful assistant that expands prompts that will be sent to a UI generation model.
@@ -22,6 +24,9 @@ Here is a precise description of what needs to be constrained in your expanded p
 {design_space}
 """
 
+# Model that writes the final HTML; quality matters more than latency here
+ui_model = "anthropic/claude-sonnet-4"
+
 ui_gen_system_prompt = """
 You must generate a UI element based on a given prompt.
 
@@ -38,9 +43,36 @@ The outer level of the UI must be a div element, with the w-full and h-full clas
 Make sure to follow every single instruction provided in the prompt carefully, and comment your code extensively.
 """
 
+ui_gen_single_pass_user_prompt = """
+Generate a UI for the following concept:
+
+<concept>
+{concept}
+</concept>
+
+Here is a precise description of what needs to be constrained in the UI:
+{design_space}
+{format_instructions}
+"""
+
+ui_gen_single_pass_format = """
+Before the UI, write a detailed prompt describing the UI you are about to build in a <prompt></prompt> XML tag, like this:
+
+<prompt>
+PROMPT HERE
+</prompt>
+<ui>
+<!-- UI HERE -->
+</ui>
+"""
+
 
 def expand_prompt(
-    concept: str, design_space: DesignSpace, model: str = text_model, examples: str = ""
+    concept: str,
+    design_space: DesignSpace,
+    model: str = text_model,
+    examples: str = "",
+    cancel: CancelToken | None = None,
 ) -> str:
     return llm_call(
         ui_gen_expand_user_prompt.format(
@@ -49,23 +81,74 @@ def expand_prompt(
         system_prompt=ui_gen_expand_system_prompt,
         temperature=1,
         model=model,
+        cancel=cancel,
+        stage="expand_prompt",
     )
 
 
 def generate_ui(
-    concept: str, design_space: DesignSpace, text_model: str = text_model
+    concept: str,
+    design_space: DesignSpace,
+    text_model: str = text_model,
+    cancel: CancelToken | None = None,
+    on_prompt: Callable[[str], None] | None = None,
 ) -> Generation:
-    prompt = expand_prompt(concept, design_space, text_model)
+    prompt = expand_prompt(concept, design_space, text_model, cancel=cancel)
+    if on_prompt:
+        on_prompt(prompt)
     result = llm_call(
-        prompt, model="anthropic/claude-sonnet-4", system_prompt=ui_gen_system_prompt
+        prompt,
+        model=ui_model,
+        system_prompt=ui_gen_system_prompt,
+        cancel=cancel,
+        stage="ui",
     )
     result = result.split("<ui>")[1].split("</ui>")[0].strip()
     return Generation(prompt=prompt, content=result)
 
 
+def generate_ui_single_pass(
+    concept: str,
+    design_space: DesignSpace,
+    include_prompt: bool = True,
+    cancel: CancelToken | None = None,
+    on_prompt: Callable[[str], None] | None = None,
+) -> Generation:
+    """Expand and build the UI in one call to the UI model instead of two.
+
+    Raises ``ValueError`` if the response has no UI in it.
+    """
+    response = llm_call(
+        ui_gen_single_pass_user_prompt.format(
+            concept=concept,
+            design_space=design_space,
+            format_instructions=ui_gen_single_pass_format if include_prompt else "",
+        ),
+        model=ui_model,
+        system_prompt=ui_gen_system_prompt,
+        cancel=cancel,
+        stage="ui",
+    )
+    result = extract_section(response, "ui")
+    if not result:
+        # Unlike text, the rest of the response is no usable UI
+        raise ValueError("Single-pass UI response has no <ui> section")
+    prompt = (
+        extract_section(response, "prompt") if include_prompt else None
+    ) or f"{concept}\n{design_space}"
+    if on_prompt:
+        on_prompt(prompt)
+    return Generation(prompt=prompt, content=result)
+
+
 class UIGen(Domain):
     def __init__(
-        self, data_dir: str, model: str = text_model, console: Console = Console()
+        self,
+        data_dir: str,
+        model: str = text_model,
+        console: Console = Console(),
+        single_pass: bool = False,
+        include_prompt: bool = True,
     ):
         super().__init__(
             name="ui",
@@ -74,9 +157,35 @@ class UIGen(Domain):
             model=model,
             console=console,
             scripts_path="domains/ui/ui_scripts.js",
+            single_pass=single_pass,
+            include_prompt=include_prompt,
         )
 
     def generate_one(
-        self, concept: str, design_space: DesignSpace, model: str = text_model
+        self,
+        concept: str,
+        design_space: DesignSpace,
+        model: str = text_model,
+        cancel: CancelToken | None = None,
+        on_prompt: Callable[[str], None] | None = None,
+        on_delta: Callable[[str], None] | None = None,
+        on_reset: Callable[[], None] | None = None,
     ) -> Generation:
-        return generate_ui(concept, design_space, text_model=model)
+        if self.single_pass:
+            try:
+                return generate_ui_single_pass(
+                    concept,
+                    design_space,
+                    include_prompt=self.include_prompt,
+                    cancel=cancel,
+                    on_prompt=on_prompt,
+                )
+            except ValueError as e:
+                self.console.print(f"{e}; generating it in two passes", style="yellow")
+        return generate_ui(
+            concept,
+            design_space,
+            text_model=model,
+            cancel=cancel,
+            on_prompt=on_prompt,
+        )
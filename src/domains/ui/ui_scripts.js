@@ -1,3 +1,28 @@
+// Generated UIs use arbitrary Tailwind classes that the prebuilt stylesheet
+// can't contain, so the in-browser Tailwind runtime is loaded for them, once
+// the first one renders (the rest of the page never waits on it).
+let tailwindRuntime = null;
+function loadTailwindRuntime() {
+  if (tailwindRuntime === null) {
+    tailwindRuntime = new Promise((resolve) => {
+      if (window.tailwind) {
+        resolve();
+        return;
+      }
+      const runtime = document.createElement("script");
+      runtime.src = "https://cdn.tailwindcss.com";
+      runtime.onload = () => {
+        const config = document.createElement("script");
+        config.src = "/static/tailwind.config.js";
+        config.onload = resolve;
+        document.head.appendChild(config);
+      };
+      document.head.appendChild(runtime);
+    });
+  }
+  return tailwindRuntime;
+}
+
 function render(container, content) {
   container.classList.add("relative", "group", "parent");
 
@@ -7,4 +32,5 @@ function render(container, content) {
   uiElement.style.zoom = "0.3";
 
   container.appendChild(uiElement);
+  loadTailwindRuntime();
 }
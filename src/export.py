@@ -0,0 +1,375 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import codec
+from archive import cold_archive
+from designhistory import expand_steps
+
+# pyarrow is an optional dependency (the "export" extra) only needed for
+# exporting; the rest of the app never imports this module.
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.dataset as ds  # type: ignore
+    from pyarrow import fs  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover – handled at runtime
+    pa = None  # type: ignore
+
+TABLES = ("sessions", "steps", "axes", "examples", "tags")
+PARTITIONING = ["domain", "date"]
+WATERMARK_FILE = "_watermark.json"
+
+
+# ----------------------------------------------------------------------
+# Flattening
+# ----------------------------------------------------------------------
+
+
+def _date(timestamp: Optional[str]) -> str:
+    return (timestamp or "")[:10] or "unknown"
+
+
+def content_ref(content: str) -> str:
+    """Stable reference to an example's (usually base64 image) content."""
+    if content.startswith("blob:"):
+        return content
+    return "sha256:" + hashlib.sha256(content.encode()).hexdigest()
+
+
+def flatten(
+    record: Dict, kind: str, since: str = "", include_content: bool = False
+) -> Dict[str, List[Dict]]:
+    """Turn one session or ablation record into rows for every table.
+
+    Only steps added or changed (``timestamp`` or ``updated_at``) after
+    ``since`` are emitted, and the record's own row only if it was created
+    after ``since``. A step changed after it was exported is exported
+    again; its rows with the latest ``updated_at`` are current.
+    """
+    rows: Dict[str, List[Dict]] = {table: [] for table in TABLES}
+    record_id = record["id"]
+    domain = record.get("domain") or "unknown"
+    created_at = record.get("created_at") or ""
+    steps = record.get("history" if kind == "ablation" else "generations") or []
+
+    if created_at > since:
+        rows["sessions"].append(
+            {
+                "id": record_id,
+                "kind": kind,
+                "domain": domain,
+                "date": _date(created_at),
+                "concept": record.get("concept"),
+                "user_name": record.get("user_name"),
+                "created_at": created_at,
+                "steps": len(steps),
+            }
+        )
+
+    for step_index, step in enumerate(steps):
+        timestamp = step.get("timestamp") or ""
+        updated_at = max(timestamp, step.get("updated_at") or "")
+        if updated_at <= since:
+            continue
+        key = {
+            "id": record_id,
+            "kind": kind,
+            "domain": domain,
+            "date": _date(timestamp),
+            "step": step_index,
+        }
+        design_space = json.loads(step.get("design_space") or "{}")
+        examples = codec.step_examples(step)
+        rows["steps"].append(
+            {
+                **key,
+                "timestamp": timestamp,
+                "updated_at": updated_at,
+                "concept": design_space.get("concept"),
+                "variant_index": step.get("variant_index"),
+                "prompt_index": step.get("prompt_index"),
+                "examples": len(examples),
+            }
+        )
+        for position, axis in enumerate(design_space.get("axes") or []):
+            rows["axes"].append(
+                {
+                    **key,
+                    "position": position,
+                    "name": axis.get("name"),
+                    "status": axis.get("status"),
+                    "value": axis.get("value"),
+                }
+            )
+        for example_index, example in enumerate(examples):
+            content = example.get("content") or ""
+            rows["examples"].append(
+                {
+                    **key,
+                    "example": example_index,
+                    "prompt": example.get("prompt"),
+                    "content_ref": content_ref(content),
+                    "content_bytes": len(content),
+                    "content": content if include_content else None,
+                    "seed": example.get("seed"),
+                    "preview": bool(example.get("preview")),
+                }
+            )
+            for tag in example.get("tags") or []:
+                rows["tags"].append(
+                    {
+                        **key,
+                        "example": example_index,
+                        "dimension": tag.get("dimension"),
+                        "value": tag.get("value"),
+                    }
+                )
+    return rows
+
+
+def _rehydrated(kind: str, record: Dict, steps_key: str, since: str = "") -> Dict:
+    """``record`` with the archived steps to export (changed after ``since``)
+    restored and every design space whole."""
+    steps = record.get(steps_key) or []
+    wanted = [
+        index
+        for index, step in enumerate(steps)
+        if step.get("archived")
+        and max(step.get("timestamp") or "", step.get("updated_at") or "") > since
+    ]
+    if wanted:
+        steps = cold_archive.rehydrate(kind, record["id"], steps, wanted)
+    return {**record, steps_key: expand_steps(steps)}
+
+
+def iter_records(database, since: str = "") -> Iterator[tuple[str, Dict]]:
+    """Records updated after ``since``, a page at a time (see
+    ``Database.iter_records``)."""
+    for session in database.iter_records("sessions", since):
+        yield "session", _rehydrated("sessions", session, "generations", since)
+    for ablation in database.iter_records("ablations", since):
+        yield "ablation", _rehydrated("ablations", ablation, "history", since)
+
+
+# ----------------------------------------------------------------------
+# Export / load
+# ----------------------------------------------------------------------
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError(
+            'Exporting requires pyarrow: install the "export" extra (pip install ".[export]")'
+        )
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    """Explicit schemas, so batches with all-null columns still line up."""
+    key = [
+        ("id", pa.string()),
+        ("kind", pa.string()),
+        ("domain", pa.string()),
+        ("date", pa.string()),
+        ("step", pa.int32()),
+    ]
+    return {
+        "sessions": pa.schema(
+            [
+                ("id", pa.string()),
+                ("kind", pa.string()),
+                ("domain", pa.string()),
+                ("date", pa.string()),
+                ("concept", pa.string()),
+                ("user_name", pa.string()),
+                ("created_at", pa.string()),
+                ("steps", pa.int32()),
+            ]
+        ),
+        "steps": pa.schema(
+            key
+            + [
+                ("timestamp", pa.string()),
+                ("updated_at", pa.string()),
+                ("concept", pa.string()),
+                ("variant_index", pa.int32()),
+                ("prompt_index", pa.int32()),
+                ("examples", pa.int32()),
+            ]
+        ),
+        "axes": pa.schema(
+            key
+            + [
+                ("position", pa.int32()),
+                ("name", pa.string()),
+                ("status", pa.string()),
+                ("value", pa.string()),
+            ]
+        ),
+        "examples": pa.schema(
+            key
+            + [
+                ("example", pa.int32()),
+                ("prompt", pa.string()),
+                ("content_ref", pa.string()),
+                ("content_bytes", pa.int64()),
+                ("content", pa.string()),
+                ("seed", pa.int64()),
+                ("preview", pa.bool_()),
+            ]
+        ),
+        "tags": pa.schema(
+            key
+            + [
+                ("example", pa.int32()),
+                ("dimension", pa.string()),
+                ("value", pa.string()),
+            ]
+        ),
+    }
+
+
+def read_watermark(out_dir: str) -> str:
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return ""
+    with open(path, "r") as f:
+        return json.load(f).get("watermark", "")
+
+
+def write_watermark(out_dir: str, watermark: str) -> None:
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"watermark": watermark, "exported_at": time.time()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def export(
+    database,
+    out_dir: str,
+    file_format: str = "parquet",
+    full: bool = False,
+    include_content: bool = False,
+    batch_records: int = 500,
+) -> Dict[str, int]:
+    """Export everything added or changed since the last watermark into ``out_dir``.
+
+    Each table is a dataset partitioned by domain and date
+    (``<out_dir>/<table>/domain=<d>/date=<yyyy-mm-dd>/``). Each run adds new
+    files next to the existing ones, so earlier exports are never rewritten.
+    Records are read a page at a time, then flattened and written in
+    batches of ``batch_records``, to bound memory.
+    """
+    _require_pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+    since = "" if full else read_watermark(out_dir)
+    if full:
+        for table in TABLES:
+            shutil.rmtree(os.path.join(out_dir, table), ignore_errors=True)
+    run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+    schemas = _schemas()
+    counts = {table: 0 for table in TABLES}
+    watermark = since
+    pending: Dict[str, List[Dict]] = {table: [] for table in TABLES}
+    batch = 0
+
+    def write_pending():
+        nonlocal batch
+        for table, rows in pending.items():
+            if not rows:
+                continue
+            ds.write_dataset(
+                pa.Table.from_pylist(rows, schema=schemas[table]),
+                os.path.join(out_dir, table),
+                format=file_format,
+                partitioning=PARTITIONING,
+                partitioning_flavor="hive",
+                basename_template=f"part-{run_id}-{batch}-{{i}}.{file_format}",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            counts[table] += len(rows)
+            rows.clear()
+        batch += 1
+
+    for n_records, (kind, record) in enumerate(iter_records(database, since), 1):
+        rows = flatten(record, kind, since, include_content)
+        for table, table_rows in rows.items():
+            pending[table].extend(table_rows)
+        # Records are found by their updated_at next time
+        watermark = max(watermark, record.get("updated_at") or "")
+        for step in rows["steps"]:
+            watermark = max(watermark, step["updated_at"])
+        for session in rows["sessions"]:
+            watermark = max(watermark, session["created_at"])
+        if n_records % batch_records == 0:
+            write_pending()
+    write_pending()
+
+    # Only advance the watermark once every table has been written
+    write_watermark(out_dir, watermark)
+    return counts
+
+
+def load_table(out_dir: str, table: str, file_format: str = "parquet"):
+    """Load an exported table with its partition columns.
+
+    Files are memory-mapped; with ``file_format="arrow"`` (uncompressed Arrow
+    IPC) the columns are used in place without copying.
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(
+        os.path.join(out_dir, table),
+        format=file_format,
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    return dataset.to_table()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Export sessions and ablations to partitioned Parquet/Arrow tables"
+    )
+    parser.add_argument(
+        "--out", type=str, default="../.data/export", help="Export directory"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default="parquet",
+        choices=["parquet", "arrow"],
+        help="parquet (compact) or arrow (uncompressed IPC, zero-copy loads)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the watermark and rebuild the export from scratch",
+    )
+    parser.add_argument(
+        "--include-content",
+        action="store_true",
+        help="Store example content inline instead of only a reference to it",
+    )
+    return parser.parse_args()
+
+
+def main():
+    from db import database
+
+    args = parse_args()
+    counts = export(
+        database,
+        args.out,
+        file_format=args.format,
+        full=args.full,
+        include_content=args.include_content,
+    )
+    print(", ".join(f"{count} {table}" for table, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
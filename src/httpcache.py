@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+# Brotli is optional; without it responses are negotiated down to gzip.
+try:
+    import brotli  # type: ignore
+except ModuleNotFoundError:  # pragma: no cover – handled at runtime
+    brotli = None  # type: ignore
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Upper bound on the (mostly compressed) bodies kept for versioned payloads
+PAYLOAD_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def etag_for(*parts: Any) -> str:
+    """Strong ETag for a payload identified by ``parts`` (ids, timestamps, ...)."""
+    digest = hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """The ETag of ``etag``'s payload as sent with ``encoding``: each encoding
+    is a different representation with different bytes, so it gets its own
+    strong ETag (``"<digest>-br"``, ``"<digest>-gzip"``, plain for identity)."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, or None."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
+
+
+class PayloadCache:
+    """LRU of encoded response bodies keyed by (ETag, encoding), bounded by size.
+
+    A versioned payload never changes under the same ETag, so it is
+    serialized and compressed once and then served from here.
+    """
+
+    def __init__(self, max_bytes: int = PAYLOAD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, Optional[str]], Tuple[bytes, Optional[str]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, Optional[str]]) -> Optional[Tuple[bytes, Optional[str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[str, Optional[str]], entry: Tuple[bytes, Optional[str]]) -> None:
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (body, _) = self._entries.popitem(last=False)
+                self._size -= len(body)
+
+
+payload_cache = PayloadCache()
+
+
+def _encode(payload: Any) -> bytes:
+    if isinstance(payload, BaseModel):
+        return payload.model_dump_json().encode()
+    return json.dumps(payload).encode()
+
+
+async def json_response(
+    request: Request, payload: Any, etag: Optional[str] = None
+) -> Response:
+    """JSON response with content negotiation, and ETag/304 handling if ``etag``
+    is given.
+
+    ``payload`` may be a callable producing the payload, so a request that
+    ends in 304 (or a cache hit) never builds or serializes it. Building,
+    serializing and compressing run in a worker thread: gallery payloads
+    are large enough to stall the event loop otherwise.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if etag is not None:
+        etag = representation_etag(etag, encoding)
+        # Clients may keep the body but must revalidate it on every use
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "private, no-cache"
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match == "*":
+            return Response(status_code=304, headers=headers)
+
+    entry = payload_cache.get((etag, encoding)) if etag is not None else None
+    if entry is None:
+
+        def encode() -> Tuple[bytes, Optional[str]]:
+            return compress(_encode(payload() if callable(payload) else payload), encoding)
+
+        entry = await asyncio.to_thread(encode)
+        if etag is not None:
+            payload_cache.put((etag, encoding), entry)
+
+    body, content_encoding = entry
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(content=body, media_type="application/json", headers=headers)
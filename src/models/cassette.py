@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cancellation import CancelToken, GenerationCancelled
+
+# Record model/image traffic to, or replay it from, a cassette directory
+DEFAULT_RECORD_DIR = os.getenv("CASSETTE_RECORD")
+DEFAULT_REPLAY_DIR = os.getenv("CASSETTE_REPLAY")
+# Replayed latency relative to the recorded one: 1 is as recorded, 0.25 four
+# times faster, 0 instant
+DEFAULT_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1"))
+
+KINDS = ("llm", "image")
+
+
+class CassetteMiss(LookupError):
+    """A replayed request that was never recorded."""
+
+
+def request_key(kind: str, request: Dict) -> str:
+    return hashlib.sha256(
+        json.dumps([kind, request], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def _sleep(seconds: float, cancel: CancelToken | None) -> None:
+    """Sleep, waking up (and raising) as soon as ``cancel`` is triggered."""
+    if seconds <= 0:
+        return
+    if cancel is None:
+        time.sleep(seconds)
+        return
+    woken = threading.Event()
+    unregister = cancel.on_cancel(woken.set)
+    try:
+        woken.wait(seconds)
+    finally:
+        unregister()
+    cancel.raise_if_cancelled()
+
+
+class Cassette:
+    """Recorded LLM and image-model traffic, for replaying it offline.
+
+    In record mode every completed call is appended to ``<dir>/<kind>.jsonl``
+    as request, response and timing (image bytes go to ``<dir>/images/``).
+    In replay mode calls are answered from those files instead of the
+    network, after the recorded latency times ``latency_scale``. Requests
+    are matched by content; one recorded several times is replayed in its
+    recorded order, so runs are deterministic.
+    """
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.directory: Optional[str] = None
+        self.latency_scale = DEFAULT_LATENCY_SCALE
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict]] = {}
+        self._played: Dict[str, int] = {}
+        if DEFAULT_REPLAY_DIR:
+            self.replay(DEFAULT_REPLAY_DIR)
+        elif DEFAULT_RECORD_DIR:
+            self.record(DEFAULT_RECORD_DIR)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, directory: str) -> None:
+        os.makedirs(os.path.join(directory, "images"), exist_ok=True)
+        self.mode, self.directory = "record", directory
+
+    def replay(self, directory: str, latency_scale: float | None = None) -> None:
+        entries: Dict[str, List[Dict]] = {}
+        for kind in KINDS:
+            path = os.path.join(directory, f"{kind}.jsonl")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries.setdefault(entry["key"], []).append(entry)
+        with self._lock:
+            self._entries, self._played = entries, {}
+        self.mode, self.directory = "replay", directory
+        if latency_scale is not None:
+            self.latency_scale = latency_scale
+
+    def off(self) -> None:
+        self.mode = self.directory = None
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _append(self, kind: str, key: str, request: Dict, entry: Dict) -> None:
+        line = json.dumps(
+            {
+                "key": key,
+                "recorded_at": datetime.now().isoformat(),
+                "request": request,
+                **entry,
+            }
+        )
+        with self._lock:
+            with open(os.path.join(self.directory, f"{kind}.jsonl"), "a") as f:
+                f.write(line + "\n")
+
+    def _next(self, kind: str, request: Dict) -> Dict:
+        key = request_key(kind, request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(
+                    f"No recorded {kind} call for this request ({key[:12]})"
+                )
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+        # Requests made more often than recorded cycle through the recordings
+        return entries[played % len(entries)]
+
+    # ------------------------------------------------------------------
+    # LLM calls
+    # ------------------------------------------------------------------
+
+    def record_llm(
+        self,
+        request: Dict,
+        call: Callable[[Callable[[str], None] | None, Dict], str],
+        on_delta: Callable[[str], None] | None,
+    ) -> str:
+        """Run ``call(on_delta, trace)`` and record it. ``trace`` collects the
+        provider's token usage; streamed pieces are recorded with their offsets."""
+        started = time.monotonic()
+        chunks: List[Tuple[float, str]] = []
+
+        def record_delta(delta: str) -> None:
+            chunks.append((round(time.monotonic() - started, 4), delta))
+            if on_delta:
+                on_delta(delta)
+
+        trace: Dict = {}
+        response = call(record_delta if on_delta else None, trace)
+        self._append(
+            "llm",
+            request_key("llm", request),
+            request,
+            {
+                "model": trace.get("model"),
+                "response": response,
+                "latency": round(time.monotonic() - started, 4),
+                "chunks": chunks,
+                "usage": trace.get("usage"),
+            },
+        )
+        return response
+
+    def replay_llm(
+        self,
+        request: Dict,
+        on_delta: Callable[[str], None] | None,
+        cancel: CancelToken | None,
+    ) -> Dict:
+        """The recorded call, after its (scaled) latency; streamed pieces are
+        delivered to ``on_delta`` at their recorded offsets."""
+        entry = self._next("llm", request)
+        elapsed = 0.0
+        if on_delta:
+            for offset, delta in entry.get("chunks") or []:
+                _sleep((offset - elapsed) * self.latency_scale, cancel)
+                elapsed = offset
+                on_delta(delta)
+            if not entry.get("chunks") and entry["response"]:
+                # Recorded without streaming: deliver it in one piece
+                _sleep(entry["latency"] * self.latency_scale, cancel)
+                elapsed = entry["latency"]
+                on_delta(entry["response"])
+        _sleep((entry["latency"] - elapsed) * self.latency_scale, cancel)
+        if cancel and cancel.cancelled:
+            raise GenerationCancelled()
+        return entry
+
+    # ------------------------------------------------------------------
+    # Image renders
+    # ------------------------------------------------------------------
+
+    def record_image(
+        self, request: Dict, data: bytes, seed: int | None, latency: float
+    ) -> None:
+        sha = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, "images", sha)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        self._append(
+            "image",
+            request_key("image", request),
+            request,
+            {
+                "image": sha,
+                "bytes": len(data),
+                "seed": seed,
+                "latency": round(latency, 4),
+            },
+        )
+
+    def replay_image(
+        self, request: Dict, cancel: CancelToken | None
+    ) -> Tuple[bytes, int | None]:
+        """The recorded image bytes and seed, after the (scaled) render latency."""
+        entry = self._next("image", request)
+        _sleep(entry["latency"] * self.latency_scale, cancel)
+        with open(os.path.join(self.directory, "images", entry["image"]), "rb") as f:
+            return f.read(), entry.get("seed")
+
+
+cassette = Cassette()
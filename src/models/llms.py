@@ -1,32 +1,64 @@
-from openai import OpenAI
 from pydantic import BaseModel
-import tiktoken
-from typing import List
+from typing import Callable, List
 import os
+import threading
 import dotenv
+from cancellation import CancelToken, GenerationCancelled
+from models.cassette import cassette
+from models.router import Candidate, router
+from models.usage import call_budget, usage
 
 dotenv.load_dotenv()
 
 text_model = "openai/gpt-4.1-mini"
 # text_model = "anthropic/claude-3.7-sonnet"
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
-
-cerebras_client = OpenAI(
-    base_url="https://api.cerebras.ai/v1",
-    api_key=os.getenv("CEREBRAS_API_KEY")
-)
-    
 cerebras_model = "llama-3.3-70b"
 
+# OpenAI-compatible endpoints, by provider name: (base_url, API key env var)
+providers = {
+    "openrouter": ("https://openrouter.ai/api/v1", "OPENROUTER_API_KEY"),
+    "cerebras": ("https://api.cerebras.ai/v1", "CEREBRAS_API_KEY"),
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider: str):
+    """The provider's client, created (and the openai package imported) on first use."""
+    client = _clients.get(provider)
+    if client is None:
+        from openai import OpenAI
+
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                base_url, api_key_env = providers[provider]
+                client = _clients[provider] = OpenAI(
+                    base_url=base_url, api_key=os.getenv(api_key_env)
+                )
+    return client
+
+
+def resolve_model(model: str) -> Candidate:
+    """Map a model string to a provider: "cerebras" or "cerebras/<model>" go to
+    Cerebras, everything else to OpenRouter."""
+    if model == "cerebras":
+        return Candidate(provider="cerebras", model=cerebras_model)
+    if model.startswith("cerebras/"):
+        return Candidate(provider="cerebras", model=model.split("/", 1)[1])
+    return Candidate(provider="openrouter", model=model)
+
 
 def llm_call(
     prompt: str,
     system_prompt: str = None,
     model: str = text_model,
+    cancel: CancelToken | None = None,
+    on_delta: Callable[[str], None] | None = None,
+    stage: str | None = None,
+    on_reset: Callable[[], None] | None = None,
     **kwargs
 ):
     """
@@ -36,6 +68,17 @@ def llm_call(
         `prompt` (`str`): The user prompt to send to the LLM.
         `system_prompt` (`str`, optional): System-level instructions for the LLM. Defaults to None.
         `model` (`str`, optional): Model identifier to use. Defaults to "gpt-4o-mini".
+        `cancel` (`CancelToken`, optional): When given, the completion is streamed so that
+            cancelling the token closes the connection mid-response. Defaults to None.
+        `on_delta` (`Callable[[str], None]`, optional): Called with each piece of the
+            completion as it streams in. Defaults to None.
+        `stage` (`str`, optional): Pipeline stage making the call. If the router has a
+            route for it, the router picks the model (overriding `model`) and fails
+            over between candidates. Defaults to None.
+        `on_reset` (`Callable[[], None]`, optional): Called when a candidate fails after
+            streaming part of its answer, before the next candidate streams its own from
+            the start; whatever `on_delta` received so far should be discarded. Without
+            it, later candidates are not streamed at all. Defaults to None.
 
     ### Returns:
         The LLM's response, either as raw text or as a parsed object according to `response_format`.
@@ -46,16 +89,110 @@ def llm_call(
     ]
     messages = [msg for msg in messages if msg is not None]
 
-    new_kwargs = {**kwargs, "model": model, "messages": messages}
+    # Recorded traffic is matched on what was asked, not which provider the
+    # router picked for it
+    if cassette.replaying:
+        with call_budget.slot():
+            entry = cassette.replay_llm(
+                {"messages": messages, "kwargs": kwargs}, on_delta, cancel
+            )
+        if entry.get("usage"):
+            usage.record_llm(entry["model"], *entry["usage"])
+        return entry["response"]
+
+    # Failover restarts the answer: the client must drop what the failed
+    # candidate streamed (or, if it can't, see nothing more of the stream)
+    streamed = False
+    forward = on_delta
+
+    def stream(delta: str) -> None:
+        nonlocal streamed
+        streamed = True
+        if forward:
+            forward(delta)
+
+    def complete(candidate: Candidate) -> str:
+        nonlocal streamed, forward
+        if streamed:
+            streamed = False
+            if on_reset:
+                on_reset()
+            else:
+                forward = None
+        deltas = stream if forward else None
+        with call_budget.slot():
+            if cassette.recording:
+                return cassette.record_llm(
+                    {"messages": messages, "kwargs": kwargs},
+                    lambda on_delta, trace: _complete(
+                        candidate, messages, cancel, on_delta, kwargs, trace
+                    ),
+                    deltas,
+                )
+            return _complete(candidate, messages, cancel, deltas, kwargs)
+
+    if router.handles(stage):
+        return router.call(stage, complete)
+    return complete(resolve_model(model))
+
+
+def _record_usage(candidate: Candidate, response_usage, trace: dict | None) -> None:
+    if response_usage is not None:
+        tokens = (
+            response_usage.prompt_tokens or 0,
+            response_usage.completion_tokens or 0,
+        )
+        usage.record_llm(candidate.model, *tokens)
+        if trace is not None:
+            trace["usage"] = tokens
+
 
-    if "cerebras" in model:
-        cur_client = cerebras_client
-        new_kwargs["model"] = cerebras_model
-    else:
-        cur_client = client
+def _complete(
+    candidate: Candidate,
+    messages: List[dict],
+    cancel: CancelToken | None,
+    on_delta: Callable[[str], None] | None,
+    kwargs: dict,
+    trace: dict | None = None,
+) -> str:
+    """One completion from ``candidate``. ``trace``, if given, receives the
+    model and token usage (for recording, see cassette.py)."""
+    if trace is not None:
+        trace["model"] = candidate.model
+    cur_client = get_client(candidate.provider)
+    new_kwargs = {**kwargs, "model": candidate.model, "messages": messages}
 
-    return cur_client.chat.completions.create(**new_kwargs).choices[0].message.content
+    if cancel is None and on_delta is None:
+        response = cur_client.chat.completions.create(**new_kwargs)
+        _record_usage(candidate, response.usage, trace)
+        return response.choices[0].message.content
 
+    if cancel:
+        cancel.raise_if_cancelled()
+    stream = cur_client.chat.completions.create(
+        **new_kwargs, stream=True, stream_options={"include_usage": True}
+    )
+    unregister = cancel.on_cancel(stream.close) if cancel else lambda: None
+    parts = []
+    try:
+        for chunk in stream:
+            if chunk.usage:
+                _record_usage(candidate, chunk.usage, trace)
+            if chunk.choices and chunk.choices[0].delta.content:
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+    except Exception:
+        # Closing the stream from another thread surfaces as a transport error
+        if cancel:
+            cancel.raise_if_cancelled()
+        raise
+    finally:
+        unregister()
+    if cancel and cancel.cancelled:
+        raise GenerationCancelled()
+    return "".join(parts)
 
 
 if __name__ == "__main__":
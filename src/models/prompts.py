@@ -33,6 +33,30 @@ Enclose each tag in <tag></tag> XML tags, like this, and return the list of tags
 </tags>
 """
 
+extract_tags_batch_prompt = """
+Here are {n} prompts, each enclosed in an <example> tag with its index:
+
+{examples}
+
+For every example, extract exactly one tag for each of these axes of the design space:
+{axes}
+
+Each tag should describe the value of the axis in that example in a concise manner (1-4 words)
+
+Return the tags for every example in a <tags></tags> XML tag, like this:
+
+<tags>
+<example index="0">
+<tag dimension="dimension_name">TAG HERE</tag>
+<tag dimension="dimension_name">TAG HERE</tag>
+</example>
+<example index="1">
+<tag dimension="dimension_name">TAG HERE</tag>
+<tag dimension="dimension_name">TAG HERE</tag>
+</example>
+</tags>
+"""
+
 fill_design_space_prompt = """
 Here is set of axes in the design space for a {domain} of a {concept}:
 
@@ -51,6 +75,29 @@ Return the design space in a <axes></axes> XML tag, like this:
 </axes>
 """
 
+explore_all_axes_prompt = """
+Here are the axes in the design space for a {domain} of a {concept}:
+
+<axes>
+{axes}
+</axes>
+
+Create {n} complete designs, each with a value for every axis. They should be meaningfully different from each other and together cover the design space, varying several axes at once.
+
+Return the designs in a <designs></designs> XML tag, like this:
+
+<designs>
+<design>
+<axis name="AXIS NAME HERE">AXIS VALUE HERE</axis>
+<axis name="AXIS NAME HERE">AXIS VALUE HERE</axis>
+</design>
+<design>
+<axis name="AXIS NAME HERE">AXIS VALUE HERE</axis>
+<axis name="AXIS NAME HERE">AXIS VALUE HERE</axis>
+</design>
+</designs>
+"""
+
 explore_axis_prompt = """
 Here is an axis in the design space of a {domain} of a {concept}:
 {axis}
@@ -0,0 +1,220 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Tuple
+
+from pydantic import BaseModel
+
+from cancellation import GenerationCancelled
+
+# Weight of the newest observation in the latency moving average
+LATENCY_ALPHA = 0.3
+# Outcomes remembered per candidate when computing its error rate
+OUTCOME_WINDOW = 20
+# A candidate above this error rate is skipped while others are healthy
+MAX_ERROR_RATE = 0.5
+# Consecutive failures after which a candidate is benched for COOLDOWN seconds
+FAILURE_THRESHOLD = 3
+COOLDOWN = 30.0
+# Routing decisions kept for observability
+DECISION_LOG_SIZE = 200
+
+
+class Candidate(BaseModel):
+    provider: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+
+class CandidateStats:
+    """Rolling latency and error statistics for one provider/model pair on
+    one stage (a model can be fast at tagging and slow at whole UIs)."""
+
+    def __init__(self):
+        self.latency: float | None = None
+        self.outcomes: deque = deque(maxlen=OUTCOME_WINDOW)
+        self.consecutive_failures = 0
+        self.benched_until = 0.0
+        self.last_failure = 0.0
+        self.calls = 0
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def healthy(self, now: float) -> bool:
+        if now < self.benched_until:
+            return False
+        # A flaky candidate gets probed again once it has been quiet for a while
+        return self.error_rate <= MAX_ERROR_RATE or now - self.last_failure >= COOLDOWN
+
+    def record(self, ok: bool, latency: float) -> None:
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.consecutive_failures = 0
+            self.latency = (
+                latency
+                if self.latency is None
+                else LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * self.latency
+            )
+        else:
+            self.consecutive_failures += 1
+            self.last_failure = time.monotonic()
+            if self.consecutive_failures >= FAILURE_THRESHOLD:
+                self.benched_until = self.last_failure + COOLDOWN
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "calls": self.calls,
+            "consecutive_failures": self.consecutive_failures,
+            "benched": time.monotonic() < self.benched_until,
+        }
+
+
+class ModelRouter:
+    """Routes each pipeline stage to the fastest healthy model that may serve it.
+
+    ``routes`` maps a stage name (``create``, ``fill``, ``explore``,
+    ``expand_prompt``, ``tags``, ``text``, ``ui``) to the ordered list of
+    candidates allowed for that stage; listing a model for a stage is what
+    declares it good enough for it. Among healthy candidates the one with the
+    lowest moving-average latency wins (untried candidates are tried in list
+    order first), and a failing call fails over to the next candidate.
+    Stages without a route are not routed at all.
+    """
+
+    def __init__(self, routes: Dict[str, List[Candidate]] | None = None):
+        self.routes: Dict[str, List[Candidate]] = routes or {}
+        self._stats: Dict[Tuple[str, str], CandidateStats] = {}
+        self._decisions: deque = deque(maxlen=DECISION_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def configure(self, routes: Dict[str, List[Candidate]]) -> None:
+        with self._lock:
+            self.routes = routes
+
+    def load(self, path: str) -> None:
+        """Load routes from a JSON file of ``{stage: [{"provider", "model"}, ...]}``."""
+        with open(path, "r") as f:
+            raw = json.load(f)
+        self.configure(
+            {
+                stage: [Candidate(**candidate) for candidate in candidates]
+                for stage, candidates in raw.items()
+            }
+        )
+
+    def handles(self, stage: str | None) -> bool:
+        return stage is not None and bool(self.routes.get(stage))
+
+    def _stats_for(self, stage: str, candidate: Candidate) -> CandidateStats:
+        key = (stage, candidate.name)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = CandidateStats()
+        return stats
+
+    def candidates(self, stage: str) -> List[Candidate]:
+        """Candidates for ``stage`` in the order they should be tried."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = list(self.routes.get(stage, []))
+            stats = {c.name: self._stats_for(stage, c) for c in candidates}
+
+        def rank(item):
+            position, candidate = item
+            candidate_stats = stats[candidate.name]
+            return (
+                not candidate_stats.healthy(now),
+                # Untried candidates first, in the order they were listed
+                candidate_stats.latency is not None,
+                candidate_stats.latency or 0.0,
+                position,
+            )
+
+        return [candidate for _, candidate in sorted(enumerate(candidates), key=rank)]
+
+    def call(self, stage: str, fn: Callable[[Candidate], Any]) -> Any:
+        """Call ``fn`` with the best candidate for ``stage``, failing over on errors."""
+        last_error: Exception | None = None
+        for attempt, candidate in enumerate(self.candidates(stage)):
+            start = time.monotonic()
+            try:
+                result = fn(candidate)
+            except GenerationCancelled:
+                raise
+            except Exception as e:
+                self._record(stage, candidate, False, time.monotonic() - start, attempt, e)
+                last_error = e
+                continue
+            self._record(stage, candidate, True, time.monotonic() - start, attempt)
+            return result
+        raise last_error or RuntimeError(f"No route configured for stage {stage!r}")
+
+    def _record(
+        self,
+        stage: str,
+        candidate: Candidate,
+        ok: bool,
+        latency: float,
+        attempt: int,
+        error: Exception | None = None,
+    ) -> None:
+        with self._lock:
+            self._stats_for(stage, candidate).record(ok, latency)
+            self._decisions.append(
+                {
+                    "time": time.time(),
+                    "stage": stage,
+                    "candidate": candidate.name,
+                    "ok": ok,
+                    "latency": latency,
+                    "failover": attempt > 0,
+                    "error": repr(error) if error else None,
+                }
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Routes, per-stage candidate statistics and recent decisions, for observability."""
+        with self._lock:
+            return {
+                "routes": {
+                    stage: [c.name for c in candidates]
+                    for stage, candidates in self.routes.items()
+                },
+                "candidates": {
+                    stage: {
+                        name: stats.to_dict()
+                        for (stats_stage, name), stats in self._stats.items()
+                        if stats_stage == stage
+                    }
+                    for stage in sorted({stage for stage, _ in self._stats})
+                },
+                "decisions": list(self._decisions),
+            }
+
+
+# Default routing table for --routes default: Cerebras for the cheap structural
+# stages with OpenRouter as fallback, and the strong model for UI generation.
+DEFAULT_ROUTES = {
+    stage: [
+        Candidate(provider="cerebras", model="llama-3.3-70b"),
+        Candidate(provider="openrouter", model="openai/gpt-4.1-mini"),
+    ]
+    for stage in ("create", "fill", "explore", "expand_prompt", "tags")
+}
+DEFAULT_ROUTES["ui"] = [
+    Candidate(provider="openrouter", model="anthropic/claude-sonnet-4"),
+    Candidate(provider="openrouter", model="openai/gpt-4.1"),
+]
+
+router = ModelRouter()
@@ -0,0 +1,102 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# USD per million (input, output) tokens; models not listed are counted but not priced
+LLM_PRICES: Dict[str, tuple[float, float]] = {
+    "openai/gpt-4.1-mini": (0.4, 1.6),
+    "openai/gpt-4.1": (2.0, 8.0),
+    "anthropic/claude-sonnet-4": (3.0, 15.0),
+    "anthropic/claude-3.7-sonnet": (3.0, 15.0),
+    "llama-3.3-70b": (0.85, 1.2),
+}
+
+# USD per generated image
+IMAGE_PRICES: Dict[str, float] = {
+    "fal-ai/flux/schnell": 0.003,
+}
+
+
+class UsageMeter:
+    """Thread-safe running totals of tokens, images and their estimated cost."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.images = 0
+            # Generations not run because their option duplicated another
+            self.saved_generations = 0
+            self.cost = 0.0
+            self.unpriced: set[str] = set()
+
+    def record_llm(self, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            price = LLM_PRICES.get(model)
+            if price is None:
+                self.unpriced.add(model)
+                return
+            self.cost += (prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6
+
+    def record_image(self, model: str) -> None:
+        with self._lock:
+            self.images += 1
+            price = IMAGE_PRICES.get(model)
+            if price is None:
+                self.unpriced.add(model)
+                return
+            self.cost += price
+
+    def record_saved_generations(self, count: int) -> None:
+        with self._lock:
+            self.saved_generations += count
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "images": self.images,
+                "saved_generations": self.saved_generations,
+                "cost": self.cost,
+                "unpriced_models": sorted(self.unpriced),
+            }
+
+
+class CallBudget:
+    """Process-wide cap on concurrent model calls (LLM and image).
+
+    Unlimited until ``limit`` is called; bulk runs set it so that many
+    galleries generating at once share one budget instead of each opening
+    its own set of connections.
+    """
+
+    def __init__(self):
+        self._semaphore: threading.BoundedSemaphore | None = None
+
+    def limit(self, max_concurrent: int | None) -> None:
+        self._semaphore = (
+            threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        )
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        semaphore = self._semaphore
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+
+usage = UsageMeter()
+call_budget = CallBudget()
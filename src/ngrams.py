@@ -0,0 +1,82 @@
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+# Lexical similarity shared by the concept index (reusing axes for similar
+# concepts) and option deduplication (dropping near-duplicate options)
+
+NGRAM_SIZES = (2, 3, 4)
+
+
+def words(text: str) -> List[str]:
+    """Lowercase words of ``text``, punctuation removed: "Race-car!" -> ["race", "car"]."""
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+
+
+def _count(padded: str, sizes: Tuple[int, ...], grams: Counter) -> None:
+    for size in sizes:
+        for i in range(len(padded) - size + 1):
+            grams[padded[i : i + size]] += 1
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = NGRAM_SIZES) -> Counter:
+    """Character n-grams of ``text`` with word boundaries removed, so that
+    "race car" and "racecar" share all of their n-grams."""
+    grams = Counter()
+    _count("#" + text.replace(" ", "") + "#", sizes, grams)
+    return grams
+
+
+def word_ngrams(text: str, sizes: Tuple[int, ...] = NGRAM_SIZES) -> Counter:
+    """Character n-grams of each word of ``text``, so word order doesn't
+    matter: "sans serif geometric" and "geometric sans serif" are identical."""
+    grams = Counter()
+    for word in text.split():
+        _count(f"#{word}#", sizes, grams)
+    return grams
+
+
+def cosine(a: Counter, b: Counter) -> float:
+    """Cosine similarity of two n-gram counts."""
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    norm = math.sqrt(sum(c * c for c in a.values()) * sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+class NgramVectorizer:
+    """TF-IDF over character n-grams, fitted on a small corpus of short strings."""
+
+    def __init__(self, texts: List[str]):
+        self.counts = [char_ngrams(text) for text in texts]
+        document_frequency = Counter()
+        for grams in self.counts:
+            document_frequency.update(grams.keys())
+        self.vocabulary = {gram: i for i, gram in enumerate(document_frequency)}
+        n_docs = len(texts)
+        self.idf = np.ones(len(self.vocabulary), dtype=np.float32)
+        for gram, i in self.vocabulary.items():
+            self.idf[i] = np.log((1 + n_docs) / (1 + document_frequency[gram])) + 1
+        self.matrix = (
+            np.vstack([self._vector(grams) for grams in self.counts])
+            if self.counts
+            else np.zeros((0, len(self.vocabulary)), dtype=np.float32)
+        )
+
+    def _vector(self, grams: Counter) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for gram, count in grams.items():
+            i = self.vocabulary.get(gram)
+            if i is not None:
+                vector[i] = count * self.idf[i]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def transform(self, text: str) -> np.ndarray:
+        return self._vector(char_ngrams(text))
+
+    def similarities(self, text: str) -> np.ndarray:
+        """Cosine similarity of ``text`` against every fitted string."""
+        return self.matrix @ self.transform(text)
@@ -0,0 +1,128 @@
+import os
+import uuid
+from typing import Optional
+
+# Durable storage for what the database only references: original images
+# (see blobstore) and archived session/ablation steps (see archive). Use a
+# bucket in production; a directory only survives as long as its disk does.
+DEFAULT_OBJECT_DIR = "../.data/objects"
+
+
+def default_object_store() -> str:
+    if os.getenv("OBJECT_STORE"):
+        return os.getenv("OBJECT_STORE")
+    if os.getenv("FIREBASE_STORAGE_BUCKET"):
+        return f"gs://{os.getenv('FIREBASE_STORAGE_BUCKET')}"
+    return DEFAULT_OBJECT_DIR
+
+
+class DirectoryObjects:
+    """Objects as files under ``root``: for development, or a mounted volume."""
+
+    durable = False
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+
+class BucketObjects:
+    """Objects in a Cloud Storage bucket (the Firebase project's Storage
+    bucket), under an optional key ``prefix``."""
+
+    durable = True
+
+    def __init__(self, bucket: str, prefix: str = ""):
+        self.bucket_name = bucket
+        self.prefix = prefix.strip("/")
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from firebase_admin import storage
+
+            from db import initialize_firebase
+
+            self._bucket = storage.bucket(self.bucket_name, app=initialize_firebase())
+        return self._bucket
+
+    def _blob(self, key: str):
+        return self.bucket.blob(f"{self.prefix}/{key}" if self.prefix else key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self._blob(key).download_as_bytes()
+        except NotFound:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        self._blob(key).upload_from_string(data)
+
+    def exists(self, key: str) -> bool:
+        return self._blob(key).exists()
+
+
+def open_object_store(url: str):
+    """``gs://bucket[/prefix]``, or a directory path."""
+    if url.startswith("gs://"):
+        bucket, _, prefix = url[len("gs://") :].partition("/")
+        return BucketObjects(bucket, prefix)
+    return DirectoryObjects(url)
+
+
+class ObjectStore:
+    """Durable, write-once objects by key, shared by every worker and
+    surviving redeploys (given a bucket).
+
+    Delegates to the configured backend; ``configure`` swaps it at startup so
+    modules can keep a reference to the ``objects`` singleton.
+    """
+
+    def __init__(self, url: str | None = None):
+        self.configure(url or default_object_store())
+
+    def configure(self, url: str) -> None:
+        self.url = url
+        self.backend = open_object_store(url)
+
+    @property
+    def durable(self) -> bool:
+        return self.backend.durable
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The object's bytes, or None if there is none."""
+        return self.backend.get(key)
+
+    def put(self, key: str, data: bytes) -> None:
+        self.backend.put(key, data)
+
+    def exists(self, key: str) -> bool:
+        return self.backend.exists(key)
+
+
+objects = ObjectStore()
@@ -0,0 +1,102 @@
+import os
+from typing import Dict, List, Tuple
+
+from ngrams import cosine, word_ngrams, words
+
+# Options scoring at least this similarity to an earlier option are
+# duplicates and never generated
+DEFAULT_THRESHOLD = float(os.getenv("OPTION_DUPLICATE_THRESHOLD", "0.8"))
+# Options requested on top of n, so dropping duplicates still leaves n
+EXTRA_OPTIONS = int(os.getenv("EXTRA_OPTIONS", "3"))
+# Complete designs (all axes explored at once) differing in fewer axes than
+# this are duplicates
+MIN_AXES_DIFFERENT = int(os.getenv("MIN_AXES_DIFFERENT", "1"))
+
+# Words that name the kind of value rather than the value itself:
+# "art deco style" is "art deco", "flat design" is "flat"
+_FILLER = set(
+    "a an the style styled design look aesthetic theme themed inspired type kind".split()
+)
+
+
+def normalize_option(option: str) -> str:
+    """Lowercase, strip punctuation and filler words: "Art-Deco style!" -> "art deco"."""
+    option_words = words(option)
+    return " ".join(word for word in option_words if word not in _FILLER) or " ".join(
+        option_words
+    )
+
+
+def select_options(
+    options: List[str], n: int, threshold: float = DEFAULT_THRESHOLD
+) -> Tuple[List[str], int]:
+    """The ``n`` most distinct of ``options``, in their original order, and
+    how many generations that saves.
+
+    Duplicates (equal after normalization, or at least ``threshold`` similar
+    to an earlier option) are dropped first. If more than ``n`` remain, the
+    option closest to another one is dropped until ``n`` are left, so a
+    near-duplicate pair ("navy blue", "dark navy") loses a member before two
+    unrelated options do. The saving counts the duplicates among the first
+    ``n`` options: the generations that would otherwise have repeated one.
+    """
+    grams = [word_ngrams(normalize_option(option)) for option in options]
+    kept: List[int] = []
+    saved = 0
+    for i, option_grams in enumerate(grams):
+        if not option_grams or any(
+            cosine(option_grams, grams[j]) >= threshold for j in kept
+        ):
+            saved += i < n
+            continue
+        kept.append(i)
+
+    while len(kept) > n:
+        # Drop the later member of the most similar remaining pair
+        _, drop = max(
+            (cosine(grams[a], grams[b]), b)
+            for position, b in enumerate(kept)
+            for a in kept[:position]
+        )
+        kept.remove(drop)
+    return [options[i] for i in kept], saved
+
+
+def axes_different(a: Dict[str, str], b: Dict[str, str]) -> int:
+    """How many axes two designs ({axis name: value}) set differently,
+    comparing normalized values."""
+    return sum(
+        normalize_option(a.get(name, "")) != normalize_option(b.get(name, ""))
+        for name in a.keys() | b.keys()
+    )
+
+
+def select_fills(
+    fills: List[Dict[str, str]], n: int, min_different: int = MIN_AXES_DIFFERENT
+) -> Tuple[List[Dict[str, str]], int]:
+    """The ``n`` most distinct of ``fills`` (complete designs, {axis name:
+    value}), in their original order, and how many generations that saves.
+
+    Like ``select_options``, but designs are compared axis by axis: two
+    that differ in only one axis are as distinct as their values there, not
+    near-duplicates because most of their text is shared. Designs differing
+    from an earlier one in fewer than ``min_different`` axes are dropped;
+    beyond ``n``, the later member of the pair differing in the fewest axes
+    is dropped until ``n`` are left.
+    """
+    kept: List[int] = []
+    saved = 0
+    for i, fill in enumerate(fills):
+        if any(axes_different(fill, fills[j]) < min_different for j in kept):
+            saved += i < n
+            continue
+        kept.append(i)
+
+    while len(kept) > n:
+        _, drop = min(
+            (axes_different(fills[a], fills[b]), -b)
+            for position, b in enumerate(kept)
+            for a in kept[:position]
+        )
+        kept.remove(-drop)
+    return [fills[i] for i in kept], saved
@@ -0,0 +1,219 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from designgalleries import generate
+from designspace import DesignSpace, Example
+from domains.domain import Domain
+from models.llms import text_model
+
+DEFAULT_PRECOMPUTED_DIR = os.getenv("PRECOMPUTED_DIR", "../.data/precomputed")
+
+
+def _slug(prompt: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", prompt.lower()).strip("_") or "prompt"
+
+
+class PrecomputeStore:
+    """First galleries generated ahead of time, one JSON file per
+    (domain, variant, prompt, n).
+
+    Every entry is written atomically as soon as it is finished, so the files
+    on disk double as the checkpoint of an interrupted precompute run: a
+    restarted run skips every combination that already has an entry.
+    """
+
+    def __init__(self, root: str = DEFAULT_PRECOMPUTED_DIR):
+        self.root = root
+
+    def path(self, domain: str, variant: str, prompt: str, n: int) -> str:
+        return os.path.join(self.root, domain, variant, f"{_slug(prompt)}.n{n}.json")
+
+    def has(self, domain: str, variant: str, prompt: str, n: int) -> bool:
+        return os.path.exists(self.path(domain, variant, prompt, n))
+
+    def get(
+        self, domain: str, variant: str, prompt: str, n: int
+    ) -> Optional[Tuple[DesignSpace, List[Example]]]:
+        path = self.path(domain, variant, prompt, n)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            return (
+                DesignSpace.model_validate_json(entry["design_space"]),
+                [Example.model_validate_json(g) for g in entry["generations"]],
+            )
+        except (OSError, ValueError, KeyError):
+            # A corrupt entry is treated as missing and regenerated next run
+            return None
+
+    def put(
+        self,
+        domain: str,
+        variant: str,
+        prompt: str,
+        n: int,
+        design_space: DesignSpace,
+        generations: List[Example],
+    ) -> None:
+        path = self.path(domain, variant, prompt, n)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "prompt": prompt,
+                    "domain": domain,
+                    "variant": variant,
+                    "n": n,
+                    "created_at": time.time(),
+                    "design_space": design_space.model_dump_json(),
+                    "generations": [g.model_dump_json() for g in generations],
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+precomputed = PrecomputeStore()
+
+
+def precompute_one(
+    domain: Domain,
+    prompt: str,
+    variant: Dict,
+    n: int,
+    model: str = text_model,
+) -> Tuple[DesignSpace, List[Example]]:
+    """Build the first gallery for ``prompt`` exactly like ``Server.get_ablation`` does."""
+    design_space = DesignSpace.create(prompt, domain.display_name, model=model)
+    design_space.explore_new_axis()
+    design_space.fill()
+    generations = generate(
+        prompt,
+        design_space,
+        domain=domain,
+        n=n,
+        model=model,
+        sort_results=variant["sort_results"],
+        explore_all_axes=variant["explore_all_axes"],
+    )
+    return design_space, generations
+
+
+def run(
+    domain: Domain,
+    prompts: List[str],
+    variants: List[Dict],
+    n: int,
+    model: str = text_model,
+    workers: int = 4,
+    store: PrecomputeStore = precomputed,
+) -> Dict[str, int]:
+    """Precompute every prompt x variant combination that has no entry yet."""
+    jobs = [
+        (prompt, variant)
+        for variant in variants
+        for prompt in prompts
+        if not store.has(domain.name, variant["name"], prompt, n)
+    ]
+    skipped = len(prompts) * len(variants) - len(jobs)
+    print(f"{len(jobs)} galleries to generate, {skipped} already precomputed")
+
+    def work(prompt: str, variant: Dict):
+        design_space, generations = precompute_one(domain, prompt, variant, n, model)
+        store.put(domain.name, variant["name"], prompt, n, design_space, generations)
+
+    done = failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(work, prompt, variant): (prompt, variant["name"])
+            for prompt, variant in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            prompt, variant_name = futures[future]
+            try:
+                future.result()
+                done += 1
+                print(f"[{done + failed}/{len(jobs)}] {variant_name}: {prompt}")
+            except Exception as e:
+                # Left without an entry, so the next run retries it
+                failed += 1
+                print(f"[{done + failed}/{len(jobs)}] {variant_name}: {prompt} failed: {e}")
+
+    return {"generated": done, "failed": failed, "skipped": skipped}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Precompute the first ablation galleries for every prompt and variant"
+    )
+    parser.add_argument(
+        "--domain", type=str, default="image", choices=["image", "text", "ui"]
+    )
+    parser.add_argument(
+        "--n", type=int, default=6, help="Examples per gallery (must match the server)"
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="*",
+        default=None,
+        help="Ablation variants to precompute (default: all)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Galleries generated concurrently"
+    )
+    parser.add_argument(
+        "--data-dir", type=str, default="../.data", help="Data directory"
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default=DEFAULT_PRECOMPUTED_DIR,
+        help="Directory the precomputed galleries are written to",
+    )
+    parser.add_argument("--model", type=str, default=text_model, help="Model to use")
+    return parser.parse_args()
+
+
+def main():
+    # The ablation configuration lives on the server
+    from server import Server
+    from domains.imagegen.imagegen import ImageGen
+    from domains.text.textgen import TextGen
+    from domains.ui.ui import UIGen
+
+    args = parse_args()
+    domain_classes = {"image": ImageGen, "text": TextGen, "ui": UIGen}
+    domain = domain_classes[args.domain](data_dir=args.data_dir, model=args.model)
+
+    variants = [
+        variant
+        for variant in Server.ABLATION_VARIANTS
+        if args.variants is None or variant["name"] in args.variants
+    ]
+    summary = run(
+        domain,
+        Server.ABLATION_PROMPTS,
+        variants,
+        n=args.n,
+        model=args.model,
+        workers=args.workers,
+        store=PrecomputeStore(args.out),
+    )
+    print(
+        f"Generated {summary['generated']}, failed {summary['failed']}, "
+        f"skipped {summary['skipped']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
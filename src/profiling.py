@@ -0,0 +1,336 @@
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sharedstate import MemoryState, shared_state
+
+# Seconds between stack samples; wall-clock, so waiting threads show up too
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# Longest on-demand profile
+MAX_PROFILE_SECONDS = 60.0
+# The event loop not getting to run for this long is logged with its stack
+DEFAULT_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+# How long per-request profiles are kept for download, in seconds
+PROFILE_TTL = 600.0
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+Frame = Tuple[str, str, int]  # function, file, first line
+
+
+class Profile:
+    """Stack samples of every thread, and exporters for flamegraph viewers."""
+
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self.duration = 0.0
+        # (thread name, stack from the outermost frame) -> sample count
+        self.samples: Counter = Counter()
+
+    def speedscope(self) -> Dict:
+        """The profile in speedscope's file format, one profile per thread."""
+        frames: List[Dict] = []
+        frame_index: Dict[Frame, int] = {}
+        by_thread: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        for (thread, stack), count in sorted(self.samples.items()):
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            stacks, weights = by_thread.setdefault(thread, ([], []))
+            stacks.append(indices)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "axes profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": stacks,
+                    "weights": weights,
+                }
+                for thread, (stacks, weights) in by_thread.items()
+            ],
+        }
+
+    def collapsed(self) -> str:
+        """Folded stacks ("thread;outer;inner count"), as read by flamegraph.pl."""
+        lines = []
+        for (thread, stack), count in sorted(self.samples.items()):
+            names = [
+                f"{name} ({os.path.basename(file)}:{line})" for name, file, line in stack
+            ]
+            lines.append(f"{';'.join([thread, *names])} {count}")
+        return "".join(f"{line}\n" for line in lines)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "duration": self.duration,
+            "samples": [
+                [thread, [list(frame) for frame in stack], count]
+                for (thread, stack), count in self.samples.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Profile":
+        profile = cls(data["name"], data["interval"])
+        profile.duration = data["duration"]
+        for thread, stack, count in data["samples"]:
+            profile.samples[(thread, tuple(tuple(frame) for frame in stack))] = count
+        return profile
+
+
+class Sampler:
+    """Samples the stacks of all threads (but its own) every ``interval``
+    seconds from a background thread, until stopped."""
+
+    def __init__(
+        self, name: str = "profile", interval: float = DEFAULT_SAMPLE_INTERVAL
+    ):
+        self.profile = Profile(name, interval)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def start(self) -> "Sampler":
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        return self
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.profile.duration = time.monotonic() - self._started
+        return self.profile
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.profile.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                thread = names.get(ident, str(ident))
+                self.profile.samples[(thread, tuple(reversed(stack)))] += 1
+
+
+# Only one on-demand profile at a time: samplers see every thread, so
+# overlapping ones would just double the overhead
+_profile_lock = asyncio.Lock()
+# Whether the current task holds it: a profiled request may itself be one
+# asking for an on-demand profile
+_holding_profile_lock = contextvars.ContextVar("holding_profile_lock", default=False)
+
+
+@asynccontextmanager
+async def _profiling():
+    """Hold ``_profile_lock`` unless this task already does."""
+    if _holding_profile_lock.get():
+        yield
+        return
+    async with _profile_lock:
+        token = _holding_profile_lock.set(True)
+        try:
+            yield
+        finally:
+            _holding_profile_lock.reset(token)
+
+
+async def profile_for(
+    seconds: float, interval: float = DEFAULT_SAMPLE_INTERVAL
+) -> Profile:
+    """Sample the whole process for ``seconds`` (capped at MAX_PROFILE_SECONDS)."""
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+    async with _profiling():
+        sampler = Sampler(f"{seconds:g}s profile", interval).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile = sampler.stop()
+    return profile
+
+
+class ProfileStore:
+    """Per-request profiles by id, kept for ``ttl`` seconds in the shared
+    ``state`` so they can be downloaded from any worker."""
+
+    def __init__(self, state=None, ttl: float = PROFILE_TTL):
+        self.state = state if state is not None else MemoryState()
+        self.ttl = ttl
+
+    def _put(self, profile_id: str, profile: Profile) -> None:
+        data = zlib.compress(json.dumps(profile.to_dict()).encode())
+        self.state.set(f"profile:{profile_id}", data, self.ttl)
+
+    def _get(self, profile_id: str) -> Optional[Profile]:
+        data = self.state.get(f"profile:{profile_id}")
+        if data is None:
+            return None
+        return Profile.from_dict(json.loads(zlib.decompress(data)))
+
+    async def put(self, profile_id: str, profile: Profile) -> None:
+        await asyncio.to_thread(self._put, profile_id, profile)
+
+    async def get(self, profile_id: str) -> Optional[Profile]:
+        return await asyncio.to_thread(self._get, profile_id)
+
+
+profiles = ProfileStore(shared_state)
+
+
+class ProfileMiddleware:
+    """Profiles requests sent with an ``X-Profile`` header by an admin.
+
+    The response carries ``X-Profile-Id``; the profile covers the request
+    until its body is complete (streams included) and can then be
+    downloaded from the admin profile endpoint. Like on-demand profiles,
+    profiled requests take turns (see ``_profile_lock``).
+    """
+
+    def __init__(
+        self, app, authorized: Callable[[Dict[str, str]], bool], store=profiles
+    ):
+        self.app = app
+        self.authorized = authorized
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        if PROFILE_HEADER not in headers or not self.authorized(headers):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER.lower().encode(), profile_id.encode()),
+                ]
+            await send(message)
+
+        async with _profiling():
+            sampler = Sampler(f"{scope['method']} {scope['path']}").start()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profile = sampler.stop()
+        await self.store.put(profile_id, profile)
+
+
+# ----------------------------------------------------------------------
+# Event loop watchdog
+# ----------------------------------------------------------------------
+
+
+class LoopWatchdog:
+    """Logs the event loop's stack whenever it is blocked for longer than
+    ``threshold`` seconds, i.e. some handler is running blocking code.
+
+    A task on the loop records a heartbeat every ``interval`` seconds; a
+    thread watches it and, once a heartbeat is overdue by ``threshold``,
+    prints what the loop thread is executing at that moment.
+    """
+
+    def __init__(
+        self, threshold: float = DEFAULT_LAG_THRESHOLD, interval: float = 0.05
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0
+        self.max_lag = 0.0
+        # The most recent stalls: lag and the loop's stack when first detected
+        self.recent: deque = deque(maxlen=10)
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start watching the running loop (call from a coroutine on it)."""
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watch, daemon=True, name="loop-watchdog").start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _watch(self) -> None:
+        stalled_since: Optional[float] = None
+        while not self._stop.wait(self.interval):
+            lag = time.monotonic() - self._beat - self.interval
+            if lag < self.threshold:
+                if stalled_since is not None:
+                    blocked = time.monotonic() - stalled_since
+                    print(f"Event loop unblocked after {blocked:.2f}s")
+                    stalled_since = None
+                continue
+            self.max_lag = max(self.max_lag, lag)
+            if stalled_since is not None:
+                continue
+            # Report each stall once, with the stack that is blocking the loop
+            stalled_since = self._beat + self.interval
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.stalls += 1
+            self.recent.append({"lag": lag, "at": time.time(), "stack": stack})
+            print(f"Event loop blocked for {lag:.2f}s in:\n{stack}")
+
+    def stats(self) -> Dict:
+        return {
+            "threshold": self.threshold,
+            "lag": max(time.monotonic() - self._beat - self.interval, 0.0),
+            "max_lag": self.max_lag,
+            "stalls": self.stalls,
+            "recent": list(self.recent),
+        }
+
+
+loop_watchdog = LoopWatchdog()
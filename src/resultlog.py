@@ -0,0 +1,151 @@
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import zlib
+from typing import Dict, Iterator, Optional
+
+# Start a new segment once this many (uncompressed) bytes went into the current one
+SEGMENT_BYTES = int(os.getenv("RESULT_LOG_SEGMENT_BYTES", str(256 * 1024 * 1024)))
+# Records waiting to be written; appending blocks once the queue is full
+QUEUE_SIZE = 256
+
+_SEGMENT_PATTERN = "results-*.jsonl.gz"
+
+
+def _segments(directory: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(directory, _SEGMENT_PATTERN)))
+
+
+class _Segment:
+    """The gzip file this process is currently appending to in one log directory.
+
+    Segments are named ``results-<index>-<pid>.jsonl.gz`` and created
+    exclusively, so worker processes logging to the same directory never
+    write into each other's files.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        existing = _segments(directory)
+        index = (
+            max(int(os.path.basename(path).split("-")[1].split(".")[0]) for path in existing) + 1
+            if existing
+            else 0
+        )
+        while True:
+            self.path = os.path.join(
+                directory, f"results-{index:06d}-{os.getpid()}.jsonl.gz"
+            )
+            try:
+                self.file = open(self.path, "xb")
+                break
+            except FileExistsError:
+                index += 1
+        self.gzip = gzip.GzipFile(fileobj=self.file, mode="wb")
+        self.written = 0
+
+    def write(self, line: bytes) -> None:
+        self.gzip.write(line)
+        self.written += len(line)
+
+    def flush(self) -> None:
+        # A sync flush leaves a readable prefix even if the process dies later
+        self.gzip.flush(zlib.Z_SYNC_FLUSH)
+        self.file.flush()
+
+    def close(self) -> None:
+        self.gzip.close()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class ResultLog:
+    """Append-only, rotating, gzip-compressed JSONL log of generated galleries.
+
+    ``append`` only enqueues the record; a background thread serializes and
+    compresses it, so callers never wait on disk I/O (unless the bounded
+    queue is full). Each directory gets its own series of segments, rotated
+    at ``segment_bytes``. ``close`` drains the queue and fsyncs; it runs
+    automatically at interpreter exit.
+    """
+
+    def __init__(self, segment_bytes: int = SEGMENT_BYTES, queue_size: int = QUEUE_SIZE):
+        self.segment_bytes = segment_bytes
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._segments: Dict[str, _Segment] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def append(self, directory: str, record: dict) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Result log is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((directory, record))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._write(*item)
+            # Flush once the burst of pending records has been written
+            if self._queue.empty():
+                for segment in self._segments.values():
+                    segment.flush()
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+
+    def _write(self, directory: str, record: dict) -> None:
+        try:
+            segment = self._segments.get(directory)
+            if segment is None:
+                segment = self._segments[directory] = _Segment(directory)
+            segment.write((json.dumps(record) + "\n").encode())
+            if segment.written >= self.segment_bytes:
+                segment.close()
+                del self._segments[directory]
+        except Exception as e:
+            # Logging must never take the writer thread (and later records) down
+            print(f"Failed to write result log record to {directory}: {e}")
+
+    def close(self) -> None:
+        """Write out everything queued, then close and fsync every segment."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+def iter_records(directory: str) -> Iterator[dict]:
+    """Lazily yield every record logged in ``directory``, oldest first.
+
+    A segment cut short by a crash yields the records before the damage.
+    """
+    for path in _segments(directory):
+        try:
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            continue
+
+
+result_log = ResultLog()
+atexit.register(result_log.close)
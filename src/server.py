@@ -1,11 +1,22 @@
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
 import os
+import sys
 import textwrap
 import time
 from pathlib import Path
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.responses import (
+    FileResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from pydantic import BaseModel
 import uvicorn
 import argparse
@@ -14,32 +25,53 @@ from designspace import DesignSpace, Generation, Tag, Example
 from domains.ui.ui import UIGen
 from domains.domain import Domain
 from domains.imagegen.imagegen import ImageGen
+from domains.imagegen.ingest import image_bytes, image_url, variant_file
 from domains.text.textgen import TextGen
 from models.llms import text_model
-from typing import List, Optional
+from models.cassette import cassette
+from models.router import DEFAULT_ROUTES, router
+from typing import Dict, List, Optional
 from rich.console import Console
+from assets import FingerprintedStaticFiles, icon_sprite
+from archive import Compactor, cold_archive
+from blobstore import blobs
+from objectstore import DEFAULT_OBJECT_DIR, objects, open_object_store
+import codec
 from db import database
+from designhistory import changes, design_spaces, expand_steps
+from httpcache import etag_for, json_response
+from singleflight import SingleFlight
+from admission import BATCH, INTERACTIVE, AdmissionController, AdmissionRejected
+from sharedstate import DEFAULT_SQLITE_PATH, shared_state
+from conceptindex import concept_index
+from precompute import precomputed
+from profiling import ProfileMiddleware, loop_watchdog, profile_for, profiles
+from cancellation import GenerationCancelled
+from contextlib import asynccontextmanager
 from datetime import datetime
 from io import BytesIO
 import random
 
 # Matplotlib is an optional dependency used only for rendering the generation
-# history figure. Importing it in a try/except ensures the server can still
-# start even if the library is not yet installed (e.g. during cold starts) and
-# keeps static analysers from flagging unresolved imports.
-try:
-    import matplotlib.pyplot as plt  # type: ignore
-    from matplotlib.patches import Rectangle, FancyBboxPatch  # type: ignore
-    import matplotlib.font_manager as fm  # type: ignore
+# history figure. It is imported on the first figure request (not at startup,
+# where it dominates import time), and a missing install only disables that
+# endpoint.
+@functools.lru_cache(maxsize=1)
+def _figure_stack():
+    """Return ``(pyplot, FancyBboxPatch, font_prop)``, or None without matplotlib."""
+    try:
+        import matplotlib.pyplot as plt  # type: ignore
+        from matplotlib.patches import FancyBboxPatch  # type: ignore
+        import matplotlib.font_manager as fm  # type: ignore
+    except ModuleNotFoundError:  # pragma: no cover – handled at runtime
+        return None
 
     # ------------------------------------------------------------------
     # Set up custom font
     # ------------------------------------------------------------------
     font_path = Path(__file__).parent / "static" / "fonts" / "Inter-Medium.ttf"
     font_prop = fm.FontProperties(fname=str(font_path))
-except ModuleNotFoundError:  # pragma: no cover – handled at runtime
-    plt = None  # type: ignore
-    Rectangle = None  # type: ignore
+    return plt, FancyBboxPatch, font_prop
 
 
 class StartRequest(BaseModel):
@@ -51,6 +83,10 @@ class RegenerateRequest(BaseModel):
     design_space: DesignSpace | None = None
 
 
+class RefineRequest(BaseModel):
+    index: int
+
+
 class GenerationResponse(BaseModel):
     design_space: DesignSpace
     generations: List[Example]
@@ -60,6 +96,33 @@ class DomainResponse(BaseModel):
     name: str
     display_name: str
 
+# How long a pending events stream waits for its build to start
+EVENTS_WAIT_STEPS = 50
+EVENTS_WAIT_INTERVAL = 0.1
+
+
+def design_space_key(design_space: DesignSpace) -> str:
+    """Stable key identifying a regenerate request for single-flight coalescing."""
+    return hashlib.sha256(design_space.model_dump_json().encode()).hexdigest()
+
+
+def record_etag(kind: str, record_id: str, record: Dict, steps_key: str, *extra) -> str:
+    """ETag for what is stored for a session or ablation.
+
+    Changes whenever a step is appended, an example is refined (the step's
+    ``updated_at``) or the current design space changes.
+    """
+    steps = record.get(steps_key) or []
+    return etag_for(
+        kind,
+        record_id,
+        len(steps),
+        steps[-1].get("timestamp") if steps else None,
+        max((step.get("updated_at") or "" for step in steps), default=""),
+        record.get("current_design_space"),
+        *extra,
+    )
+
 
 class Server:
     def __init__(
@@ -68,29 +131,49 @@ class Server:
         n: int,
         model: str = text_model,
         console: Console | None = None,
+        admission: AdmissionController | None = None,
+        admin_token: str | None = None,
+        compactor: Compactor | None = None,
     ):
-        self.app = FastAPI()
+        self.app = FastAPI(lifespan=self._lifespan)
+        # Background work started with the app, in the process serving it
+        self.compactor = compactor
         self.domains = domains
+        # Domain lookup by name for every request that carries one
+        self.domains_by_name: Dict[str, Domain] = {d.name: d for d in domains}
         self.n = n
         self.model = model
         self.console = console
-
-        templates_dir = Path(__file__).parent / "templates"
-        self.templates = Jinja2Templates(directory=str(templates_dir))
+        # Coalesces concurrent gallery builds per session / ablation (across
+        # workers when the shared state backend is shared)
+        self.flights = SingleFlight(shared_state, models=[DesignSpace, Example])
+        # Caps concurrent builds; excess requests queue briefly or get a 429
+        self.admission = admission or AdmissionController(state=shared_state)
+        # Admin endpoints (profiling) only exist when a token is configured
+        self.admin_token = admin_token
+        self.app.add_middleware(ProfileMiddleware, authorized=self.is_admin)
 
         self.static_dir = Path(__file__).parent / "static"
         self.static_dir.mkdir(exist_ok=True)
-        self.app.mount(
-            "/static", StaticFiles(directory=str(self.static_dir)), name="static"
-        )
+        # Pages link assets by content hash (immutable, cached for a year)
+        self.static = FingerprintedStaticFiles(self.static_dir, "/static")
+        self.app.mount("/static", self.static, name="static")
+        self.domain_assets: Dict[str, FingerprintedStaticFiles] = {}
         for domain in self.domains:
-            custom_scripts_path = domain.scripts_path
+            self.domain_assets[domain.name] = FingerprintedStaticFiles(
+                Path(domain.scripts_path).parent, f"/{domain.name}"
+            )
             self.app.mount(
                 f"/{domain.name}",
-                StaticFiles(directory=str(Path(custom_scripts_path).parent)),
+                self.domain_assets[domain.name],
                 name=f"{domain.name}",
             )
 
+        templates_dir = Path(__file__).parent / "templates"
+        self.templates = Jinja2Templates(directory=str(templates_dir))
+        self.templates.env.globals["assets"] = self.static
+        self.templates.env.globals["icon_sprite"] = icon_sprite()
+
         self.app.get("/")(self.start_page)
         self.app.get("/generation/{session_id}")(self.generation_page)
 
@@ -101,9 +184,17 @@ class Server:
 
         #################################################################
         self.app.get("/api/domains")(self.get_domains)
+        self.app.get("/api/router")(self.get_router_stats)
+        self.app.get("/api/admission")(self.get_admission_stats)
+        self.app.get("/api/admin/profile")(self.get_profile)
+        self.app.get("/api/admin/profile/{profile_id}")(self.get_request_profile)
+        self.app.get("/api/admin/loop")(self.get_loop_stats)
+        self.app.get("/api/blob/{sha}/{size}")(self.get_blob)
         self.app.post("/api/generate")(self.generate)
         self.app.get("/api/generation/{session_id}")(self.get_generation)
         self.app.post("/api/generation/{session_id}/regenerate")(self.regenerate)
+        self.app.get("/api/generation/{session_id}/events")(self.generation_events)
+        self.app.post("/api/generation/{session_id}/refine")(self.refine)
 
         # ------------------------------------------------------------------
         # Ablation routes
@@ -118,6 +209,8 @@ class Server:
         #     self.ablation_regenerate
         # )
         # self.app.post("/api/ablation/{ablation_id}/next")(self.ablation_next)
+        # self.app.get("/api/ablation/{ablation_id}/events")(self.ablation_events)
+        # self.app.post("/api/ablation/{ablation_id}/refine")(self.ablation_refine)
 
         # ------------------------------------------------------------------
         # Tutorial route
@@ -129,6 +222,9 @@ class Server:
         # ------------------------------------------------------------------
         self.app.get("/ablation-viewer/{ablation_id}")(self.ablation_viewer_page)
         self.app.get("/api/ablation/{ablation_id}/history")(self.get_ablation_history)
+        self.app.get("/api/ablation/{ablation_id}/history/{index}")(
+            self.get_ablation_history_entry
+        )
 
         # ------------------------------------------------------------------
         # Ablations overview page
@@ -139,6 +235,10 @@ class Server:
     # HTML endpoints
     #################################################################
 
+    def scripts_url(self, domain: Domain) -> str:
+        """Fingerprinted URL of the domain's rendering script."""
+        return self.domain_assets[domain.name].url(Path(domain.scripts_path).name)
+
     async def start_page(self, request: Request):
         return self.templates.TemplateResponse(
             "index.html",
@@ -150,20 +250,16 @@ class Server:
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        domain = next((d for d in self.domains if d.name == session["domain"]), None)
+        domain = self.domains_by_name.get(session["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
-        custom_scripts_path = domain.scripts_path
-
         return self.templates.TemplateResponse(
             "generated.html",
             {
                 "request": request,
                 "domain_name": domain.display_name,
-                "scripts_path": os.path.join(
-                    f"/{domain.name}", custom_scripts_path.split("/")[-1]
-                ),
+                "scripts_path": self.scripts_url(domain),
                 "concept": session["concept"],
                 "session_id": session_id,
             },
@@ -184,14 +280,162 @@ class Server:
     # API endpoints
     #################################################################
 
+    async def _run_flight(
+        self,
+        request: Request,
+        group: str,
+        key: str,
+        build,
+        commit,
+        *,
+        supersede: bool = False,
+    ):
+        """Run a gallery build through single-flight, cancelling it if every client leaves.
+
+        New builds go through admission control first; requests joining a
+        build that is already running are never refused.
+        """
+        # Behind a proxy (Railway) uvicorn takes the client address from
+        # X-Forwarded-For, but only for proxies in --forwarded-allow-ips, so
+        # clients can't pick their own identity
+        client = request.client.host if request.client else "unknown"
+        # Scripted/bulk clients mark themselves so interactive users go first
+        priority = (
+            BATCH
+            if request.headers.get("x-request-priority", "").lower() == "batch"
+            else INTERACTIVE
+        )
+        try:
+            return await self.flights.run(
+                group,
+                key,
+                build,
+                commit,
+                supersede=supersede,
+                is_disconnected=request.is_disconnected,
+                admit=lambda: self.admission.acquire(
+                    client, priority, request.is_disconnected
+                ),
+            )
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many generations in progress ({e.reason})",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except GenerationCancelled:
+            # 499: the client closed the request (nginx convention)
+            raise HTTPException(status_code=499, detail="Generation cancelled")
+
     async def get_domains(self) -> List[DomainResponse]:
         return [
             DomainResponse(name=d.name, display_name=d.display_name)
             for d in self.domains
         ]
 
+    async def get_router_stats(self) -> dict:
+        """Model routes, rolling per-provider latency/error stats and recent decisions."""
+        return router.stats()
+
+    async def get_blob(self, sha: str, size: str, request: Request) -> FileResponse:
+        """An image variant (thumb/grid/full) in the best format the client
+        accepts, or the original. Blobs never change, so they are cached forever.
+
+        Fetching the original and rebuilding variants is blocking, so runs
+        in a thread."""
+        try:
+            found = await asyncio.to_thread(
+                variant_file, sha, size, request.headers.get("accept", "")
+            )
+        except ValueError:
+            found = None
+        if found is None:
+            raise HTTPException(status_code=404, detail="Blob not found")
+        path, media_type = found
+        return FileResponse(
+            path,
+            media_type=media_type,
+            headers={
+                "Cache-Control": "public, max-age=31536000, immutable",
+                "Vary": "Accept",
+            },
+        )
+
+    async def get_admission_stats(self) -> dict:
+        """Active builds, queue depth, admitted/rejected counts and limits."""
+        return self.admission.stats()
+
+    # ------------------------------------------------------------------
+    # Admin: profiling
+    # ------------------------------------------------------------------
+
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        loop_watchdog.start()
+        if self.compactor is not None:
+            self.compactor.start()
+        try:
+            yield
+        finally:
+            if self.compactor is not None:
+                self.compactor.stop()
+            loop_watchdog.stop()
+
+    def is_admin(self, headers) -> bool:
+        """Whether the request carries the admin token (``Authorization:
+        Bearer <token>`` or ``X-Admin-Token``)."""
+        if not self.admin_token:
+            return False
+        token = headers.get("x-admin-token") or ""
+        authorization = headers.get("authorization") or ""
+        if authorization.lower().startswith("bearer "):
+            token = authorization[len("bearer ") :]
+        return hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    def _require_admin(self, request: Request) -> None:
+        if not self.is_admin(request.headers):
+            # Indistinguishable from a route that doesn't exist
+            raise HTTPException(status_code=404, detail="Not Found")
+
+    @staticmethod
+    def _profile_response(profile, format: str):
+        if format == "collapsed":
+            return PlainTextResponse(profile.collapsed())
+        if format != "speedscope":
+            raise HTTPException(status_code=400, detail="Unknown profile format")
+        return Response(
+            content=json.dumps(profile.speedscope()),
+            media_type="application/json",
+            headers={
+                "Content-Disposition": 'attachment; filename="profile.speedscope.json"'
+            },
+        )
+
+    async def get_profile(
+        self, request: Request, seconds: float = 10.0, format: str = "speedscope"
+    ):
+        """Sample every thread of this worker for ``seconds`` and return the
+        profile (speedscope JSON, or folded stacks with ``format=collapsed``)."""
+        self._require_admin(request)
+        return self._profile_response(await profile_for(seconds), format)
+
+    async def get_request_profile(
+        self, profile_id: str, request: Request, format: str = "speedscope"
+    ):
+        """Profile of a request sent with ``X-Profile`` (see its ``X-Profile-Id``)."""
+        self._require_admin(request)
+        profile = await profiles.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return self._profile_response(profile, format)
+
+    async def get_loop_stats(self, request: Request) -> dict:
+        """Event loop lag, and the stacks of recent stalls."""
+        self._require_admin(request)
+        return loop_watchdog.stats()
+
     async def generate(self, request: StartRequest) -> dict[str, str]:
-        domain = next((d for d in self.domains if d.name == request.domain), None)
+        domain = self.domains_by_name.get(request.domain)
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
@@ -201,54 +445,144 @@ class Server:
         # Redirect to generation page
         return {"url": f"/generation/{session_id}"}
 
-    async def get_generation(self, session_id: str) -> GenerationResponse:
+    async def get_generation(
+        self, session_id: str, request: Request
+    ) -> GenerationResponse:
         session = database.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        domain = next((d for d in self.domains if d.name == session["domain"]), None)
+        domain = self.domains_by_name.get(session["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
-        # If no design space exists, create one
+        # If no design space exists, create one. Concurrent requests for the
+        # same session (two tabs, a refresh) share a single build.
         if not session["current_design_space"]:
-            design_space = DesignSpace.create(session["concept"], domain.display_name)
-            design_space.explore_new_axis()
-            design_space.fill()
 
-            generations = generate(
-                session["concept"],
-                design_space,
-                domain=domain,
-                n=self.n,
-                model=self.model,
-                console=self.console,
+            def build(flight):
+                design_space = DesignSpace.create(
+                    session["concept"], domain.display_name, cancel=flight.cancel
+                )
+                design_space.explore_new_axis()
+                design_space.fill(cancel=flight.cancel)
+
+                generations = generate(
+                    session["concept"],
+                    design_space,
+                    domain=domain,
+                    n=self.n,
+                    model=self.model,
+                    console=self.console,
+                    cancel=flight.cancel,
+                    on_event=flight.emit,
+                )
+                return design_space, generations
+
+            design_space, generations = await self._run_flight(
+                request,
+                f"session:{session_id}",
+                "initial",
+                build,
+                lambda result: database.update_session(session_id, *result),
             )
-            database.update_session(session_id, design_space, generations)
         else:
-            design_space = DesignSpace.model_validate_json(
-                session["current_design_space"]
-            )
+            # Stored gallery: clients revalidate with If-None-Match and get a
+            # 304 (without anything being parsed) while it is unchanged
+            def stored() -> Dict:
+                # Validated when stored; serialized as-is (GenerationResponse)
+                return {
+                    "design_space": json.loads(session["current_design_space"]),
+                    "generations": (
+                        codec.step_examples(session["generations"][-1])
+                        if session["generations"]
+                        else []
+                    ),
+                }
 
-            generations = (
-                [
-                    Example.model_validate_json(gen)
-                    for gen in session["generations"][-1]["generations"]
-                ]
-                if session["generations"]
-                else []
+            return await json_response(
+                request,
+                stored,
+                record_etag("session", session_id, session, "generations"),
             )
 
-        return GenerationResponse(design_space=design_space, generations=generations)
+        return await json_response(
+            request, GenerationResponse(design_space=design_space, generations=generations)
+        )
+
+    async def _stream_events(
+        self, group: str, request: Request, pending: bool = False
+    ) -> Response:
+        """Server-sent events for the build currently in flight for ``group``.
+
+        Streams the build's progress events (see ``designgalleries.generate``)
+        so cells can be filled in before the whole gallery is ready. Sends
+        ``restart`` when a superseding build takes over, and ``done`` before
+        closing. Without a build to follow the response is a 204, which also
+        stops EventSource from reconnecting; if one is ``pending`` (its
+        request is on its way), it is waited for briefly first.
+        """
+        # The stream is usually opened right alongside the request that
+        # starts the build, so give that request a moment to register it
+        # (here or, with several workers, in another one).
+        flight = self.flights.current(group)
+        elsewhere = flight is None and await self.flights.building(group)
+        steps = EVENTS_WAIT_STEPS if pending else 0
+        while flight is None and not elsewhere:
+            if steps == 0 or await request.is_disconnected():
+                return Response(status_code=204)
+            steps -= 1
+            await asyncio.sleep(EVENTS_WAIT_INTERVAL)
+            flight = self.flights.current(group)
+            elsewhere = flight is None and await self.flights.building(group)
+
+        def sse(event: dict) -> str:
+            return f"data: {json.dumps(event)}\n\n"
+
+        async def stream():
+            if elsewhere:
+                async for event in self.flights.follow(group):
+                    if await request.is_disconnected():
+                        return
+                    yield sse(event)
+                yield sse({"type": "done"})
+                return
+
+            current = flight
+            while current is not None:
+                async for event in current.subscribe():
+                    if await request.is_disconnected():
+                        return
+                    yield sse(event)
+                current = current.replaced_by
+                if current is not None:
+                    yield sse({"type": "restart"})
+            yield sse({"type": "done"})
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def generation_events(
+        self, session_id: str, request: Request, pending: bool = False
+    ):
+        """``pending`` tells that the client just sent a request that builds;
+        a session without galleries yet is always about to be built."""
+        if not pending:
+            session = database.get_session(session_id)
+            pending = session is not None and not session["generations"]
+        return await self._stream_events(f"session:{session_id}", request, pending)
 
     async def regenerate(
-        self, session_id: str, request: RegenerateRequest
+        self, session_id: str, request: RegenerateRequest, http_request: Request
     ) -> GenerationResponse:
         session = database.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        domain = next((d for d in self.domains if d.name == session["domain"]), None)
+        domain = self.domains_by_name.get(session["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
@@ -256,20 +590,107 @@ class Server:
         design_space = request.design_space or session["current_design_space"]
         if not design_space:
             raise HTTPException(status_code=404, detail="No design space found")
+        if isinstance(design_space, str):
+            design_space = DesignSpace.model_validate_json(design_space)
+
+        def build(flight):
+            # Every build of a session returns (design space, generations),
+            # since requests joining the group may get any of its builds
+            return design_space, generate(
+                session["concept"],
+                design_space,
+                domain=domain,
+                n=self.n,
+                model=self.model,
+                console=self.console,
+                cancel=flight.cancel,
+                on_event=flight.emit,
+            )
 
-        generations = generate(
-            session["concept"],
-            design_space,
-            domain=domain,
-            n=self.n,
-            model=self.model,
-            console=self.console,
+        # Identical regenerates (double-clicks) join the running build; a
+        # regenerate with a different design space supersedes (and cancels) it.
+        design_space, generations = await self._run_flight(
+            http_request,
+            f"session:{session_id}",
+            design_space_key(design_space),
+            build,
+            # Update session with new generations
+            lambda result: database.update_session(session_id, *result),
+            supersede=True,
         )
 
-        # Update session with new generations
-        database.update_session(session_id, design_space, generations)
+        return await json_response(
+            http_request,
+            GenerationResponse(design_space=design_space, generations=generations),
+        )
 
-        return GenerationResponse(design_space=design_space, generations=generations)
+    async def _refine_example(
+        self,
+        http_request: Request,
+        group: str,
+        domain: Domain,
+        stored: List[Dict],
+        index: int,
+        commit,
+    ) -> Example:
+        """Replace a preview example with its full-quality version (once)."""
+        if not (domain.preview and domain.supports_refine):
+            raise HTTPException(
+                status_code=400, detail="Domain does not generate previews"
+            )
+        if not 0 <= index < len(stored):
+            raise HTTPException(status_code=404, detail="Example not found")
+
+        example = Example.model_validate(stored[index])
+        if not example.preview:
+            return example
+
+        def build(flight):
+            refined = domain.refine(
+                Generation(
+                    prompt=example.prompt,
+                    content=example.content,
+                    seed=example.seed,
+                    preview=True,
+                ),
+                cancel=flight.cancel,
+            )
+            return example.model_copy(
+                update={
+                    "content": refined.content,
+                    "seed": refined.seed,
+                    "preview": False,
+                }
+            )
+
+        return await self._run_flight(http_request, group, "refine", build, commit)
+
+    async def refine(
+        self, session_id: str, request: RefineRequest, http_request: Request
+    ) -> Example:
+        """Refine one preview cell of the latest gallery at full resolution."""
+        session = database.get_session(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        domain = self.domains_by_name.get(session["domain"])
+        if domain is None:
+            raise HTTPException(status_code=404, detail="Domain not found")
+
+        if not session["generations"]:
+            raise HTTPException(status_code=404, detail="No generations found")
+        step_index = len(session["generations"]) - 1
+
+        return await self._refine_example(
+            http_request,
+            f"refine:{session_id}:{step_index}:{request.index}",
+            domain,
+            codec.step_examples(session["generations"][step_index]),
+            request.index,
+            lambda result: database.update_session_example(
+                session_id, step_index, request.index, result
+            ),
+        )
 
     # ------------------------------------------------------------------
     # Ablation handlers
@@ -332,12 +753,10 @@ class Server:
         current_prompt = ablation["prompts"][prompt_idx]
         variant_name = self.ABLATION_VARIANTS[variant_index]["name"]
 
-        domain = next((d for d in self.domains if d.name == ablation["domain"]), None)
+        domain = self.domains_by_name.get(ablation["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found for ablation")
 
-        custom_scripts_path = domain.scripts_path
-
         return self.templates.TemplateResponse(
             "ablation_generated.html",
             {
@@ -350,9 +769,7 @@ class Server:
                 "total_prompts": self.PROMPTS_PER_VARIANT,
                 "concept": current_prompt,
                 "domain_name": domain.display_name,
-                "scripts_path": os.path.join(
-                    f"/{domain.name}", custom_scripts_path.split("/")[-1]
-                ),
+                "scripts_path": self.scripts_url(domain),
             },
         )
 
@@ -370,7 +787,7 @@ class Server:
 
     async def create_ablation(self, request: CreateAblationRequest):
         domain_name = request.domain or "image"
-        if not any(d.name == domain_name for d in self.domains):
+        if domain_name not in self.domains_by_name:
             raise HTTPException(status_code=404, detail="Domain not found")
 
         # Shuffle prompts so each participant gets a random order
@@ -386,7 +803,9 @@ class Server:
 
         return {"url": f"/ablation/{ablation_id}"}
 
-    async def get_ablation(self, ablation_id: str) -> GenerationResponse:
+    async def get_ablation(
+        self, ablation_id: str, request: Request
+    ) -> GenerationResponse:
         """Returns the current generation for the ablation, creating it if needed."""
         ablation = database.get_ablation(ablation_id)
         if not ablation:
@@ -406,53 +825,90 @@ class Server:
             raise HTTPException(status_code=400, detail="Ablation completed")
         current_prompt = ablation["prompts"][prompt_idx]
 
-        domain = next((d for d in self.domains if d.name == ablation["domain"]), None)
+        domain = self.domains_by_name.get(ablation["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
-        # If no design space exists for this prompt, create & generate
-        if not ablation.get("current_design_space"):
-            design_space = DesignSpace.create(current_prompt, domain.display_name)
-
-            # Determine exploration mode
-            design_space.explore_new_axis()
-            design_space.fill()
-
-            generations = generate(
-                current_prompt,
-                design_space,
-                domain=domain,
-                n=self.n,
-                model=self.model,
-                console=self.console,
-                sort_results=variant_config["sort_results"],
-                explore_all_axes=variant_config["explore_all_axes"],
+        # If no design space exists for this prompt, serve the precomputed
+        # first gallery (see precompute.py) or create & generate one
+        cached = (
+            precomputed.get(
+                domain.name, variant_config["name"], current_prompt, self.n
             )
-
+            if not ablation.get("current_design_space")
+            else None
+        )
+        if cached is not None:
+            design_space, generations = cached
             database.update_ablation_generation(
-                ablation_id,
-                variant_index,
-                prompt_index,
-                design_space,
-                generations,
+                ablation_id, variant_index, prompt_index, design_space, generations
             )
-        else:
-            design_space = DesignSpace.model_validate_json(
-                ablation["current_design_space"]
+        elif not ablation.get("current_design_space"):
+
+            def build(flight):
+                design_space = DesignSpace.create(
+                    current_prompt, domain.display_name, cancel=flight.cancel
+                )
+
+                # Determine exploration mode
+                design_space.explore_new_axis()
+                design_space.fill(cancel=flight.cancel)
+
+                generations = generate(
+                    current_prompt,
+                    design_space,
+                    domain=domain,
+                    n=self.n,
+                    model=self.model,
+                    console=self.console,
+                    sort_results=variant_config["sort_results"],
+                    explore_all_axes=variant_config["explore_all_axes"],
+                    cancel=flight.cancel,
+                    on_event=flight.emit,
+                )
+                return design_space, generations
+
+            design_space, generations = await self._run_flight(
+                request,
+                f"ablation:{ablation_id}",
+                f"initial:{variant_index}:{prompt_index}",
+                build,
+                lambda result: database.update_ablation_generation(
+                    ablation_id, variant_index, prompt_index, *result
+                ),
             )
-            generations = (
-                [
-                    Example.model_validate_json(gen)
-                    for gen in ablation["history"][-1]["generations"]
-                ]
-                if ablation.get("history")
-                else []
+        else:
+
+            def stored() -> Dict:
+                # Validated when stored; serialized as-is (GenerationResponse)
+                return {
+                    "design_space": json.loads(ablation["current_design_space"]),
+                    "generations": (
+                        codec.step_examples(ablation["history"][-1])
+                        if ablation.get("history")
+                        else []
+                    ),
+                }
+
+            return await json_response(
+                request,
+                stored,
+                record_etag(
+                    "ablation",
+                    ablation_id,
+                    ablation,
+                    "history",
+                    variant_index,
+                    prompt_index,
+                ),
             )
 
-        return GenerationResponse(design_space=design_space, generations=generations)
+        return await json_response(
+            request, GenerationResponse(design_space=design_space, generations=generations)
+        )
 
     async def ablation_regenerate(
-        self, ablation_id: str, request: RegenerateRequest
+        self, ablation_id: str, request: RegenerateRequest, http_request: Request
     ) -> GenerationResponse:
         ablation = database.get_ablation(ablation_id)
         if not ablation:
@@ -467,7 +923,7 @@ class Server:
 
         variant_config = self.ABLATION_VARIANTS[variant_index]
 
-        domain = next((d for d in self.domains if d.name == ablation["domain"]), None)
+        domain = self.domains_by_name.get(ablation["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
@@ -483,22 +939,36 @@ class Server:
             raise HTTPException(status_code=400, detail="Ablation completed")
         current_prompt = ablation["prompts"][prompt_idx]
 
-        generations = generate(
-            current_prompt,
-            design_space,
-            domain=domain,
-            n=self.n,
-            model=self.model,
-            console=self.console,
-            sort_results=variant_config["sort_results"],
-            explore_all_axes=variant_config["explore_all_axes"],
-        )
+        def build(flight):
+            # Same shape as the initial build: (design space, generations)
+            return design_space, generate(
+                current_prompt,
+                design_space,
+                domain=domain,
+                n=self.n,
+                model=self.model,
+                console=self.console,
+                sort_results=variant_config["sort_results"],
+                explore_all_axes=variant_config["explore_all_axes"],
+                cancel=flight.cancel,
+                on_event=flight.emit,
+            )
 
-        database.update_ablation_generation(
-            ablation_id, variant_index, prompt_index, design_space, generations
+        design_space, generations = await self._run_flight(
+            http_request,
+            f"ablation:{ablation_id}",
+            design_space_key(design_space),
+            build,
+            lambda result: database.update_ablation_generation(
+                ablation_id, variant_index, prompt_index, *result
+            ),
+            supersede=True,
         )
 
-        return GenerationResponse(design_space=design_space, generations=generations)
+        return await json_response(
+            http_request,
+            GenerationResponse(design_space=design_space, generations=generations),
+        )
 
     async def ablation_next(self, ablation_id: str):
         """Advance to the next prompt / variant."""
@@ -509,76 +979,160 @@ class Server:
         )
         return {"status": "ok"}
 
+    async def ablation_refine(
+        self, ablation_id: str, request: RefineRequest, http_request: Request
+    ) -> Example:
+        ablation = database.get_ablation(ablation_id)
+        if not ablation:
+            raise HTTPException(status_code=404, detail="Ablation not found")
+
+        domain = self.domains_by_name.get(ablation["domain"])
+        if domain is None:
+            raise HTTPException(status_code=404, detail="Domain not found")
+
+        if not ablation.get("history"):
+            raise HTTPException(status_code=404, detail="No generations found")
+        step_index = len(ablation["history"]) - 1
+
+        return await self._refine_example(
+            http_request,
+            f"refine-ablation:{ablation_id}:{step_index}:{request.index}",
+            domain,
+            codec.step_examples(ablation["history"][step_index]),
+            request.index,
+            lambda result: database.update_ablation_example(
+                ablation_id, step_index, request.index, result
+            ),
+        )
+
+    async def ablation_events(
+        self, ablation_id: str, request: Request, pending: bool = False
+    ):
+        return await self._stream_events(f"ablation:{ablation_id}", request, pending)
+
     async def ablation_viewer_page(self, request: Request, ablation_id: str):
         """Read-only page to replay an ablation run after completion."""
         ablation = database.get_ablation(ablation_id)
         if not ablation:
             raise HTTPException(status_code=404, detail="Ablation not found")
 
-        domain = next((d for d in self.domains if d.name == ablation["domain"]), None)
+        domain = self.domains_by_name.get(ablation["domain"])
         if domain is None:
             raise HTTPException(status_code=404, detail="Domain not found")
 
-        custom_scripts_path = domain.scripts_path
-
         return self.templates.TemplateResponse(
             "ablation_viewer.html",
             {
                 "request": request,
                 "ablation_id": ablation_id,
                 "user_name": ablation.get("user_name", ""),
-                "scripts_path": os.path.join(
-                    f"/{domain.name}", custom_scripts_path.split("/")[-1]
-                ),
+                "scripts_path": self.scripts_url(domain),
             },
         )
 
-    async def get_ablation_history(self, ablation_id: str):
-        """Return the full, parsed generation history for a finished ablation."""
-        import json
+    @staticmethod
+    def _history_entry(history: List[Dict], index: int) -> Dict:
+        """Step ``index`` of an ablation's history, parsed for the wire.
 
+        Archived steps (stubs) are summarized; their whole entry is served
+        on its own (see ``get_ablation_history_entry``).
+        """
+        record = history[index]
+        entry = {
+            "variant_index": record.get("variant_index"),
+            "prompt_index": record.get("prompt_index"),
+            "timestamp": record.get("timestamp"),
+        }
+        if record.get("archived"):
+            return {**entry, "archived": True, "examples": record.get("examples")}
+        return {
+            **entry,
+            # Parse stored JSON strings back into objects/dicts that can be sent over the wire
+            "design_space": json.loads(record["design_space"]),
+            # Axes changed at this step (see designhistory.diff)
+            "changes": changes(history, index),
+            "generations": codec.step_examples(record),
+        }
+
+    @staticmethod
+    def _history_etag(ablation_id: str, ablation: Dict, *extra) -> str:
+        archived = sum(bool(step.get("archived")) for step in ablation.get("history", []))
+        return record_etag("ablation-history", ablation_id, ablation, "history", archived, *extra)
+
+    async def get_ablation_history(self, ablation_id: str, request: Request):
+        """Return the parsed generation history for a finished ablation.
+
+        Archived steps are only summarized, so listing the history never
+        reads the archive (besides the step before the first hot one, for
+        its ``changes``).
+        """
         ablation = database.get_ablation(ablation_id)
         if not ablation:
             raise HTTPException(status_code=404, detail="Ablation not found")
 
-        history = ablation.get("history", [])
-        parsed_history = []
-        for record in history:
-            # Parse stored JSON strings back into objects/dicts that can be sent over the wire
-            design_space = json.loads(record["design_space"])
-            generations = [json.loads(g) for g in record.get("generations", [])]
-            parsed_history.append(
-                {
-                    "variant_index": record.get("variant_index"),
-                    "prompt_index": record.get("prompt_index"),
-                    "timestamp": record.get("timestamp"),
-                    "design_space": design_space,
-                    "generations": generations,
-                }
+        def parse_history() -> List[Dict]:
+            steps = ablation.get("history", [])
+            first_hot = next(
+                (i for i, step in enumerate(steps) if not step.get("archived")), 0
             )
+            history = expand_steps(
+                cold_archive.rehydrate(
+                    "ablations", ablation_id, steps, [first_hot - 1]
+                )
+            )
+            return [
+                self._history_entry(
+                    steps if steps[index].get("archived") else history, index
+                )
+                for index in range(len(steps))
+            ]
+
+        return await json_response(
+            request, parse_history, self._history_etag(ablation_id, ablation)
+        )
 
-        return parsed_history
+    async def get_ablation_history_entry(
+        self, ablation_id: str, index: int, request: Request
+    ):
+        """One whole step of an ablation's history, loaded from the archive if
+        it has been archived."""
+        ablation = database.get_ablation(ablation_id)
+        steps = (ablation or {}).get("history", [])
+        if not 0 <= index < len(steps):
+            raise HTTPException(status_code=404, detail="History entry not found")
+
+        def parse_entry() -> Dict:
+            history = cold_archive.rehydrate(
+                "ablations", ablation_id, steps, [index - 1, index]
+            )
+            # Archived steps are stored whole; hot ones may need their deltas
+            # replayed from the nearest keyframe
+            return self._history_entry(expand_steps(history), index)
+
+        return await json_response(
+            request, parse_entry, self._history_etag(ablation_id, ablation, index)
+        )
 
     async def ablations_overview_page(self, request: Request):
         """List all ablation runs with a preview image."""
-        import json
-
         ablations = database.list_ablations()
         overview_items = []
         for record in ablations:
             sample_img = None
             if record.get("history"):
-                first_gen = (
-                    record["history"][0]["generations"][0]
-                    if record["history"][0]["generations"]
-                    else None
+                # Archived steps are stubs without examples; use the first
+                # step that still has them
+                first_gen = next(
+                    (
+                        gen
+                        for step in record["history"]
+                        if not step.get("archived")
+                        for gen in codec.step_examples(step)
+                    ),
+                    None,
                 )
                 if first_gen:
-                    try:
-                        gen_obj = json.loads(first_gen)
-                        sample_img = gen_obj.get("content")
-                    except Exception:
-                        sample_img = None
+                    sample_img = first_gen.get("content")
             overview_items.append(
                 {
                     "id": record["id"],
@@ -590,9 +1144,7 @@ class Server:
                         if record.get("created_at")
                         else ""
                     ),
-                    "sample_img": (
-                        f"data:image/png;base64,{sample_img}" if sample_img else None
-                    ),
+                    "sample_img": image_url(sample_img, "thumb") if sample_img else None,
                 }
             )
 
@@ -610,19 +1162,46 @@ class Server:
         a caption "Exploring <axis>" indicate which design dimension was being
         iterated on.
         """
-        if plt is None or Rectangle is None:  # Matplotlib missing – user must install
+        figure_stack = _figure_stack()
+        if figure_stack is None:  # Matplotlib missing – user must install
             raise HTTPException(
                 status_code=500,
                 detail="matplotlib is required for this endpoint. Add it to your environment.",
             )
+        plt, FancyBboxPatch, font_prop = figure_stack
 
         session = database.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        history = session.get("generations", [])
+        history = cold_archive.rehydrate(
+            "sessions", session_id, session.get("generations", [])
+        )
         if not history:
             raise HTTPException(status_code=404, detail="No generation history found")
+        # Every design space in one pass, as plain dicts (steps that can't be
+        # reconstructed are None and skipped)
+        spaces = design_spaces(history)
+
+        # The value chosen for each step's exploring axis is the one the next
+        # step that sets that axis gave it; one backward pass finds them all
+        exploring: list[str] = []
+        selected: list[str | None] = []
+        later_values: dict[str, str] = {}
+        for space in reversed(spaces):
+            axes = space["axes"] if space is not None else []
+            axis_name = next(
+                (axis["name"] for axis in axes if axis.get("status") == "exploring"),
+                "",
+            )
+            exploring.append(axis_name)
+            value = later_values.get(axis_name)
+            selected.append(value.lower() if value else None)
+            for axis in axes:
+                if axis.get("value"):
+                    later_values[axis["name"]] = axis["value"]
+        exploring.reverse()
+        selected.reverse()
 
         # Each row: axis name, list of (label, image_b64 | None)
         rows: list[tuple[str, list[tuple[str, str | None]], str | None]] = []
@@ -630,24 +1209,12 @@ class Server:
 
         total_steps = len(history)
         for idx, step in enumerate(history):
-            # Reconstruct DesignSpace to find the currently explored axis
-            design_space_json = step.get("design_space")
-            try:
-                design_space = DesignSpace.model_validate_json(design_space_json)
-            except Exception:
+            if spaces[idx] is None:
                 continue  # skip malformed entries
-
-            exploring_axis = next(
-                (axis for axis in design_space.axes if axis.status == "exploring"),
-                None,
-            )
-            axis_name = exploring_axis.name if exploring_axis else ""
+            axis_name = exploring[idx]
 
             # Decode examples and extract tag values for the exploring axis
-            examples_json = step.get("generations", [])
-            example_objs = [
-                Example.model_validate_json(ej) for ej in examples_json if ej
-            ]
+            example_objs = codec.load_examples(step)
 
             cells: list[tuple[str, str]] = []
             for ex in example_objs:
@@ -658,21 +1225,7 @@ class Server:
                 label = match if match is not None else ""
                 cells.append((label, ex.content))
 
-            # Determine which value was selected for this axis by looking ahead
-            selected_value: str | None = None
-            for later_step in history[idx + 1 :]:
-                later_ds_json = later_step.get("design_space")
-                try:
-                    later_ds = DesignSpace.model_validate_json(later_ds_json)
-                except Exception:
-                    continue
-                later_axis = next(
-                    (a for a in later_ds.axes if a.name == axis_name), None
-                )
-                if later_axis and later_axis.value:
-                    selected_value = later_axis.value.lower()
-                    break
-
+            selected_value = selected[idx]
             max_cols = max(max_cols, len(cells))
 
             # If this is the last row and no value was selected, choose one randomly
@@ -746,10 +1299,9 @@ class Server:
 
                 if domain_type == "image":
                     # Render image clipped to rounded rectangle
-                    from base64 import b64decode as _bd
                     from PIL import Image  # type: ignore
 
-                    img_bytes = _bd(cell_content)
+                    img_bytes = image_bytes(cell_content, "grid")
                     img = Image.open(BytesIO(img_bytes))
                     im = ax.imshow(
                         img,
@@ -919,15 +1471,81 @@ class Server:
         buf.seek(0)
         return StreamingResponse(buf, media_type="application/pdf")
 
-    def run(self, reload: bool = False, port: int = 8000):
-        uvicorn.run(self.app, host="0.0.0.0", port=port, reload=reload)
+    def run(
+        self,
+        reload: bool = False,
+        port: int = 8000,
+        forwarded_allow_ips: str | None = None,
+    ):
+        uvicorn.run(
+            self.app,
+            host="0.0.0.0",
+            port=port,
+            reload=reload,
+            forwarded_allow_ips=forwarded_allow_ips,
+        )
+
 
+# Command line of the parent process, handed to worker processes in multi-worker mode
+SERVER_ARGS_ENV = "AXES_SERVER_ARGS"
 
-def parse_args():
+
+def parse_args(argv: List[str] | None = None):
     parser = argparse.ArgumentParser(description="Run FastAPI server")
     parser.add_argument(
         "--port", type=int, default=8000, help="Port to run the server on"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; more than one requires a shared --state backend",
+    )
+    parser.add_argument(
+        "--forwarded-allow-ips",
+        type=str,
+        default=None,
+        help="Comma-separated proxy addresses (or *) trusted to set "
+        "X-Forwarded-For; clients are identified by it only behind these "
+        "(default: $FORWARDED_ALLOW_IPS or 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--max-builds",
+        type=int,
+        default=8,
+        help="Gallery builds running at once across all workers; more requests queue",
+    )
+    parser.add_argument(
+        "--max-builds-per-client",
+        type=int,
+        default=2,
+        help="Gallery builds running at once per client",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=32,
+        help="Requests waiting for a build slot before new ones get a 429",
+    )
+    parser.add_argument(
+        "--max-queue-wait",
+        type=float,
+        default=30.0,
+        help="Seconds a request may wait for a build slot before getting a 429",
+    )
+    parser.add_argument(
+        "--client-rate",
+        type=float,
+        default=None,
+        help="Builds per minute each client may start (shared across workers)",
+    )
+    parser.add_argument(
+        "--state",
+        type=str,
+        default=None,
+        help="Shared state backend: memory, sqlite:///path or redis://host "
+        f"(default: memory, or sqlite://{DEFAULT_SQLITE_PATH} with --workers > 1)",
+    )
     parser.add_argument(
         "--n", type=int, default=6, help="Number of layouts to generate"
     )
@@ -937,25 +1555,226 @@ def parse_args():
     )
     parser.add_argument("--model", type=str, default=text_model, help="Model to use")
     parser.add_argument("--cerebras", action="store_true", help="Use Cerebras model")
-    return parser.parse_args()
+    parser.add_argument(
+        "--routes",
+        type=str,
+        default=None,
+        help='Per-stage model routing: a JSON file of {stage: [{"provider", "model"}]}, or "default"',
+    )
+    parser.add_argument(
+        "--preview",
+        nargs="*",
+        default=[],
+        choices=["image"],
+        help="Domains that generate fast previews first and refine them on demand",
+    )
+    parser.add_argument(
+        "--single-pass",
+        nargs="*",
+        default=[],
+        choices=["text", "ui"],
+        help="Domains that expand and generate in a single LLM call",
+    )
+    parser.add_argument(
+        "--no-single-pass-prompt",
+        action="store_true",
+        help="In single-pass mode, skip asking for the expanded prompt",
+    )
+    parser.add_argument(
+        "--precomputed-dir",
+        type=str,
+        default=precomputed.root,
+        help="Directory of precomputed ablation galleries (see precompute.py)",
+    )
+    parser.add_argument(
+        "--blob-dir",
+        type=str,
+        default=blobs.root,
+        help="Directory caching images and their transcoded variants "
+        "(originals are kept in --object-store)",
+    )
+    parser.add_argument(
+        "--object-store",
+        type=str,
+        default=objects.url,
+        help="Durable store for original images and archived steps: gs://bucket[/prefix] or a "
+        "directory (default: $OBJECT_STORE, the $FIREBASE_STORAGE_BUCKET "
+        f"bucket, or {DEFAULT_OBJECT_DIR})",
+    )
+    parser.add_argument(
+        "--compact-keep",
+        type=int,
+        default=0,
+        help="Archive all but the last K steps of every session/ablation in the "
+        "background, into a bucket --object-store (0 disables compaction)",
+    )
+    parser.add_argument(
+        "--compact-rate",
+        type=float,
+        default=1.0,
+        help="Records compacted per second at most",
+    )
+    parser.add_argument(
+        "--compact-interval",
+        type=float,
+        default=600.0,
+        help="Seconds between compaction runs",
+    )
+    cassettes = parser.add_mutually_exclusive_group()
+    cassettes.add_argument(
+        "--record-cassette",
+        metavar="DIR",
+        help="Record all LLM and image-model traffic (with timings) to DIR",
+    )
+    cassettes.add_argument(
+        "--replay-cassette",
+        metavar="DIR",
+        help="Answer LLM and image-model calls from a cassette recorded to DIR",
+    )
+    parser.add_argument(
+        "--replay-latency-scale",
+        type=float,
+        default=cassette.latency_scale,
+        help="Replayed latency relative to the recorded one (0.25 = 4x faster, 0 = none)",
+    )
+    parser.add_argument(
+        "--admin-token",
+        default=os.getenv("ADMIN_TOKEN"),
+        help="Token for the admin (profiling) endpoints; they are disabled without one",
+    )
+    parser.add_argument(
+        "--loop-lag-threshold",
+        type=float,
+        default=loop_watchdog.threshold,
+        help="Log the event loop's stack when it is blocked this many seconds (0 disables)",
+    )
+    parser.add_argument(
+        "--concept-threshold",
+        type=float,
+        default=concept_index.threshold,
+        help="Similarity above which a new concept reuses cached axes (>1 disables)",
+    )
+    parser.add_argument(
+        "--refresh-reused-axes",
+        action="store_true",
+        help="Regenerate reused axes in the background",
+    )
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.state == "memory":
+        parser.error("--workers > 1 needs a shared --state backend")
+    if args.compact_keep > 0 and not open_object_store(args.object_store).durable:
+        # Compaction leaves only stubs in the database
+        parser.error("--compact-keep needs a durable (gs://) --object-store")
+    return args
 
 
-def main():
-    args = parse_args()
+def build_server(args) -> Server:
+    """Configure the process-wide singletons from ``args`` and build the server."""
     console = Console()
+    state = args.state or (
+        f"sqlite://{DEFAULT_SQLITE_PATH}" if args.workers > 1 else "memory"
+    )
+    shared_state.configure(state)
+    if args.routes == "default":
+        router.configure(DEFAULT_ROUTES)
+    elif args.routes:
+        router.load(args.routes)
+    concept_index.threshold = args.concept_threshold
+    precomputed.root = args.precomputed_dir
+    blobs.root = args.blob_dir
+    objects.configure(args.object_store)
+    if not objects.durable:
+        console.print(
+            f"Original images are stored in {args.object_store}, which does not "
+            "survive a redeploy unless it is a mounted volume; use --object-store "
+            "gs://<bucket> in production",
+            style="yellow",
+        )
+    compactor = None
+    if args.compact_keep > 0:
+        compactor = Compactor(
+            database,
+            keep=args.compact_keep,
+            records_per_second=args.compact_rate,
+            interval=args.compact_interval,
+        )
+    concept_index.refresh = args.refresh_reused_axes
+    loop_watchdog.threshold = args.loop_lag_threshold
+    if args.record_cassette:
+        cassette.record(args.record_cassette)
+    elif args.replay_cassette:
+        cassette.replay(args.replay_cassette, args.replay_latency_scale)
     if args.cerebras:
         model = "cerebras"
     else:
         model = args.model
 
     domains = [
-        ImageGen(data_dir=args.data_dir, console=console, model=model),
-        TextGen(data_dir=args.data_dir, console=console, model=model),
-        UIGen(data_dir=args.data_dir, console=console, model=model),
+        ImageGen(
+            data_dir=args.data_dir,
+            console=console,
+            model=model,
+            preview="image" in args.preview,
+        ),
+        TextGen(
+            data_dir=args.data_dir,
+            console=console,
+            model=model,
+            single_pass="text" in args.single_pass,
+            include_prompt=not args.no_single_pass_prompt,
+        ),
+        UIGen(
+            data_dir=args.data_dir,
+            console=console,
+            model=model,
+            single_pass="ui" in args.single_pass,
+            include_prompt=not args.no_single_pass_prompt,
+        ),
     ]
 
-    server = Server(n=args.n, domains=domains, model=model)
-    server.run(reload=False, port=args.port)
+    admission = AdmissionController(
+        max_builds=args.max_builds,
+        max_builds_per_client=args.max_builds_per_client,
+        max_queue=args.max_queue,
+        max_wait=args.max_queue_wait,
+        client_rate=args.client_rate,
+        state=shared_state,
+    )
+    return Server(
+        n=args.n,
+        domains=domains,
+        model=model,
+        admission=admission,
+        admin_token=args.admin_token,
+        compactor=compactor,
+    )
+
+
+def create_app() -> FastAPI:
+    """App factory run by each worker process in multi-worker mode."""
+    args = parse_args(json.loads(os.environ[SERVER_ARGS_ENV]))
+    return build_server(args).app
+
+
+def main():
+    args = parse_args()
+    if args.workers > 1:
+        # The supervisor only validates the arguments; each worker builds
+        # (and starts the background work of) its own server
+        os.environ[SERVER_ARGS_ENV] = json.dumps(sys.argv[1:])
+        uvicorn.run(
+            "server:create_app",
+            factory=True,
+            host="0.0.0.0",
+            port=args.port,
+            workers=args.workers,
+            forwarded_allow_ips=args.forwarded_allow_ips,
+        )
+        return
+    server = build_server(args)
+    server.run(
+        reload=False, port=args.port, forwarded_allow_ips=args.forwarded_allow_ips
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,392 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_SQLITE_PATH = "../.data/shared_state.sqlite"
+
+
+class MemoryState:
+    """In-process backend: correct for a single worker, and the default."""
+
+    # Whether other processes see this state (enables cross-process coordination)
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lists: Dict[str, Tuple[List[bytes], float]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def append(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            items, _ = self._lists.get(key, ([], 0.0))
+            self._lists[key] = (items + [value], time.time() + ttl)
+
+    def read(self, key: str, start: int = 0) -> List[bytes]:
+        with self._lock:
+            items, expires = self._lists.get(key, ([], 0.0))
+            if expires < time.time():
+                self._lists.pop(key, None)
+                return []
+            return items[start:]
+
+    def acquire(self, name: str, value: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[1] > now and holder[0] != value:
+                return holder[0]
+            self._leases[name] = (value, now + ttl)
+            return None
+
+    def holder(self, name: str) -> Optional[str]:
+        with self._lock:
+            holder = self._leases.get(name)
+            return holder[0] if holder is not None and holder[1] > time.time() else None
+
+    def renew(self, name: str, value: str, ttl: float) -> bool:
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is None or holder[0] != value:
+                return False
+            self._leases[name] = (value, time.time() + ttl)
+            return True
+
+    def release(self, name: str, value: str) -> None:
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[0] == value:
+                del self._leases[name]
+
+    def take(self, bucket: str, rate: float, burst: float, n: float = 1) -> float:
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(bucket, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= n:
+                self._buckets[bucket] = (tokens - n, now)
+                return 0.0
+            self._buckets[bucket] = (tokens, now)
+            return (n - tokens) / rate
+
+
+class SQLiteState:
+    """Backend shared by every process on one machine through a SQLite file.
+
+    Each thread gets its own connection; the database runs in WAL mode and
+    read-modify-write operations (leases, token buckets) run inside
+    ``BEGIN IMMEDIATE`` transactions, so they are atomic across processes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS lists (key TEXT, seq INTEGER, value BLOB, expires REAL, PRIMARY KEY (key, seq))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None),
+            )
+            db.execute("DELETE FROM kv WHERE expires < ?", (now,))
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def append(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        with self._transaction() as db:
+            (seq,) = db.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM lists WHERE key = ?", (key,)
+            ).fetchone()
+            db.execute(
+                "INSERT INTO lists (key, seq, value, expires) VALUES (?, ?, ?, ?)",
+                (key, seq, value, now + ttl),
+            )
+            db.execute("UPDATE lists SET expires = ? WHERE key = ?", (now + ttl, key))
+            db.execute("DELETE FROM lists WHERE expires < ?", (now,))
+
+    def read(self, key: str, start: int = 0) -> List[bytes]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT value FROM lists WHERE key = ? AND seq >= ? AND expires >= ? ORDER BY seq",
+                (key, start, time.time()),
+            )
+            .fetchall()
+        )
+        return [row[0] for row in rows]
+
+    def acquire(self, name: str, value: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT value, expires FROM leases WHERE name = ?", (name,)
+            ).fetchone()
+            if row is not None and row[1] > now and row[0] != value:
+                return row[0]
+            db.execute(
+                "INSERT OR REPLACE INTO leases (name, value, expires) VALUES (?, ?, ?)",
+                (name, value, now + ttl),
+            )
+            return None
+
+    def holder(self, name: str) -> Optional[str]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM leases WHERE name = ? AND expires > ?",
+                (name, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def renew(self, name: str, value: str, ttl: float) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE leases SET expires = ? WHERE name = ? AND value = ?",
+            (time.time() + ttl, name, value),
+        )
+        return cursor.rowcount > 0
+
+    def release(self, name: str, value: str) -> None:
+        self._connection().execute(
+            "DELETE FROM leases WHERE name = ? AND value = ?", (name, value)
+        )
+
+    def take(self, bucket: str, rate: float, burst: float, n: float = 1) -> float:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?", (bucket,)
+            ).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= n else (n - tokens) / rate
+            if not wait:
+                tokens -= n
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (bucket, tokens, now),
+            )
+            return wait
+
+
+class RedisState:
+    """Backend shared across machines through a Redis-compatible server."""
+
+    shared = True
+
+    _RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    _TAKE = """
+local rate, burst, n, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= n then tokens = tokens - n else wait = (n - tokens) / rate end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('expire', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+    def __init__(self, url: str):
+        # Only needed for this backend
+        try:
+            import redis  # type: ignore
+        except ModuleNotFoundError:
+            raise RuntimeError(
+                'The redis state backend requires redis: install the "redis" extra (pip install ".[redis]")'
+            ) from None
+
+        self.redis = redis.Redis.from_url(url)
+        self._renew = self.redis.register_script(self._RENEW)
+        self._release = self.redis.register_script(self._RELEASE)
+        self._take = self.redis.register_script(self._TAKE)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.redis.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self.redis.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str) -> None:
+        self.redis.delete(key)
+
+    def append(self, key: str, value: bytes, ttl: float) -> None:
+        self.redis.pipeline().rpush(key, value).pexpire(key, int(ttl * 1000)).execute()
+
+    def read(self, key: str, start: int = 0) -> List[bytes]:
+        return self.redis.lrange(key, start, -1)
+
+    def acquire(self, name: str, value: str, ttl: float) -> Optional[str]:
+        if self.redis.set(name, value, nx=True, px=int(ttl * 1000)):
+            return None
+        holder = self.redis.get(name)
+        if holder is None:
+            return self.acquire(name, value, ttl)
+        holder = holder.decode()
+        if holder == value:
+            self.renew(name, value, ttl)
+            return None
+        return holder
+
+    def holder(self, name: str) -> Optional[str]:
+        holder = self.redis.get(name)
+        return holder.decode() if holder is not None else None
+
+    def renew(self, name: str, value: str, ttl: float) -> bool:
+        return bool(self._renew(keys=[name], args=[value, int(ttl * 1000)]))
+
+    def release(self, name: str, value: str) -> None:
+        self._release(keys=[name], args=[value])
+
+    def take(self, bucket: str, rate: float, burst: float, n: float = 1) -> float:
+        return float(self._take(keys=[bucket], args=[rate, burst, n, time.time()]))
+
+
+def open_state(url: str):
+    """``memory``, ``sqlite:///path/to/file`` (or a bare ``.sqlite`` path), or ``redis://...``."""
+    if url == "memory":
+        return MemoryState()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url)
+    if url.startswith("sqlite://"):
+        return SQLiteState(url[len("sqlite://") :] or DEFAULT_SQLITE_PATH)
+    if url.endswith((".sqlite", ".db")):
+        return SQLiteState(url)
+    raise ValueError(f"Unknown shared state backend: {url!r}")
+
+
+class SharedState:
+    """State shared by every worker serving the app: a TTL cache, append-only
+    lists, leases (cross-process locks) and token buckets.
+
+    Delegates to the configured backend; ``configure`` swaps it at startup so
+    modules can keep a reference to the ``shared_state`` singleton.
+    """
+
+    def __init__(self, url: str = "memory"):
+        self.configure(url)
+
+    def configure(self, url: str) -> None:
+        self.url = url
+        self.backend = open_state(url)
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.backend.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self.backend.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def append(self, key: str, value: bytes, ttl: float) -> None:
+        """Append ``value`` to list ``key``; the list expires ``ttl`` seconds
+        after its last append."""
+        self.backend.append(key, value, ttl)
+
+    def read(self, key: str, start: int = 0) -> List[bytes]:
+        """The items of list ``key`` from index ``start`` on."""
+        return self.backend.read(key, start)
+
+    def acquire(self, name: str, value: str, ttl: float) -> Optional[str]:
+        """Take lease ``name`` as ``value``. Returns None on success (or if it
+        is already ours), otherwise the value of the current holder."""
+        return self.backend.acquire(name, value, ttl)
+
+    def holder(self, name: str) -> Optional[str]:
+        """The value of lease ``name``'s current holder, if it is held."""
+        return self.backend.holder(name)
+
+    def renew(self, name: str, value: str, ttl: float) -> bool:
+        return self.backend.renew(name, value, ttl)
+
+    def release(self, name: str, value: str) -> None:
+        self.backend.release(name, value)
+
+    def take(self, bucket: str, rate: float, burst: float, n: float = 1) -> float:
+        """Take ``n`` tokens from a bucket refilled at ``rate``/s up to ``burst``.
+        Returns 0 if granted, otherwise the seconds until enough tokens exist."""
+        return self.backend.take(bucket, rate, burst, n)
+
+
+shared_state = SharedState()
@@ -0,0 +1,476 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
+
+from cancellation import CancelToken, GenerationCancelled
+
+# How often a waiting request checks whether its client has gone away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Cross-process coordination (only with a shared state backend): a build holds
+# a lease on its group, renewed while it runs, and publishes its result for
+# builds waiting in other processes.
+LEASE_TTL = 30.0
+SHARED_POLL_INTERVAL = 0.25
+# How often a running build checks whether another worker superseded it
+SUPERSEDE_POLL_INTERVAL = 1.0
+RESULT_TTL = 120.0
+# A build's progress events are copied to the shared state in batches this
+# often, for event streams opened on other workers
+EVENTS_FLUSH_INTERVAL = 0.1
+# How long a stream following a superseded build in another process waits
+# for the build replacing it to start
+SUCCESSOR_WAIT = 5.0
+
+# Returned by _coordinate when this process should run the build itself
+_BUILD = object()
+
+
+class Flight:
+    """A single in-flight build for a group (usually one session)."""
+
+    def __init__(self, group: str, key: str, supersede: bool = False):
+        self.id = uuid.uuid4().hex
+        self.group = group
+        self.key = key
+        self.supersede = supersede
+        self.created = time.time()
+        self.cancel = CancelToken()
+        self.task: Optional[asyncio.Task] = None
+        # Set when a superseding request replaces this build; waiters follow it
+        self.replaced_by: Optional["Flight"] = None
+        # Set when a request in another process superseded this build
+        self.superseded = False
+        self.waiters = 0
+        # Progress events published by the build, replayed to late subscribers
+        self.events: List[dict] = []
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._loop = asyncio.get_running_loop()
+        # Set once a build holding the shared lease is over
+        self.finished = asyncio.Event()
+
+    def emit(self, event: dict) -> None:
+        """Publish a progress event. Safe to call from the build's worker threads."""
+        self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: dict) -> None:
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        """Yield every event of this build, starting with those already published,
+        until the build finishes."""
+        queue: asyncio.Queue = asyncio.Queue()
+        backlog = list(self.events)
+        self._subscribers.add(queue)
+        try:
+            for event in backlog:
+                yield event
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {get, self.task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if get in done:
+                    yield get.result()
+                    continue
+                get.cancel()
+                while not queue.empty():
+                    yield queue.get_nowait()
+                return
+        finally:
+            self._subscribers.discard(queue)
+
+
+class SingleFlight:
+    """Per-group request coalescing for expensive gallery builds.
+
+    Concurrent requests for the same group and key attach to the build that
+    is already running and share its result instead of starting their own.
+    A request made with ``supersede=True`` and a different key replaces the
+    running build: the old build is cancelled, its result is never committed,
+    and everyone waiting on it receives the replacement's result instead.
+
+    A build whose waiters have all gone away (closed tab, aborted fetch) is
+    cancelled as well, so nobody pays for a gallery nobody will see.
+
+    With a shared ``state`` (see ``sharedstate.py``) the same guarantees hold
+    across worker processes: one build per group at a time, requests in
+    other workers wait for its published result, and a superseding request
+    cancels the build wherever it runs. Local waiters of a build superseded
+    from another worker receive ``GenerationCancelled``. Progress events
+    are copied to the shared state too, so event streams opened on any
+    worker see the build (see ``follow``).
+
+    Published results are stored as JSON: lists, tuples, dicts, plain values
+    and instances of the pydantic ``models`` passed in, which are rebuilt
+    from their ``model_dump()`` (nothing else is ever instantiated).
+    """
+
+    def __init__(self, state=None, models: Iterable[type] = ()):
+        self._flights: Dict[str, Flight] = {}
+        self.state = state
+        self.models = {model.__name__: model for model in models}
+
+    def current(self, group: str) -> Optional[Flight]:
+        return self._flights.get(group)
+
+    async def run(
+        self,
+        group: str,
+        key: str,
+        build: Callable[[Flight], Any],
+        commit: Callable[[Any], None] | None = None,
+        *,
+        supersede: bool = False,
+        is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+        admit: Callable[[], Awaitable[Callable[[], None]]] | None = None,
+    ) -> Any:
+        """Run ``build`` (in a worker thread) unless an equivalent build is in flight.
+
+        ``build`` receives the flight; it should pass ``flight.cancel`` down to
+        every model call and may publish progress with ``flight.emit``. ``commit`` is called with the result only if the
+        build is still the current one for its group when it finishes, so a
+        superseded build can never overwrite newer state.
+
+        Raises ``GenerationCancelled`` if ``is_disconnected`` reports that the
+        caller went away before the result was ready.
+
+        ``admit`` is awaited only when this call starts a new build (joining
+        one is free); it returns a function that is called once the build
+        finishes, and may raise to refuse the build.
+        """
+        flight = self._flights.get(group)
+        if flight is None or (supersede and flight.key != key):
+            release = await admit() if admit is not None else None
+            # Someone else may have started the build while we were admitted
+            flight = self._flights.get(group)
+            if flight is None or (supersede and flight.key != key):
+                flight = self._start(group, key, build, commit, supersede)
+                if release is not None:
+                    flight.task.add_done_callback(lambda task: release())
+            elif release is not None:
+                release()
+        return await self._wait(flight, is_disconnected)
+
+    def _start(
+        self,
+        group: str,
+        key: str,
+        build: Callable[[Flight], Any],
+        commit: Callable[[Any], None] | None,
+        supersede: bool = False,
+    ) -> Flight:
+        previous = self._flights.get(group)
+        flight = Flight(group, key, supersede)
+        self._flights[group] = flight
+        if previous is not None:
+            previous.replaced_by = flight
+            previous.cancel.cancel()
+        flight.task = asyncio.create_task(self._execute(flight, build, commit))
+        # Abandoned builds may finish with nobody awaiting them
+        flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return flight
+
+    async def _execute(
+        self,
+        flight: Flight,
+        build: Callable[[Flight], Any],
+        commit: Callable[[Any], None] | None,
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        shared = self.state is not None and self.state.shared
+        heartbeat = relay = None
+        try:
+            if shared:
+                result = await self._coordinate(flight)
+                if result is not _BUILD:
+                    return result
+                heartbeat = asyncio.create_task(self._heartbeat(flight))
+                relay = asyncio.create_task(self._relay_events(flight))
+            result = await loop.run_in_executor(None, build, flight)
+            flight.cancel.raise_if_cancelled()
+            if commit is not None and self._flights.get(flight.group) is flight:
+                await loop.run_in_executor(None, commit, result)
+                if shared:
+                    await asyncio.to_thread(self._publish, flight, result)
+            return result
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+                flight.finished.set()
+                await relay
+                await asyncio.to_thread(
+                    self.state.release, self._lease(flight.group), self._holder(flight)
+                )
+            if self._flights.get(flight.group) is flight:
+                del self._flights[flight.group]
+
+    def _abandon(self, flight: Flight) -> None:
+        """Cancel ``flight`` if nobody is waiting for it any more."""
+        if flight.waiters == 0 and not flight.task.done():
+            if self._flights.get(flight.group) is flight:
+                del self._flights[flight.group]
+            flight.cancel.cancel()
+
+    async def _wait(
+        self,
+        flight: Flight,
+        is_disconnected: Callable[[], Awaitable[bool]] | None,
+    ) -> Any:
+        while True:
+            flight.waiters += 1
+            try:
+                result = await self._result(flight, is_disconnected)
+            except Exception:
+                # Leaving early (client gone) or a genuine failure: propagate.
+                # A build that failed because it was superseded: follow it.
+                if flight.replaced_by is None or not flight.task.done():
+                    raise
+            finally:
+                flight.waiters -= 1
+                if not flight.task.done():
+                    self._abandon(flight)
+            if flight.replaced_by is None:
+                return result
+            flight = flight.replaced_by
+
+    async def _result(
+        self,
+        flight: Flight,
+        is_disconnected: Callable[[], Awaitable[bool]] | None,
+    ) -> Any:
+        if is_disconnected is None:
+            return await asyncio.shield(flight.task)
+        while True:
+            done, _ = await asyncio.wait({flight.task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return flight.task.result()
+            if await is_disconnected():
+                raise GenerationCancelled()
+
+    # ------------------------------------------------------------------
+    # Cross-process coordination
+    # ------------------------------------------------------------------
+
+    def _encode(self, value: Any) -> Any:
+        if isinstance(value, (list, tuple)):
+            items = [self._encode(item) for item in value]
+            return {"__tuple__": items} if isinstance(value, tuple) else items
+        if isinstance(value, dict):
+            return {"__dict__": {key: self._encode(item) for key, item in value.items()}}
+        name = type(value).__name__
+        if self.models.get(name) is type(value):
+            return {"__model__": name, "data": value.model_dump()}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        raise TypeError(f"Cannot publish a {name} result; register its model")
+
+    def _decode(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._decode(item) for item in value]
+        if isinstance(value, dict):
+            if "__tuple__" in value:
+                return tuple(self._decode(item) for item in value["__tuple__"])
+            if "__dict__" in value:
+                return {key: self._decode(item) for key, item in value["__dict__"].items()}
+            model = self.models.get(value.get("__model__"))
+            if model is None:
+                raise ValueError(f"Unknown published model: {value.get('__model__')!r}")
+            return model.model_validate(value["data"])
+        return value
+
+    def _publish(self, flight: Flight, result: Any) -> None:
+        value = {"published_at": time.time(), "result": self._encode(result)}
+        self.state.set(
+            self._result_key(flight.group, flight.key),
+            json.dumps(value).encode(),
+            RESULT_TTL,
+        )
+
+    def _load(self, group: str, key: str) -> Optional[tuple]:
+        """The (publication time, result) published for ``key``, if any."""
+        value = self.state.get(self._result_key(group, key))
+        if value is None:
+            return None
+        published = json.loads(value)
+        return published["published_at"], self._decode(published["result"])
+
+    @staticmethod
+    def _lease(group: str) -> str:
+        return f"flight:{group}"
+
+    @staticmethod
+    def _result_key(group: str, key: str) -> str:
+        return f"flight-result:{group}:{key}"
+
+    @staticmethod
+    def _holder(flight: Flight) -> str:
+        return f"{flight.id}|{flight.key}"
+
+    async def _published(self, flight: Flight, key: str) -> Any:
+        """The result another process built for ``key`` since ``flight`` started."""
+        published = await asyncio.to_thread(self._load, flight.group, key)
+        if published is None:
+            return _BUILD
+        published_at, result = published
+        # An older gallery for the same key is not an answer to a new request
+        return result if published_at >= flight.created else _BUILD
+
+    async def _coordinate(self, flight: Flight) -> Any:
+        """Wait until this process may build ``flight`` (returns ``_BUILD``
+        holding the group's lease), or return the result another process
+        built for it."""
+        lease = self._lease(flight.group)
+        waiting_for: Optional[str] = None
+        # The other process's build whose events are relayed to local subscribers
+        relaying, relayed = None, 0
+        while True:
+            flight.cancel.raise_if_cancelled()
+            holder = await asyncio.to_thread(
+                self.state.acquire, lease, self._holder(flight), LEASE_TTL
+            )
+            if holder is None:
+                # Lease is ours, but the build we want (or were waiting on)
+                # may have just finished elsewhere
+                for key in {flight.key, waiting_for} - {None}:
+                    result = await self._published(flight, key)
+                    if result is not _BUILD:
+                        await asyncio.to_thread(
+                            self.state.release, lease, self._holder(flight)
+                        )
+                        return result
+                return _BUILD
+
+            owner, key = holder.split("|", 1)
+            if flight.supersede and key != flight.key:
+                # Replace the other worker's build: ask it to stop
+                await asyncio.to_thread(
+                    self.state.set, f"flight-cancel:{owner}", b"1", LEASE_TTL
+                )
+            else:
+                waiting_for = key
+                if owner != relaying:
+                    if relayed:
+                        flight._publish({"type": "restart"})
+                    relaying, relayed = owner, 0
+                events, relayed, _ = await self._read_events(owner, relayed)
+                for event in events:
+                    flight._publish(event)
+                result = await self._published(flight, key)
+                if result is not _BUILD:
+                    return result
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+    async def _heartbeat(self, flight: Flight) -> None:
+        """Keep the lease alive while building; stop if another worker superseded us."""
+        lease = self._lease(flight.group)
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(SUPERSEDE_POLL_INTERVAL)
+            if time.monotonic() - renewed_at >= LEASE_TTL / 3:
+                renewed_at = time.monotonic()
+                if not await asyncio.to_thread(
+                    self.state.renew, lease, self._holder(flight), LEASE_TTL
+                ):
+                    # The lease expired and another worker took over
+                    flight.cancel.cancel()
+                    return
+            if await asyncio.to_thread(self.state.get, f"flight-cancel:{flight.id}"):
+                flight.superseded = True
+                flight.cancel.cancel()
+                return
+
+    @staticmethod
+    def _events_key(flight_id: str) -> str:
+        return f"flight-events:{flight_id}"
+
+    async def _relay_events(self, flight: Flight) -> None:
+        """Copy ``flight``'s events to the shared state until it is finished,
+        then mark it done (and whether it was superseded)."""
+        sent = 0
+        while True:
+            try:
+                await asyncio.wait_for(flight.finished.wait(), EVENTS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            batch: Dict[str, Any] = {"events": flight.events[sent:]}
+            if flight.finished.is_set():
+                batch["done"] = True
+                batch["superseded"] = flight.superseded or flight.replaced_by is not None
+            elif not batch["events"]:
+                continue
+            sent += len(batch["events"])
+            await asyncio.to_thread(
+                self.state.append,
+                self._events_key(flight.id),
+                json.dumps(batch).encode(),
+                RESULT_TTL,
+            )
+            if batch.get("done"):
+                return
+
+    async def _read_events(self, owner: str, start: int) -> tuple:
+        """Events flight ``owner`` relayed from batch ``start`` on: (events,
+        next batch, its final batch or None while it is running)."""
+        batches = await asyncio.to_thread(self.state.read, self._events_key(owner), start)
+        events, done = [], None
+        for batch in map(json.loads, batches):
+            events.extend(batch["events"])
+            if batch.get("done"):
+                done = batch
+        return events, start + len(batches), done
+
+    async def building(self, group: str) -> bool:
+        """Whether a build for ``group`` runs in another process."""
+        if self.state is None or not self.state.shared:
+            return False
+        return await asyncio.to_thread(self.state.holder, self._lease(group)) is not None
+
+    async def follow(self, group: str) -> AsyncIterator[dict]:
+        """Like ``Flight.subscribe`` for the build of ``group`` running in
+        another process, including the builds superseding it (announced with
+        a ``restart`` event)."""
+        lease = self._lease(group)
+        holder = await asyncio.to_thread(self.state.holder, lease)
+        while holder is not None:
+            owner = holder.split("|", 1)[0]
+            start, done = 0, None
+            while done is None:
+                events, start, done = await self._read_events(owner, start)
+                for event in events:
+                    yield event
+                if done is None:
+                    if await asyncio.to_thread(self.state.holder, lease) != holder:
+                        # Gone without a final batch (the worker died)
+                        events, start, done = await self._read_events(owner, start)
+                        for event in events:
+                            yield event
+                        done = done or {"superseded": False}
+                    else:
+                        await asyncio.sleep(SHARED_POLL_INTERVAL)
+            if not done.get("superseded"):
+                return
+            # Wait for the superseding build to take over the lease
+            deadline = time.monotonic() + SUCCESSOR_WAIT
+            successor = await asyncio.to_thread(self.state.holder, lease)
+            while successor in (None, holder) and time.monotonic() < deadline:
+                await asyncio.sleep(SHARED_POLL_INTERVAL)
+                successor = await asyncio.to_thread(self.state.holder, lease)
+            if successor in (None, holder):
+                return
+            yield {"type": "restart"}
+            holder = successor
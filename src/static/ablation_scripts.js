@@ -19,6 +19,15 @@
     return originalFetch(resource, init);
   };
 
+  // Same for the progress stream opened by scripts.js
+  const OriginalEventSource = window.EventSource;
+  window.EventSource = function (url, config) {
+    if (typeof url === "string" && url.startsWith("/api/generation/")) {
+      url = url.replace("/api/generation/", "/api/ablation/");
+    }
+    return new OriginalEventSource(url, config);
+  };
+
   // Attach Done button handler
   document.addEventListener("DOMContentLoaded", () => {
     const doneButton = document.getElementById("doneButton");
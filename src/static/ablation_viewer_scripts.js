@@ -22,7 +22,22 @@ async function loadHistory() {
   }
   historyData = await res.json();
   return historyData;
-} 
+}
+
+// The current entry. Archived entries are only summarized in the history, so
+// the first time one is shown it is fetched on its own.
+async function currentEntry() {
+  if (historyData.length === 0) await loadHistory();
+  const index = currentIndex;
+  if (historyData[index].archived) {
+    const res = await originalFetch(`/api/ablation/${ablationId}/history/${index}`);
+    if (!res.ok) {
+      throw new Error("Failed to fetch ablation history entry");
+    }
+    historyData[index] = await res.json();
+  }
+  return historyData[index];
+}
 
 // Keep reference to original fetch *after* binding.
 const originalFetch = window.fetch.bind(window);
@@ -33,11 +48,7 @@ const originalFetch = window.fetch.bind(window);
 // ------------------------------------------------------------------
 window.fetch = async function (resource, init) {
   if (typeof resource === "string" && resource.startsWith("/api/generation/")) {
-    // Ensure history is loaded before first intercept
-    if (historyData.length === 0) {
-      await loadHistory();
-    }
-    const entry = historyData[currentIndex];
+    const entry = await currentEntry();
     const responseBody = JSON.stringify({
       design_space: entry.design_space,
       generations: entry.generations,
@@ -64,8 +75,7 @@ function updateHeader(entry) {
 }
 
 async function renderCurrent() {
-  if (historyData.length === 0) await loadHistory();
-  const entry = historyData[currentIndex];
+  const entry = await currentEntry();
   console.log("entry", entry);
 
   // scripts.js expects these globals
@@ -134,8 +134,82 @@ function renderPrompt(prompt, container) {
   container.appendChild(promptOverlay);
 }
 
+// ------------------------------------------------------------------
+// Previews: cells generated at low quality are refined when the user
+// hovers or selects them, or when they stay on screen for a moment
+// ------------------------------------------------------------------
+
+const REFINE_VISIBLE_DELAY = 1500;
+const refining = new Set();
+let previewObserver = null;
+
+async function refineGeneration(index) {
+  const generation = generations[index];
+  if (!generation?.preview || refining.has(generation)) return;
+  refining.add(generation);
+
+  try {
+    const response = await fetch(`/api/generation/${sessionId}/refine`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ index }),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const refined = await response.json();
+
+    // The gallery may have been regenerated while we were waiting
+    if (generations[index] !== generation) return;
+    generations[index] = refined;
+
+    const previewDiv = document.getElementById(`preview-${index}`);
+    if (!previewDiv) return;
+    // A fresh node drops the listeners renderTags attached to the old one
+    const freshDiv = previewDiv.cloneNode(false);
+    previewDiv.replaceWith(freshDiv);
+    render(freshDiv, refined.content);
+    renderPrompt(refined.prompt, freshDiv);
+    renderTags(refined.tags, freshDiv);
+  } catch (error) {
+    console.error("Failed to refine preview:", error);
+  } finally {
+    refining.delete(generation);
+  }
+}
+
+function watchPreview(item, index) {
+  item.addEventListener("mouseenter", () => refineGeneration(index));
+  item.addEventListener("click", () => refineGeneration(index));
+
+  if (!previewObserver) {
+    previewObserver = new IntersectionObserver(
+      (entries) => {
+        entries.forEach((entry) => {
+          const target = entry.target;
+          clearTimeout(target.refineTimer);
+          if (entry.isIntersecting) {
+            target.refineTimer = setTimeout(
+              () => refineGeneration(Number(target.dataset.index)),
+              REFINE_VISIBLE_DELAY
+            );
+          }
+        });
+      },
+      { threshold: 0.5 }
+    );
+  }
+  item.dataset.index = index;
+  previewObserver.observe(item);
+}
+
 function renderGrid() {
   console.log("Rendering files");
+  if (previewObserver) {
+    previewObserver.disconnect();
+  }
   const grid = document.getElementById("mainGrid");
   grid.innerHTML = "";
 
@@ -177,6 +251,9 @@ function renderGrid() {
     render(previewDiv, content);
     renderPrompt(generation.prompt, previewDiv);
     renderTags(generation.tags, previewDiv);
+    if (generation.preview) {
+      watchPreview(item, index);
+    }
 
     // Animate in with a delay based on index
     if (isFirstRender) {
@@ -188,6 +265,81 @@ function renderGrid() {
   });
 }
 
+// ------------------------------------------------------------------
+// Streaming: fill cells in as the server produces them
+// ------------------------------------------------------------------
+
+let generationStream = null;
+
+function closeGenerationStream() {
+  if (generationStream) {
+    generationStream.close();
+    generationStream = null;
+  }
+}
+
+function streamingPreview(slot) {
+  const grid = document.getElementById("mainGrid");
+  if (!grid.dataset.streaming) {
+    grid.innerHTML = "";
+    grid.dataset.streaming = "true";
+    grid.className = "col-span-3 grid grid-cols-3 gap-6 items-start";
+  }
+
+  let previewDiv = document.getElementById(`stream-preview-${slot}`);
+  if (!previewDiv) {
+    const item = document.createElement("div");
+    item.className =
+      "bg-white rounded-3xl shadow-md transition-all relative overflow-hidden aspect-square group";
+    item.style.order = slot;
+    previewDiv = document.createElement("div");
+    previewDiv.className =
+      "main-preview w-full h-full max-h-full flex flex-col items-center justify-center relative";
+    previewDiv.id = `stream-preview-${slot}`;
+    item.appendChild(previewDiv);
+    grid.appendChild(item);
+  }
+  return previewDiv;
+}
+
+function handleGenerationEvent(event) {
+  if (event.type === "restart") {
+    delete document.getElementById("mainGrid").dataset.streaming;
+    renderGrid();
+  } else if (event.type === "reset") {
+    // The model failed over mid-stream; the slot's content starts again
+    streamingPreview(event.slot).innerHTML = "";
+  } else if (event.type === "delta") {
+    // Only domains that stream content send deltas; their render appends
+    render(streamingPreview(event.slot), event.delta);
+  } else if (event.type === "cell") {
+    const previewDiv = streamingPreview(event.slot);
+    previewDiv.innerHTML = "";
+    render(previewDiv, event.example.content);
+    renderPrompt(event.example.prompt, previewDiv);
+    renderTags(event.example.tags, previewDiv);
+  } else if (event.type === "done") {
+    closeGenerationStream();
+  }
+}
+
+// ``pending``: a request that builds was just sent, so the server waits for
+// its build to start instead of answering right away that there is none
+function streamGeneration(pending = false) {
+  closeGenerationStream();
+  generationStream = new EventSource(
+    `/api/generation/${sessionId}/events${pending ? "?pending=1" : ""}`
+  );
+  generationStream.onmessage = (message) => handleGenerationEvent(JSON.parse(message.data));
+  // Don't let EventSource reconnect on its own; the full response follows anyway
+  generationStream.onerror = closeGenerationStream;
+}
+
+function finishStreaming() {
+  closeGenerationStream();
+  delete document.getElementById("mainGrid").dataset.streaming;
+}
+
 async function updateDesignSpace(dimension, value, status) {
   const axis = designSpace.axes.find((axis) => axis.name === dimension);
   if (axis) {
@@ -198,25 +350,19 @@ async function updateDesignSpace(dimension, value, status) {
   renderDesignSpace();
 }
 
-let icons = {};
-async function fetchDesignSpaceIcons() {
-  const iconUrls = {
-    exploring: "https://unpkg.com/lucide-static@latest/icons/telescope.svg",
-    unconstrained: "https://unpkg.com/lucide-static@latest/icons/dices.svg",
-    constrained: "https://unpkg.com/lucide-static@latest/icons/lock.svg",
-    new: "https://unpkg.com/lucide-static@latest/icons/plus.svg",
-    delete: "https://unpkg.com/lucide-static@latest/icons/trash-2.svg",
-    loading: "https://unpkg.com/lucide-static@0.511.0/icons/loader-circle.svg",
-  };
-
-  await Promise.all(
-    Object.entries(iconUrls).map(async ([key, url]) => {
-      const response = await fetch(url);
-      icons[key] = await response.text();
-    })
-  );
+// Icons are symbols of the inline SVG sprite rendered into the page (assets.py)
+function spriteIcon(name) {
+  return `<svg xmlns="http://www.w3.org/2000/svg" class="lucide lucide-${name}" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><use href="#icon-${name}"></use></svg>`;
 }
-fetchDesignSpaceIcons();
+
+const icons = {
+  exploring: spriteIcon("telescope"),
+  unconstrained: spriteIcon("dices"),
+  constrained: spriteIcon("lock"),
+  new: spriteIcon("plus"),
+  delete: spriteIcon("trash-2"),
+  loading: spriteIcon("loader-circle"),
+};
 
 function createDesignAxisControls(axis, status) {
   const container = document.createElement("div");
@@ -386,10 +532,6 @@ async function renderDesignSpace() {
     designSpaceContainer.className = "p-0 space-y-3 mt-4";
   }
 
-  if (isFirstRender) {
-    await fetchDesignSpaceIcons();
-  }
-
   const grouped = {
     exploring: [],
     constrained: [],
@@ -503,7 +645,7 @@ async function regenerate() {
 
 
   try {
-    const response = await fetch(`/api/generation/${sessionId}/regenerate`, {
+    const request = fetch(`/api/generation/${sessionId}/regenerate`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -512,6 +654,9 @@ async function regenerate() {
         design_space: designSpace?.model_dump?.() || designSpace,
       }),
     });
+    streamGeneration(true);
+    const response = await request;
+    finishStreaming();
 
     if (!response.ok) {
       if (response.status === 422) {
@@ -531,6 +676,7 @@ async function regenerate() {
     }
     renderGrid();
   } catch (error) {
+    finishStreaming();
     console.error("Error:", error);
     showStatus(error.message || "Failed to regenerate designs", "error");
   }
@@ -555,9 +701,12 @@ document.addEventListener("DOMContentLoaded", async () => {
   renderGrid();
 
   try {
-    const response = await fetch(`/api/generation/${sessionId}`, {
+    const request = fetch(`/api/generation/${sessionId}`, {
       method: "GET",
     });
+    streamGeneration();
+    const response = await request;
+    finishStreaming();
 
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
@@ -576,6 +725,7 @@ document.addEventListener("DOMContentLoaded", async () => {
       initialExploringAxis = exploringAxisObj ? exploringAxisObj.name : null;
     }
   } catch (error) {
+    finishStreaming();
     console.error("Error:", error);
     showStatus("Failed to load generation", "error");
   }
@@ -1,22 +1,17 @@
 var selectedDomain = null;
 var domains = [];
 
-let icons = {};
-async function fetchIcons() {
-  const iconUrls = {
-    image: "https://unpkg.com/lucide-static@latest/icons/image.svg",
-    text: "https://unpkg.com/lucide-static@latest/icons/text-cursor.svg",
-    ui: "https://unpkg.com/lucide-static@latest/icons/code-xml.svg",
-  };
-
-  await Promise.all(
-    Object.entries(iconUrls).map(async ([key, url]) => {
-      const response = await fetch(url);
-      icons[key] = await response.text();
-    })
-  );
+// Icons are symbols of the inline SVG sprite rendered into the page (assets.py)
+function spriteIcon(name) {
+  return `<svg xmlns="http://www.w3.org/2000/svg" class="lucide lucide-${name}" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><use href="#icon-${name}"></use></svg>`;
 }
 
+const icons = {
+  image: spriteIcon("image"),
+  text: spriteIcon("text-cursor"),
+  ui: spriteIcon("code-xml"),
+};
+
 function renderDomains() {
   const domainContainer = document.getElementById("domains");
   domainContainer.innerHTML = "";
@@ -85,7 +80,6 @@ async function startGeneration(concept) {
 }
 
 document.addEventListener("DOMContentLoaded", async () => {
-  await fetchIcons();
   fetch("/api/domains")
     .then((res) => res.json())
     .then((data) => {
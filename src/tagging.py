@@ -0,0 +1,155 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from cancellation import CancelToken
+from designspace import Tag
+from models.llms import llm_call, text_model
+from models.prompts import extract_tags_batch_prompt
+
+TAG_CACHE_SIZE = 2048
+
+# Extracted tags keyed by (expanded prompt, tagged axes)
+_tag_cache: "OrderedDict[str, List[Tag]]" = OrderedDict()
+_tag_cache_lock = threading.Lock()
+
+
+def _cache_key(prompt: str, axes: List[str]) -> str:
+    return hashlib.sha256(("\n".join(axes) + "\n\n" + prompt).encode()).hexdigest()
+
+
+def _cache_get(key: str) -> List[Tag] | None:
+    with _tag_cache_lock:
+        tags = _tag_cache.get(key)
+        if tags is not None:
+            _tag_cache.move_to_end(key)
+        return tags
+
+
+def _cache_put(key: str, tags: List[Tag]) -> None:
+    with _tag_cache_lock:
+        _tag_cache[key] = tags
+        _tag_cache.move_to_end(key)
+        while len(_tag_cache) > TAG_CACHE_SIZE:
+            _tag_cache.popitem(last=False)
+
+
+def extract_tags_batch(
+    prompts: Dict[int, str],
+    axes: List[str],
+    model: str = text_model,
+    cancel: CancelToken | None = None,
+) -> Dict[int, List[Tag]]:
+    """Tag every prompt along every axis in ``axes`` with a single LLM call.
+
+    Prompts that were tagged before are served from the cache and left out
+    of the request.
+    """
+    tags: Dict[int, List[Tag]] = {}
+    uncached: Dict[int, str] = {}
+    for slot, prompt in prompts.items():
+        cached = _cache_get(_cache_key(prompt, axes))
+        if cached is not None:
+            tags[slot] = [tag.model_copy() for tag in cached]
+        else:
+            uncached[slot] = prompt
+
+    if not uncached:
+        return tags
+
+    examples = "\n".join(
+        f'<example index="{slot}">\n{prompt}\n</example>'
+        for slot, prompt in uncached.items()
+    )
+    response = llm_call(
+        extract_tags_batch_prompt.format(
+            n=len(uncached), examples=examples, axes="\n".join(axes)
+        ),
+        model=model,
+        cancel=cancel,
+        stage="tags",
+    )
+
+    for match in re.finditer(
+        r'<example index="(\d+)">(.*?)</example>', response, re.DOTALL
+    ):
+        slot = int(match.group(1))
+        if slot not in uncached:
+            continue
+        example_tags = [
+            Tag(dimension=dimension.strip(), value=value.strip().lower())
+            for dimension, value in re.findall(
+                r'<tag dimension="([^"]+)">(.*?)</tag>', match.group(2), re.DOTALL
+            )
+            if dimension.strip() in axes
+        ]
+        tags[slot] = example_tags
+        _cache_put(_cache_key(uncached[slot], axes), example_tags)
+
+    return tags
+
+
+class TagBatcher:
+    """Collects the expanded prompts of one gallery and tags them in one call.
+
+    Each generation worker reports its expanded prompt with ``submit`` as soon
+    as it has one, and calls ``done`` when it finishes (successfully or not).
+    Once every slot has reported, the batched tagging call is started in a
+    background thread, so it overlaps with the remaining content generation
+    instead of adding a round-trip after it.
+    """
+
+    def __init__(
+        self,
+        n: int,
+        axes: List[str],
+        model: str = text_model,
+        cancel: CancelToken | None = None,
+    ):
+        self.axes = axes
+        self.model = model
+        self.cancel = cancel
+        self._pending = set(range(n))
+        self._prompts: Dict[int, str] = {}
+        self._tags: Dict[int, List[Tag]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        if not self._pending:
+            self._start()
+
+    def submit(self, slot: int, prompt: str) -> None:
+        with self._lock:
+            self._prompts[slot] = prompt
+        self.done(slot)
+
+    def done(self, slot: int) -> None:
+        with self._lock:
+            if slot not in self._pending:
+                return
+            self._pending.discard(slot)
+            ready = not self._pending
+        if ready:
+            self._start()
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        if not self._prompts or not self.axes:
+            return
+        try:
+            self._tags = extract_tags_batch(
+                self._prompts, self.axes, model=self.model, cancel=self.cancel
+            )
+        except Exception as e:
+            # Tags are an enrichment; a failed call must not fail the gallery
+            print(f"Batched tag extraction failed: {e}")
+
+    def results(self, timeout: float | None = None) -> Dict[int, List[Tag]]:
+        """Wait for the batched call and return the extracted tags per slot."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self._tags
@@ -0,0 +1,21 @@
+// Build-time Tailwind config (see assets.py). The theme lives in
+// static/tailwind.config.js, which the browser runtime also uses for
+// generated UI content, so it is evaluated here rather than duplicated.
+const fs = require("fs");
+const path = require("path");
+const vm = require("vm");
+
+const runtime = { tailwind: {} };
+vm.runInNewContext(
+  fs.readFileSync(path.join(__dirname, "static", "tailwind.config.js"), "utf8"),
+  runtime
+);
+
+module.exports = {
+  ...runtime.tailwind.config,
+  content: [
+    path.join(__dirname, "templates", "**", "*.html"),
+    path.join(__dirname, "static", "*.js"),
+    path.join(__dirname, "domains", "**", "*.js"),
+  ],
+};
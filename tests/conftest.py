@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app's modules are imported flat from src/, as the server does
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
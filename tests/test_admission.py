@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from admission import BATCH, INTERACTIVE, AdmissionController, AdmissionRejected
+from sharedstate import MemoryState
+
+
+async def settle():
+    # Let released slots be handed on
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_client_cap_queues_until_a_build_finishes():
+    async def scenario():
+        admission = AdmissionController(max_builds=8, max_builds_per_client=2)
+        first = await admission.acquire("a")
+        await admission.acquire("a")
+        queued = asyncio.create_task(admission.acquire("a"))
+        await settle()
+        assert not queued.done()
+        # Other clients are not held up by a busy one
+        await admission.acquire("b")
+        first()
+        return await asyncio.wait_for(queued, 1)
+
+    assert callable(asyncio.run(scenario()))
+
+
+def test_limits_hold_across_workers_sharing_state():
+    async def scenario():
+        state = MemoryState()
+        worker_a = AdmissionController(max_builds=2, interactive_reserve=0, state=state)
+        worker_b = AdmissionController(max_builds=2, interactive_reserve=0, state=state)
+        release = await worker_a.acquire("a")
+        await worker_b.acquire("b")
+        queued = asyncio.create_task(worker_b.acquire("c"))
+        await settle()
+        assert not queued.done()
+        # A slot freed by one worker is taken by the other's queued request
+        release()
+        return await asyncio.wait_for(queued, 2)
+
+    assert callable(asyncio.run(scenario()))
+
+
+def test_batch_requests_leave_reserved_slots_to_interactive_ones():
+    async def scenario():
+        admission = AdmissionController(
+            max_builds=3, max_builds_per_client=3, interactive_reserve=1, max_wait=0.1
+        )
+        await admission.acquire("a", BATCH)
+        await admission.acquire("b", BATCH)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("c", BATCH)
+        assert rejected.value.reason == "timeout"
+        await admission.acquire("d", INTERACTIVE)
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active_by_priority"] == {"interactive": 1, "batch": 2}
+    assert stats["rejected"] == {"timeout": 1}
+
+
+def test_queued_interactive_requests_are_admitted_first():
+    async def scenario():
+        admission = AdmissionController(max_builds=1, interactive_reserve=0)
+        release = await admission.acquire("a")
+        order = []
+
+        async def wait(client, priority):
+            done = await admission.acquire(client, priority)
+            order.append(client)
+            done()
+
+        batch = asyncio.create_task(wait("batch", BATCH))
+        await settle()
+        interactive = asyncio.create_task(wait("interactive", INTERACTIVE))
+        await settle()
+        release()
+        await asyncio.wait_for(asyncio.gather(batch, interactive), 2)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "batch"]
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def scenario():
+        admission = AdmissionController(max_builds=1, max_queue=1, interactive_reserve=0)
+        await admission.acquire("a")
+        queued = asyncio.create_task(admission.acquire("b"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("c")
+        queued.cancel()
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after >= 1
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import codec
+import designhistory
+from archive import ColdArchive, Compactor
+from objectstore import ObjectStore
+
+
+class FakeDatabase:
+    """Just enough of db.Database for the compactor: nested dicts by path."""
+
+    def __init__(self, records):
+        self.records = records
+
+    def _parent(self, key):
+        *path, last = key.split("/")
+        node = self.records
+        for part in path:
+            node = node[int(part)] if isinstance(node, list) else node[part]
+        return node, int(last) if isinstance(node, list) else last
+
+    def set(self, key, value):
+        node, last = self._parent(key)
+        node[last] = value
+
+    def delete(self, key):
+        node, last = self._parent(key)
+        del node[last]
+
+
+def space(value):
+    return {"concept": "chair", "domain": "image", "axes": [{"name": "color", "value": value}]}
+
+
+def history(n):
+    steps = []
+    for i in range(n):
+        steps.append(
+            {
+                **designhistory.encode(steps, space(f"c{i}")),
+                **codec.encode_examples([{"content": f"example {i}"}]),
+                "timestamp": f"t{i}",
+            }
+        )
+    return steps
+
+
+def compacted(tmp_path, n=6, keep=2):
+    steps = history(n)
+    record = {"id": "a1", "history": steps}
+    database = FakeDatabase({"ablations": {"a1": record}})
+    archive = ColdArchive(ObjectStore(str(tmp_path / "objects")))
+    Compactor(database, archive=archive, keep=keep).compact_record("ablations", record)
+    return record["history"], archive
+
+
+def test_archived_steps_load_one_at_a_time(tmp_path):
+    steps, archive = compacted(tmp_path)
+
+    assert [bool(step.get("archived")) for step in steps] == [True] * 4 + [False] * 2
+    # A delta-encoded step is archived whole, so it loads without its base
+    step = archive.rehydrate("ablations", "a1", steps, [3])[3]
+    assert json.loads(step[designhistory.KEYFRAME]) == space("c3")
+    assert codec.step_examples(step) == [{"content": "example 3"}]
+    # The others stay stubs
+    assert archive.rehydrate("ablations", "a1", steps, [3])[2]["archived"]
+    # The hot steps still reconstruct without the archive
+    spaces = designhistory.design_spaces(steps)
+    assert spaces[-2:] == [space("c4"), space("c5")]
+
+
+def test_compactor_refuses_a_store_that_is_not_durable(tmp_path):
+    archive = ColdArchive(ObjectStore(str(tmp_path / "objects")))
+    compactor = Compactor(FakeDatabase({}), archive=archive)
+    with pytest.raises(RuntimeError):
+        compactor.run_once()
@@ -0,0 +1,58 @@
+import shutil
+import threading
+from io import BytesIO
+
+from blobstore import BlobStore
+from domains.imagegen.ingest import ingest_image, variant_file
+from objectstore import ObjectStore
+
+
+def png() -> bytes:
+    from PIL import Image
+
+    out = BytesIO()
+    Image.new("RGB", (300, 200), "navy").save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_images_survive_losing_the_local_cache(tmp_path):
+    durable = ObjectStore(str(tmp_path / "objects"))
+    store = BlobStore(str(tmp_path / "blobs"), durable=durable)
+    data = png()
+    sha = ingest_image(data, store)[len("blob:") :]
+
+    # A redeploy starts with an empty disk
+    shutil.rmtree(store.root)
+
+    path, media_type = variant_file(sha, "original", store=store)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert media_type == "image/png"
+    # Variants are rebuilt from the original
+    path, media_type = variant_file(sha, "thumb", "image/webp", store=store)
+    assert media_type == "image/webp"
+    assert path.startswith(store.root)
+
+
+def test_unknown_blob_is_not_found(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), durable=ObjectStore(str(tmp_path / "o")))
+    assert variant_file("0" * 64, "grid", "image/webp", store=store) is None
+
+
+def test_concurrent_writes_of_the_same_blob(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), durable=None)
+    errors = []
+
+    def write():
+        try:
+            store.write("a" * 64, "grid.webp", b"x" * 100_000)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert store.read("a" * 64, "grid.webp") == b"x" * 100_000
@@ -0,0 +1,32 @@
+import json
+
+import conceptindex
+from conceptindex import ConceptIndex
+
+
+def test_workers_merge_their_entries_into_one_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(conceptindex, "RELOAD_INTERVAL", 0)
+    path = str(tmp_path / "index.json")
+    first, second = ConceptIndex(path), ConceptIndex(path)
+
+    first.add("ui", "A race car", ["speed"])
+    second.add("ui", "boat", ["sail"])
+    first.flush()
+    second.flush()
+
+    with open(path) as f:
+        assert json.load(f) == {"ui": {"race car": ["speed"], "boat": ["sail"]}}
+    # Each picks up what the other saved
+    assert first.lookup("ui", "boat") == (["sail"], 1.0)
+    assert second.lookup("ui", "race car") == (["speed"], 1.0)
+
+
+def test_add_does_not_write_on_the_calling_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(conceptindex, "SAVE_DELAY", 60)
+    path = tmp_path / "index.json"
+    index = ConceptIndex(str(path))
+
+    index.add("ui", "boat", ["sail"])
+
+    assert index.lookup("ui", "boat") == (["sail"], 1.0)
+    assert not path.exists()
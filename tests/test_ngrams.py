@@ -0,0 +1,22 @@
+from conceptindex import normalize_concept
+from ngrams import NgramVectorizer, char_ngrams, cosine, word_ngrams
+from optiondedup import normalize_option
+
+
+def test_both_normalizers_share_word_splitting():
+    assert normalize_concept("The Race-car!") == "race car"
+    assert normalize_option("Art-Deco style!") == "art deco"
+
+
+def test_char_ngrams_ignore_word_boundaries():
+    assert char_ngrams("race car") == char_ngrams("racecar")
+
+
+def test_word_ngrams_ignore_word_order():
+    assert cosine(word_ngrams("sans serif geometric"), word_ngrams("geometric sans serif")) == 1.0
+
+
+def test_vectorizer_scores_the_fitted_strings():
+    vectorizer = NgramVectorizer(["race car", "sailing boat"])
+    scores = vectorizer.similarities("racecar")
+    assert scores[0] > 0.99 > scores[1]
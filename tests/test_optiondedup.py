@@ -0,0 +1,30 @@
+from optiondedup import select_fills
+
+BASE = {
+    "palette": "warm earth tones",
+    "layout": "asymmetric grid",
+    "typeface": "geometric sans serif",
+    "imagery": "film photography",
+    "tone": "playful",
+}
+
+
+def test_designs_differing_in_one_axis_are_distinct():
+    other = {**BASE, "typeface": "humanist sans serif"}
+    fills, saved = select_fills([BASE, other], 2)
+    assert fills == [BASE, other]
+    assert saved == 0
+
+
+def test_identical_designs_are_duplicates():
+    same = {**BASE, "tone": "Playful!"}
+    fills, saved = select_fills([BASE, same, {**BASE, "tone": "serious"}], 2)
+    assert fills == [BASE, {**BASE, "tone": "serious"}]
+    assert saved == 1
+
+
+def test_extra_designs_drop_the_least_different():
+    close = {**BASE, "tone": "serious"}
+    far = {name: f"other {value}" for name, value in BASE.items()}
+    fills, _ = select_fills([BASE, close, far], 2)
+    assert fills == [BASE, far]
@@ -0,0 +1,51 @@
+import asyncio
+
+from profiling import PROFILE_ID_HEADER, ProfileMiddleware, ProfileStore, profile_for
+from sharedstate import SQLiteState
+
+
+def profiled_request(middleware):
+    """Send a profiled GET through ``middleware``; returns the response headers."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"x-profile", b"1")]}
+    asyncio.run(middleware(scope, receive, send))
+    return dict(sent[0]["headers"])
+
+
+def test_request_profiles_can_be_downloaded_from_another_worker(tmp_path):
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    state = SQLiteState(str(tmp_path / "state.sqlite"))
+    here, elsewhere = ProfileStore(state), ProfileStore(SQLiteState(state.path))
+    middleware = ProfileMiddleware(app, lambda headers: True, store=here)
+
+    headers = profiled_request(middleware)
+    profile_id = headers[PROFILE_ID_HEADER.lower().encode()].decode()
+
+    profile = asyncio.run(elsewhere.get(profile_id))
+    assert profile is not None
+    assert profile.name == "GET /"
+    assert profile.speedscope()["profiles"]
+
+
+def test_profiled_request_can_ask_for_an_on_demand_profile(tmp_path):
+    async def app(scope, receive, send):
+        # Waits for the profile lock the middleware already holds
+        await asyncio.wait_for(profile_for(0.01), timeout=1)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    store = ProfileStore(SQLiteState(str(tmp_path / "state.sqlite")))
+    middleware = ProfileMiddleware(app, lambda headers: True, store=store)
+
+    assert PROFILE_ID_HEADER.lower().encode() in profiled_request(middleware)
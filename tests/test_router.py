@@ -0,0 +1,49 @@
+import pytest
+
+from models.router import Candidate, ModelRouter
+
+FAST = Candidate(provider="fast", model="m")
+SLOW = Candidate(provider="slow", model="m")
+
+
+def test_stats_are_kept_per_stage():
+    router = ModelRouter({"tags": [FAST], "ui": [FAST, SLOW]})
+
+    def fail_ui(candidate):
+        raise RuntimeError("timeout")
+
+    for _ in range(3):
+        router.call("tags", lambda candidate: "ok")
+        with pytest.raises(RuntimeError):
+            router.call("ui", fail_ui)
+
+    stats = router.stats()["candidates"]
+    assert stats["ui"]["fast/m"]["benched"]
+    # Failing at one stage doesn't bench the model for the others
+    assert not stats["tags"]["fast/m"]["benched"]
+    assert stats["tags"]["fast/m"]["error_rate"] == 0.0
+
+
+def test_failover_resets_streamed_output(monkeypatch):
+    import models.llms as llms
+
+    router = ModelRouter({"text": [FAST, SLOW]})
+    monkeypatch.setattr(llms, "router", router)
+
+    def complete(candidate, messages, cancel, on_delta, kwargs, trace=None):
+        on_delta(f"{candidate.provider} start ")
+        if candidate == FAST:
+            raise RuntimeError("stream dropped")
+        on_delta("end")
+        return f"{candidate.provider} start end"
+
+    monkeypatch.setattr(llms, "_complete", complete)
+    received = []
+    result = llms.llm_call(
+        "prompt",
+        stage="text",
+        on_delta=received.append,
+        on_reset=received.clear,
+    )
+    assert result == "slow start end"
+    assert "".join(received) == result
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from cancellation import GenerationCancelled
+from singleflight import SingleFlight
+
+
+def blocking_build(result, started=None, release=None):
+    """A build returning ``result`` once ``release`` is set (or it is cancelled)."""
+
+    def build(flight):
+        if started is not None:
+            started.set()
+        if release is not None:
+            while not release.wait(0.01):
+                flight.cancel.raise_if_cancelled()
+        flight.cancel.raise_if_cancelled()
+        return result
+
+    return build
+
+
+async def wait_for(event: threading.Event):
+    while not event.is_set():
+        await asyncio.sleep(0.01)
+
+
+def test_same_key_requests_share_one_build():
+    async def scenario():
+        flights = SingleFlight()
+        builds, commits = [], []
+        release = threading.Event()
+
+        def build(flight):
+            builds.append(flight.key)
+            release.wait(5)
+            return ("space", ["a", "b"])
+
+        first = asyncio.create_task(flights.run("session:1", "k", build, commits.append))
+        second = asyncio.create_task(flights.run("session:1", "k", build, commits.append))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await first, await second, builds, commits
+
+    first, second, builds, commits = asyncio.run(scenario())
+    assert first == second == ("space", ["a", "b"])
+    assert builds == ["k"]
+    assert commits == [("space", ["a", "b"])]
+
+
+def test_superseding_request_cancels_running_build():
+    async def scenario():
+        flights = SingleFlight()
+        commits = []
+        started, release = threading.Event(), threading.Event()
+        old = asyncio.create_task(
+            flights.run(
+                "session:1",
+                "old",
+                blocking_build(("old space", ["old"]), started, release),
+                commits.append,
+                supersede=True,
+            )
+        )
+        await wait_for(started)
+        first = flights.current("session:1")
+        new = await flights.run(
+            "session:1",
+            "new",
+            blocking_build(("new space", ["new"])),
+            commits.append,
+            supersede=True,
+        )
+        return first, await old, new, commits
+
+    first, old, new, commits = asyncio.run(scenario())
+    assert first.cancel.cancelled
+    # Waiters of the superseded build follow it to its replacement
+    assert old == new == ("new space", ["new"])
+    assert commits == [("new space", ["new"])]
+
+
+def test_joining_request_gets_running_builds_result_shape():
+    async def scenario():
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        initial = asyncio.create_task(
+            flights.run(
+                "session:1",
+                "initial",
+                blocking_build(("space", ["a"]), started, release),
+            )
+        )
+        await wait_for(started)
+        # A non-superseding request with another key joins the running build
+        joined = asyncio.create_task(
+            flights.run("session:1", "other", blocking_build(("other", ["b"])))
+        )
+        await asyncio.sleep(0.05)
+        release.set()
+        return await initial, await joined
+
+    initial, joined = asyncio.run(scenario())
+    design_space, generations = joined
+    assert (design_space, generations) == initial == ("space", ["a"])
+
+
+def test_disconnected_waiter_cancels_abandoned_build():
+    async def scenario():
+        flights = SingleFlight()
+        commits = []
+        started, release = threading.Event(), threading.Event()
+
+        async def is_disconnected():
+            return started.is_set()
+
+        with pytest.raises(GenerationCancelled):
+            await flights.run(
+                "session:1",
+                "k",
+                blocking_build(("space", []), started, release),
+                commits.append,
+                is_disconnected=is_disconnected,
+            )
+        return flights, commits
+
+    flights, commits = asyncio.run(scenario())
+    assert flights.current("session:1") is None
+    assert commits == []
+
+
+def test_admission_release_runs_once_build_finishes():
+    async def scenario():
+        flights = SingleFlight()
+        admitted, released = [], []
+
+        async def admit():
+            admitted.append(1)
+            return lambda: released.append(1)
+
+        result = await flights.run(
+            "session:1", "k", blocking_build(("space", [])), admit=admit
+        )
+        await asyncio.sleep(0)
+        return result, admitted, released
+
+    result, admitted, released = asyncio.run(scenario())
+    assert result == ("space", [])
+    assert admitted == released == [1]
+
+
+def test_published_results_round_trip_as_json():
+    from designspace import Axis, DesignSpace, Example, Tag
+
+    flights = SingleFlight(models=[DesignSpace, Example])
+    space = DesignSpace(
+        concept="poster",
+        domain="ui",
+        axes=[Axis(name="color", status="explore", value="red")],
+    )
+    example = Example(
+        prompt="a red poster",
+        content="<svg/>",
+        tags=[Tag(dimension="color", value="red")],
+    )
+    result = (space, [example])
+    encoded = json.loads(json.dumps(flights._encode(result)))
+    assert flights._decode(encoded) == result
+
+    with pytest.raises(ValueError):
+        flights._decode({"__model__": "Axis", "data": {}})
+
+
+def test_events_reach_other_workers_through_shared_state(tmp_path):
+    from sharedstate import SQLiteState
+
+    async def scenario():
+        state = SQLiteState(str(tmp_path / "state.sqlite"))
+        # Two SingleFlights on one state behave like two worker processes
+        worker_a, worker_b = SingleFlight(state), SingleFlight(state)
+        started, release = threading.Event(), threading.Event()
+
+        def build(flight):
+            flight.emit({"type": "cell", "slot": 0})
+            started.set()
+            release.wait(5)
+            flight.emit({"type": "cell", "slot": 1})
+            return ("space", ["a", "b"])
+
+        building = asyncio.create_task(
+            worker_a.run("session:1", "k", build, lambda result: None)
+        )
+        await wait_for(started)
+        while not await worker_b.building("session:1"):
+            await asyncio.sleep(0.01)
+
+        followed = []
+
+        async def follow():
+            async for event in worker_b.follow("session:1"):
+                followed.append(event)
+
+        following = asyncio.create_task(follow())
+        # A request on the other worker waits for the same build's result
+        joined = asyncio.create_task(
+            worker_b.run("session:1", "k", blocking_build(("other", [])))
+        )
+        await asyncio.sleep(0.5)
+        relayed = list(worker_b.current("session:1").events)
+        release.set()
+        result = await building
+        await following
+        return result, await joined, followed, relayed
+
+    result, joined, followed, relayed = asyncio.run(scenario())
+    assert result == joined == ("space", ["a", "b"])
+    assert followed == [{"type": "cell", "slot": 0}, {"type": "cell", "slot": 1}]
+    assert relayed == [{"type": "cell", "slot": 0}]